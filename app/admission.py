@@ -0,0 +1,171 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import AsyncIterator, Deque, Dict, Optional
+import asyncio
+import math
+import os
+
+from .metrics import Histogram, register_gauge
+from .config import (
+    ADMISSION_CONCURRENCY,
+    CHALLENGE_CONCURRENCY,
+    CHALLENGE_QUEUE_SIZE,
+    PUBLISH_CONCURRENCY,
+    PUBLISH_QUEUE_SIZE,
+    SUBMIT_QUEUE_SIZE,
+    TALLY_CONCURRENCY,
+    TALLY_QUEUE_SIZE
+)
+
+
+# Longest Retry-After sent with a 503, in seconds
+MAX_RETRY_AFTER = 60
+
+admission_wait_seconds = Histogram(
+        "ballotserver_admission_wait_seconds",
+        "Time admitted jobs spent queued before they started",
+        "job_class"
+    )
+
+
+class Overloaded(Exception):
+    """
+    Raised when a job class's queue is full. The server answers 503 with Retry-After.
+    """
+    job_class: str
+    retry_after: int
+
+    def __init__(self, job_class: str, retry_after: int):
+        super().__init__(f"Too many {job_class} requests queued, retry in {retry_after}s")
+        self.job_class = job_class
+        self.retry_after = retry_after
+
+
+class JobClass():
+    """
+    Kind of job with its own priority, concurrency limit and bounded queue.
+    """
+    name: str
+    priority: int
+    concurrency: int
+    queue_size: int
+    running: int
+    rejected: int
+    waiting: Deque[asyncio.Future]
+    service_time: float
+
+    def __init__(self, name: str, priority: int, concurrency: int, queue_size: int):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.running = 0
+        self.rejected = 0
+        self.waiting = deque()
+        # Moving average of how long a job runs, for Retry-After
+        self.service_time = 1.0
+
+
+class JobScheduler():
+    """
+    Admission control for the CPU-heavy endpoints of one process.
+
+    At most concurrency jobs run at once, and at most their class's concurrency of each class.
+    Jobs that can't start wait in their class's queue and free slots go to the waiting job of the
+    highest priority class (lowest number), first come first served within a class.
+    A job arriving at a full queue is rejected straight away rather than left to time out.
+    """
+    concurrency: int
+    running: int
+    _classes: Dict[str, JobClass]
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.running = 0
+        self._classes = dict()
+
+    def add_class(self, name: str, priority: int, concurrency: Optional[int], queue_size: int) -> None:
+        """
+        Args:
+            name: job class name used with admit()
+            priority: lower numbers are started first
+            concurrency: most jobs of the class running at once, None for the scheduler's limit
+            queue_size: most jobs of the class waiting to start
+        """
+        job_class = JobClass(name, priority, concurrency or self.concurrency, queue_size)
+        self._classes[name] = job_class
+        register_gauge(f"ballotserver_admission_queued_{name}", f"{name} jobs waiting to start", lambda: len(job_class.waiting))
+        register_gauge(f"ballotserver_admission_running_{name}", f"{name} jobs running", lambda: job_class.running)
+        register_gauge(f"ballotserver_admission_rejected_{name}", f"{name} jobs rejected with 503", lambda: job_class.rejected)
+
+    def _can_start(self, job_class: JobClass) -> bool:
+        return self.running < self.concurrency and job_class.running < job_class.concurrency
+
+    def _queued_ahead(self, job_class: JobClass) -> bool:
+        return any(other.waiting for other in self._classes.values() if other.priority <= job_class.priority)
+
+    def _start(self, job_class: JobClass) -> None:
+        self.running += 1
+        job_class.running += 1
+
+    def _finish(self, job_class: JobClass) -> None:
+        self.running -= 1
+        job_class.running -= 1
+        for next_class in sorted(self._classes.values(), key=lambda other: other.priority):
+            while next_class.waiting and self._can_start(next_class):
+                future = next_class.waiting.popleft()
+                if not future.done():
+                    self._start(next_class)
+                    future.set_result(None)
+
+    def _retry_after(self, job_class: JobClass) -> int:
+        slots = min(job_class.concurrency, self.concurrency)
+        estimate = job_class.service_time * (len(job_class.waiting) + 1) / slots
+        return min(max(math.ceil(estimate), 1), MAX_RETRY_AFTER)
+
+    @asynccontextmanager
+    async def admit(self, name: str) -> AsyncIterator[None]:
+        """
+        Run the block as a job of a class, waiting for a slot if needed.
+
+        Args:
+            name: job class name
+        Raises:
+            Overloaded if the class's queue is full
+        """
+        job_class = self._classes[name]
+        start = perf_counter()
+        if self._can_start(job_class) and not self._queued_ahead(job_class):
+            self._start(job_class)
+        else:
+            if len(job_class.waiting) >= job_class.queue_size:
+                job_class.rejected += 1
+                raise Overloaded(name, self._retry_after(job_class))
+            future = asyncio.get_event_loop().create_future()
+            job_class.waiting.append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Cancelled after being given a slot, pass it on
+                    self._finish(job_class)
+                else:
+                    job_class.waiting.remove(future)
+                raise
+        admission_wait_seconds.observe(name, perf_counter() - start)
+
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            job_class.service_time = 0.8 * job_class.service_time + 0.2 * (perf_counter() - started)
+            self._finish(job_class)
+
+
+scheduler = JobScheduler(ADMISSION_CONCURRENCY or 4 * (os.cpu_count() or 1))
+# Voters waiting on a receipt come first, challenges next, result tallies and then record exports last
+scheduler.add_class("submit", 0, None, SUBMIT_QUEUE_SIZE)
+scheduler.add_class("challenge", 1, CHALLENGE_CONCURRENCY or os.cpu_count(), CHALLENGE_QUEUE_SIZE)
+scheduler.add_class("tally", 2, TALLY_CONCURRENCY, TALLY_QUEUE_SIZE)
+scheduler.add_class("publish", 3, PUBLISH_CONCURRENCY, PUBLISH_QUEUE_SIZE)
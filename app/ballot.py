@@ -1,17 +1,22 @@
-from electionguard.ballot import PlaintextBallot
-from electionguard.group import int_to_q
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from functools import partial
+from pydantic import BaseModel, conlist
+from typing import Dict, List, Optional
 from uuid import uuid4
-import hashlib
-import json
-import os.path
+import asyncio
 
-from .election import election
-from .manifest import generate_ballot_style_contests, get_contest_info, get_selection_info
-from .config import STORAGE_DIR, RECEIVED_HASH_FILE, store_hash
+from .admission import scheduler
+from .election import Election, hosted_election
+from .idempotency import IN_FLIGHT
+from .ledger import stream_hashes
+from .manifest import generate_ballot_style_contests, get_ballot_info, get_selection_info, validate_ballot
+from .metrics import timed
+from .serialization import FastJSONRoute, canonical_hash, plaintext_ballot
+from .store import SubmissionNotDurable
+from .config import HASH_PAGE_SIZE, SUBMIT_BATCH_SIZE
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute, default_response_class=ORJSONResponse)
 
 
 class BallotInfoRequest(BaseModel):
@@ -26,6 +31,12 @@ class BallotMarkingRequest(BaseModel):
 class BallotEncryptionRequest(BaseModel):
     ballot: dict
     action: str
+    # Retries with the same key and action get the original receipt, the unenc_hash is used without a key
+    idempotency_key: Optional[str] = None
+
+
+class BallotBatchEncryptionRequest(BaseModel):
+    ballots: conlist(BallotEncryptionRequest, min_items=1, max_items=SUBMIT_BATCH_SIZE)
 
 
 class BallotChallengeRequest(BaseModel):
@@ -33,7 +44,7 @@ class BallotChallengeRequest(BaseModel):
 
 
 @router.post("/info")
-async def gen_ballot_info(ballot_info_params: BallotInfoRequest):
+async def gen_ballot_info(ballot_info_params: BallotInfoRequest, election: Election = Depends(hosted_election)):
     """
     Given a ballot style, compile and return relevant election information
     
@@ -41,91 +52,238 @@ async def gen_ballot_info(ballot_info_params: BallotInfoRequest):
         ballot_info_paramse: BallotInfoRequest containing ballot style
     Returns:
         JSON structure for ballot_style with returned from get_contest_info
+    Raises:
+        HTTPException 400 if the ballot style isn't in the manifest
     """
-    # Get base ballot info
-    ballot_info = generate_ballot_style_contests(election.manifest, ballot_info_params.ballot_style)
-
-    for contest in ballot_info["contests"]:
-        # Get contest info
-        contest_info = get_contest_info(election.manifest, contest["object_id"])
-        # Populate information
-        contest.update(contest_info)
-
-    return ballot_info
+    # Ballot info is compiled per style when the manifest is loaded
+    try:
+        return get_ballot_info(election.manifest_index, ballot_info_params.ballot_style)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/mark")
-async def mark_ballot(ballot_marking_params: BallotMarkingRequest):
+async def mark_ballot(ballot_marking_params: BallotMarkingRequest, election: Election = Depends(hosted_election)):
     """
     Mark all selections on a ballot.
 
     Args:
-        ballot_marking_params: ballot_style and voter selections
+        ballot_marking_params: ballot_style and voter selections, contest ID -> candidate ID,
+            or a list of candidate IDs for contests with several votes. Contests left out are undervoted.
     Returns:
         Marked ballot JSON returned by get_selection_info()
-
-    TODO: handle errors gracefully
-    TODO: check number of votes and weights
+    Raises:
+        HTTPException 400 if a selection isn't in its contest or a contest has too many votes
     """
-    # Get base ballot info
-    ballot = generate_ballot_style_contests(election.manifest, ballot_marking_params.ballot_style)
-
-    # Give ballot unique ID
-    ballot["object_id"] = f"ballot-{uuid4()}"
+    try:
+        # Get base ballot info
+        ballot = generate_ballot_style_contests(election.manifest_index, ballot_marking_params.ballot_style)
+
+        # Give ballot unique ID
+        ballot["object_id"] = f"ballot-{uuid4()}"
+
+        # Mark mark each selection
+        for contest in ballot["contests"]:
+            contest_id = contest["object_id"]
+            selected_candidate_ids = ballot_marking_params.selections.get(contest_id, [])
+            if isinstance(selected_candidate_ids, str):
+                selected_candidate_ids = [selected_candidate_ids]
+            contest["ballot_selections"] = [
+                get_selection_info(election.manifest_index, contest_id, candidate_id)
+                for candidate_id in selected_candidate_ids
+            ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Mark mark each selection
-    for contest in ballot["contests"]:
-        contest_id = contest["object_id"]
-        selected_candidate_id = ballot_marking_params.selections.get(contest_id)
-        selection_info = get_selection_info(election.manifest, contest_id, selected_candidate_id)
-        contest["ballot_selections"] = [selection_info]
+    error = validate_ballot(election.manifest_index, ballot)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=error)
     return ballot
 
 
+def _unencrypted_hash(ballot: dict) -> str:
+    # Canonical JSON, so a retry of the same ballot gets the same hash and receipt whatever its key order
+    return canonical_hash(ballot)
+
+
+def _receipt(submission: dict, unenc_hash: str) -> dict:
+    if "error" in submission:
+        return submission
+    return {
+        "verification_code": submission["verification_code"],
+        "timestamp": submission["timestamp"],
+        "unenc_hash": unenc_hash,
+        "enc_hash": submission["enc_hash"]
+    }
+
+
+def _idempotency_key(request: BallotEncryptionRequest, unenc_hash: str) -> str:
+    # Client keys can't collide with ballot hashes. The action is part of the key, so casting a spoiled
+    # ballot (or the reverse) isn't answered with the other action's receipt, the ballot box rejects it instead.
+    key = f"key:{request.idempotency_key}" if request.idempotency_key is not None else unenc_hash
+    return f"{request.action}:{key}"
+
+
+async def _claim_submission(election: Election, key: str) -> Optional[dict]:
+    # Wait out a concurrent submission of the same ballot, and take over its key if it failed
+    while True:
+        [receipt] = await election.claim_submissions([key])
+        if receipt != IN_FLIGHT:
+            return receipt
+        receipt = await election.wait_submission(key)
+        if receipt is not None:
+            return receipt
+
+
 @router.post("/submit")
-async def encrypt_ballot(ballot_encryption_params: BallotEncryptionRequest):
+async def encrypt_ballot(ballot_encryption_params: BallotEncryptionRequest, election: Election = Depends(hosted_election)):
     """
-    Encrypt a ballot and generate a receipt
+    Encrypt a ballot and generate a receipt.
+    A retried submission of the same ballot and action, or with the same idempotency_key and action, gets
+    the original receipt back without being encrypted or submitted again.
 
     Args:
         ballot_encryption_params: ballot JSON
     Returns:
         receipt JSON with verification code, hashes, and timestamp
+    Raises:
+        HTTPException 400 if the action isn't CAST or SPOIL, or the ballot breaks its style's rules
     """
-    # Assert that action is valid before processing ballot
-    assert ballot_encryption_params.action == "CAST" or ballot_encryption_params.action == "SPOIL"
-
-    # ballot_encryption_params.ballot is a dict, which we convert to a JSON string
-    # call .encode() on the string and feed it into sha256
-    unenc_hash = hashlib.sha256(json.dumps(ballot_encryption_params.ballot).encode()).hexdigest()
-
-    # Make and encrypt ballot object
-    ballot = PlaintextBallot.from_json_object(ballot_encryption_params.ballot)
-    encrypted_ballot = election.encryption_mediator.encrypt(ballot)
-
-    # the ballot type has a function to run it through sha256 with something prepended to it
-    # this returns an ElementModQ, a variety of BigInteger, which has .to_hex() to make a hex string
-    enc_hash = encrypted_ballot.crypto_hash_with(int_to_q(0)).to_hex()
-
-    # Cast or spoil ballot depending on action
-    if ballot_encryption_params.action == "CAST":
-        election.ballotbox.cast(encrypted_ballot)
-        store_hash(enc_hash, RECEIVED_HASH_FILE)
-    else:
-        election.ballotbox.spoil(encrypted_ballot)
+    if ballot_encryption_params.action not in ("CAST", "SPOIL"):
+        raise HTTPException(status_code=400, detail=f"Invalid action: {ballot_encryption_params.action}")
+
+    # Reject malformed and overvoted ballots before spending any encryption work on them
+    with timed("submit.validate"):
+        error = validate_ballot(election.manifest_index, ballot_encryption_params.ballot)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=f"Invalid ballot: {error}")
+
+    with timed("submit.unenc_hash"):
+        unenc_hash = _unencrypted_hash(ballot_encryption_params.ballot)
+
+    key = _idempotency_key(ballot_encryption_params, unenc_hash)
+    with timed("submit.idempotency"):
+        receipt = await _claim_submission(election, key)
+    if receipt is not None:
+        return receipt
+
+    try:
+        async with scheduler.admit("submit"):
+            # Make and encrypt ballot object, encryption runs in the election's worker pool
+            with timed("submit.plaintext_parse"):
+                ballot = plaintext_ballot(ballot_encryption_params.ballot)
+            with timed("submit.encrypt"):
+                encrypted_ballot = await election.encryption_pool.encrypt(ballot)
+
+            # Chain and cast or spoil the ballot, returns once it is durable
+            try:
+                [submission] = await election.submit_ballots([(encrypted_ballot, ballot_encryption_params.action)])
+            except SubmissionNotDurable as e:
+                # The ballot is cast or spoiled and stays queued, a retry gets its receipt instead of a rejection
+                receipt = _receipt(e.results[0], unenc_hash)
+                raise
+
+        # Return verification code and timestamp
+        receipt = _receipt(submission, unenc_hash)
+    finally:
+        await election.complete_submissions([(key, receipt)])
+    return receipt
+
+
+@router.post("/submit-batch")
+async def encrypt_ballot_batch(ballot_batch_params: BallotBatchEncryptionRequest, election: Election = Depends(hosted_election)):
+    """
+    Encrypt and submit several ballots in one request.
+    The ballots are encrypted concurrently and stored in one transaction, in request order.
+    Ballots already submitted, by an earlier request or earlier in the batch, get their original receipt.
 
-    # Return verification code and timestamp
-    return {
-        "verification_code": encrypted_ballot.object_id,
-        "timestamp": encrypted_ballot.timestamp,
-        "unenc_hash": unenc_hash,
-        "enc_hash": enc_hash
-    }
+    Args:
+        ballot_batch_params: list of ballot JSON and action pairs, as sent to /submit
+    Returns:
+        JSON with one entry per ballot in request order, either the receipt /submit returns or {"error": message}
+    """
+    results: List[Optional[dict]] = [None] * len(ballot_batch_params.ballots)
+    accepted = []
+    for index, request in enumerate(ballot_batch_params.ballots):
+        if request.action not in ("CAST", "SPOIL"):
+            results[index] = {"error": f"Invalid action: {request.action}"}
+            continue
+        with timed("submit.validate"):
+            error = validate_ballot(election.manifest_index, request.ballot)
+        if error is not None:
+            results[index] = {"error": f"Invalid ballot: {error}"}
+            continue
+        try:
+            with timed("submit.plaintext_parse"):
+                ballot = plaintext_ballot(request.ballot)
+        except Exception as e:
+            results[index] = {"error": f"Invalid ballot: {e}"}
+            continue
+        with timed("submit.unenc_hash"):
+            unenc_hash = _unencrypted_hash(request.ballot)
+        accepted.append((index, request.action, unenc_hash, ballot, _idempotency_key(request, unenc_hash)))
+
+    # Only the first ballot with each key is submitted, repeats in the batch get its receipt
+    first_with_key: Dict[str, int] = dict()
+    repeats = []
+    for index, _, _, _, key in accepted:
+        if key in first_with_key:
+            repeats.append((index, first_with_key[key]))
+        else:
+            first_with_key[key] = index
+    accepted = [entry for entry in accepted if first_with_key[entry[4]] == entry[0]]
+
+    # Keys another request is submitting are waited for after this batch completes its own,
+    # so two batches holding each other's keys can't deadlock
+    with timed("submit.idempotency"):
+        claims = await election.claim_submissions([key for _, _, _, _, key in accepted])
+    in_flight = []
+    claimed = []
+    for entry, receipt in zip(accepted, claims):
+        if receipt == IN_FLIGHT:
+            in_flight.append(entry)
+        elif receipt is not None:
+            results[entry[0]] = receipt
+        else:
+            claimed.append(entry)
+
+    try:
+        async with scheduler.admit("submit"):
+            # Hand the whole batch to the encryption pool at once so every worker is busy
+            with timed("submit_batch.encrypt"):
+                encrypted_ballots = await asyncio.gather(
+                        *(election.encryption_pool.encrypt(ballot) for _, _, _, ballot, _ in claimed),
+                        return_exceptions=True
+                    )
+
+            try:
+                submissions = await election.submit_ballots([
+                        (encrypted_ballot if not isinstance(encrypted_ballot, Exception) else None, action)
+                        for (_, action, _, _, _), encrypted_ballot in zip(claimed, encrypted_ballots)
+                    ])
+            except SubmissionNotDurable as e:
+                # Submitted ballots stay queued, retries get their receipts instead of rejections
+                for (index, _, unenc_hash, _, _), submission in zip(claimed, e.results):
+                    results[index] = _receipt(submission, unenc_hash)
+                raise
+        for (index, _, unenc_hash, _, _), submission in zip(claimed, submissions):
+            results[index] = _receipt(submission, unenc_hash)
+    finally:
+        await election.complete_submissions([(key, results[index]) for index, _, _, _, key in claimed])
+
+    for index, _, _, _, key in in_flight:
+        receipt = await election.wait_submission(key)
+        results[index] = receipt if receipt is not None else {"error": "A concurrent submission of this ballot failed"}
+    for index, first_index in repeats:
+        results[index] = results[first_index]
+
+    return {"receipts": results}
 
 
 @router.post("/challenge")
-async def challenge(ballot_challenge_request: BallotChallengeRequest):
-    challenged = election.challenge_ballot(ballot_challenge_request.verification_code)
+async def challenge(ballot_challenge_request: BallotChallengeRequest, election: Election = Depends(hosted_election)):
+    # Admitted as a challenge job only if the ballot has to be decrypted
+    challenged = await election.challenge_ballot(ballot_challenge_request.verification_code)
 
     if challenged:
         ballot = {
@@ -150,11 +308,79 @@ async def challenge(ballot_challenge_request: BallotChallengeRequest):
     return ballot
 
 @router.get("/hashes")
-async def get_received_hashes():
+async def get_received_hashes(
+        cursor: int = Query(0, ge=0),
+        limit: int = Query(HASH_PAGE_SIZE, ge=1, le=HASH_PAGE_SIZE),
+        format: str = Query("json", regex="^(json|ndjson)$"),
+        election: Election = Depends(hosted_election)
+    ):
     """
-    Get the hash of every ballot that was received
-    :return: JSON array with all the hashes as strings
+    Get the hashes of received ballots in the order they were received
+
+    Args:
+        cursor: position of the first hash, next_cursor of the previous page
+        limit: maximum number of hashes in a JSON page
+        format: "json" for one page, "ndjson" to stream every hash from cursor on
+    Returns:
+        JSON page with the hashes and next_cursor, or an NDJSON stream of hashes
+    """
+    if format == "ndjson":
+        return stream_hashes(partial(election.get_hashes, "received"), cursor)
+    return await election.get_hashes("received", cursor, limit)
+
+
+@router.get("/hashes/{ballot_hash}")
+async def get_received_hash(ballot_hash: str, election: Election = Depends(hosted_election)):
+    """
+    Check whether a ballot hash was received
+
+    Returns:
+        JSON with whether the hash is present and its position
+    """
+    return await election.find_hash("received", ballot_hash)
+
+
+@router.get("/root")
+async def get_tree_head(election: Election = Depends(hosted_election)):
+    """
+    Get the signed root of the Merkle tree over received ballot hashes
+
+    Returns:
+        JSON with the tree size, hex root hash, timestamp, election extended base hash,
+        the server's public key and a Schnorr signature over them
+    """
+    return await election.get_tree_head()
+
+
+@router.get("/inclusion/{ballot_hash}")
+async def get_inclusion_proof(ballot_hash: str, tree_size: Optional[int] = Query(None, ge=0), election: Election = Depends(hosted_election)):
+    """
+    Prove a received ballot hash is in the Merkle tree, with an audit path of O(log n) hashes
+
+    Args:
+        ballot_hash: enc_hash from the ballot receipt
+        tree_size: size of the tree to prove inclusion in, e.g. the tree_size of a signed root, the current size by default
+    Returns:
+        JSON with the leaf index, tree size and root and the audit path, or present false if the hash isn't in that tree
+    """
+    proof = await election.get_inclusion_proof(ballot_hash, tree_size)
+    if "error" in proof:
+        raise HTTPException(status_code=400, detail=proof["error"])
+    return proof
+
+
+@router.get("/consistency")
+async def get_consistency_proof(first: int = Query(..., ge=1), second: Optional[int] = Query(None, ge=1), election: Election = Depends(hosted_election)):
+    """
+    Prove the Merkle tree of size first is a prefix of the tree of size second, i.e. no received hash was changed or removed
+
+    Args:
+        first: size of the earlier tree
+        second: size of the later tree, the current size by default
+    Returns:
+        JSON with both tree sizes and roots and the consistency proof
     """
-    with open(os.path.join(STORAGE_DIR, RECEIVED_HASH_FILE), "r") as f:
-        contents = f.read()
-        return {"hashes": contents.splitlines()}
\ No newline at end of file
+    proof = await election.get_consistency_proof(first, second)
+    if "error" in proof:
+        raise HTTPException(status_code=400, detail=proof["error"])
+    return proof
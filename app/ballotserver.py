@@ -1,33 +1,143 @@
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
+import math
+import signal
 
+from .admission import Overloaded
 from .ballot import router as ballotrouter
-from .election import router as electionrouter, election, BallotServerElectionConfig
+from .coordinator import serve_coordinator
+from .election import router as electionrouter, coordinator, elections, metrics_snapshots, BallotServerElectionConfig
+from .metrics import MIN_PROFILER_INTERVAL, profiler, render
+from .registry import DEFAULT_ELECTION, election_paths
+from .results import TallyUnavailable
+from .store import BallotStoreUnavailable
 
-from .config import MANIFEST_PATH, NUM_GUARDIANS, QUORUM, BALLOTSERVER_NAME, STORAGE_DIR
+from .config import NUM_GUARDIANS, PROFILER_ENABLED, QUORUM, RESULT_SNAPSHOT_INTERVAL, BALLOTSERVER_NAME
 from .secret_config import LAUNCH_CODE
 
 app = FastAPI()
 app.include_router(ballotrouter, prefix="/ballot")
 app.include_router(electionrouter, prefix="/election")
+# Elections hosted under ELECTIONS_DIR, the routes above serve the default one
+app.include_router(ballotrouter, prefix="/elections/{election_id}/ballot")
+app.include_router(electionrouter, prefix="/elections/{election_id}/election")
 
 
-@app.on_event("startup")
-async def initialize_election():
-    config = BallotServerElectionConfig(
+def election_config(election_id: str) -> BallotServerElectionConfig:
+    """
+    Configuration of an election, see registry.election_paths.
+
+    Raises:
+        UnknownElection if there is no such election
+    """
+    manifest_path, storage_dir = election_paths(election_id)
+    return BallotServerElectionConfig(
         NUM_GUARDIANS,
         QUORUM,
         LAUNCH_CODE,
-        BALLOTSERVER_NAME,
-        MANIFEST_PATH
+        BALLOTSERVER_NAME if election_id == DEFAULT_ELECTION else f"{BALLOTSERVER_NAME}-{election_id}",
+        manifest_path,
+        storage_dir
     )
-    election.initialize_election(config)
+
+
+@app.on_event("startup")
+async def initialize_election():
+    # Only processes serving HTTP encrypt ballots, the coordinator never needs pads
+    elections.start(election_config, precompute=True)
+    await elections.load(DEFAULT_ELECTION)
 
 
 @app.on_event("shutdown")
 async def store_election_state():
-    election.store_election_state(STORAGE_DIR)
+    await elections.close()
+    if coordinator is not None:
+        coordinator.close()
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    # Shed load early so the client backs off instead of timing out in a queue
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+
+@app.exception_handler(BallotStoreUnavailable)
+async def store_unavailable(request: Request, exc: BallotStoreUnavailable):
+    # Refused ballots weren't chained or tallied. Ballots that were, but aren't durable yet (SubmissionNotDurable),
+    # have their receipts kept, so the client can submit them all again either way.
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+
+@app.exception_handler(TallyUnavailable)
+async def tally_unavailable(request: Request, exc: TallyUnavailable):
+    retry_after = max(math.ceil(RESULT_SNAPSHOT_INTERVAL), 1)
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(retry_after)})
 
 
 @app.get("/")
 async def home():
     return {"version": "0.1"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Phase and request latency histograms and ballot counts in the Prometheus text format.
+    In multi-worker mode samples are labelled with the worker or coordinator they come from.
+    """
+    return render(await metrics_snapshots())
+
+
+# Only included when PROFILER_ENABLED, anyone reaching the server could otherwise profile it
+profiler_router = APIRouter()
+
+
+@profiler_router.post("/metrics/profiler/start")
+async def start_profiler(interval: float = Query(0.005, ge=MIN_PROFILER_INTERVAL)):
+    """
+    Start sampling the stacks of this process every interval seconds, discarding earlier samples.
+    """
+    profiler.start(interval)
+    return profiler.status()
+
+
+@profiler_router.post("/metrics/profiler/stop")
+async def stop_profiler():
+    profiler.stop()
+    return profiler.status()
+
+
+@profiler_router.get("/metrics/profiler", response_class=PlainTextResponse)
+async def get_profile():
+    """
+    Get the samples of the current or last profiler run, in the collapsed-stack format of flame graph tools.
+    """
+    return profiler.collapsed()
+
+
+if PROFILER_ENABLED:
+    app.include_router(profiler_router)
+
+
+def run_coordinator(socket_path: str) -> None:
+    """
+    Run the election coordinator for multi-worker mode until SIGTERM or SIGINT.
+    The coordinator owns the elections' keys, ballot stores and tallies, HTTP workers call it over socket_path.
+
+    Args:
+        socket_path: Unix socket to listen on
+    """
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        elections.start(election_config, precompute=False)
+        try:
+            await elections.load(DEFAULT_ELECTION)
+            await serve_coordinator(elections, socket_path, stop)
+        finally:
+            await elections.close()
+
+    asyncio.run(serve())
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, Iterator, Optional, Tuple, TypeVar
+
+
+_V = TypeVar("_V")
+
+
+class LRUCache(Generic[_V]):
+    """
+    Bounded mapping that evicts the least recently used entry once it is full.
+    """
+    max_size: int
+    _entries: "OrderedDict[Hashable, _V]"
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[_V]:
+        """
+        Get a cached value and mark it as recently used.
+
+        Args:
+            key: cache key
+        Returns:
+            Cached value, None if not cached
+        """
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: _V) -> None:
+        """
+        Cache a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: cache key
+            value: value to cache, must not be None
+        """
+        if self.max_size <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def items(self) -> Iterator[Tuple[Hashable, _V]]:
+        """
+        Iterate over the entries from least to most recently used, without marking them as used.
+        """
+        return iter(list(self._entries.items()))
+
+    def pop(self, key: Hashable) -> Optional[_V]:
+        return self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -0,0 +1,119 @@
+from electionguard.election import CiphertextElectionContext
+from electionguard.group import hex_to_p, hex_to_q
+from electionguard.guardian import Guardian, PrivateGuardianRecord
+from electionguard.key_ceremony import CeremonyDetails, ElectionJointKey, ElectionPartialKeyVerification
+from typing import List, Optional, Tuple
+import json
+import os
+
+
+def create_guardian(guardian_id: str, sequence_order: int, number_of_guardians: int, quorum: int) -> Guardian:
+    """
+    Create a guardian with fresh auxiliary and election keys.
+    Module level so the key generation can run in a worker process.
+    """
+    return Guardian(guardian_id, sequence_order, number_of_guardians, quorum)
+
+
+def generate_backups(guardian: Guardian) -> Guardian:
+    """
+    Generate a guardian's partial key backups for every other guardian.
+
+    Returns:
+        the guardian holding its backups, a copy when run in a worker process
+    """
+    guardian.generate_election_partial_key_backups()
+    return guardian
+
+
+def verify_backups(guardian: Guardian, other_ids: List[str]) -> List[ElectionPartialKeyVerification]:
+    """
+    Verify the partial key backups a guardian received from the other guardians.
+    """
+    return [guardian.verify_election_partial_key_backup(other_id) for other_id in other_ids]
+
+
+def _restore_guardian(record: PrivateGuardianRecord, ceremony_details: CeremonyDetails) -> Guardian:
+    # Guardian.__init__ always generates new keys, so fill in a bare instance from the record instead
+    guardian = Guardian.__new__(Guardian)
+    guardian.id = record.guardian_id
+    guardian.sequence_order = record.election_keys.sequence_order
+    guardian.ceremony_details = ceremony_details
+    guardian._election_keys = record.election_keys
+    guardian._auxiliary_keys = record.auxiliary_keys
+    guardian._backups_to_share = record.backups_to_share
+    guardian._guardian_auxiliary_public_keys = record.guardian_auxiliary_public_keys
+    guardian._guardian_election_public_keys = record.guardian_election_public_keys
+    guardian._guardian_election_partial_key_backups = record.guardian_election_partial_key_backups
+    guardian._guardian_election_partial_key_verifications = record.guardian_election_partial_key_verifications
+    return guardian
+
+
+def save_election_keys(
+        path: str,
+        guardians: List[Guardian],
+        joint_public_key: ElectionJointKey,
+        context: CiphertextElectionContext
+    ) -> None:
+    """
+    Write the key ceremony output so later boots can skip the ceremony.
+    The file holds the guardians' private keys, it is written with owner-only permissions.
+
+    Args:
+        path: file to write
+        guardians: guardians after the key ceremony
+        joint_public_key: joint key published by the ceremony
+        context: election context built from the joint key
+    """
+    keys = {
+        "guardians": [guardian.export_private_data().to_json_object(strip_privates=False) for guardian in guardians],
+        "joint_public_key": {
+            "joint_public_key": joint_public_key.joint_public_key.to_hex(),
+            "commitment_hash": joint_public_key.commitment_hash.to_hex()
+        },
+        "context": context.to_json_object()
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        json.dump(keys, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def load_election_keys(
+        path: str,
+        ceremony_details: CeremonyDetails
+    ) -> Optional[Tuple[List[Guardian], ElectionJointKey, CiphertextElectionContext]]:
+    """
+    Load key ceremony output written by save_election_keys.
+
+    Args:
+        path: file to read
+        ceremony_details: number of guardians and quorum the election is configured with
+    Returns:
+        guardians, joint key and election context, None if no keys have been stored
+    Raises:
+        ValueError if the stored keys were made for a different number of guardians or quorum
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        keys = json.load(f)
+
+    context = CiphertextElectionContext.from_json_object(keys["context"])
+    if (context.number_of_guardians, context.quorum) != (ceremony_details.number_of_guardians, ceremony_details.quorum):
+        raise ValueError(
+            f"Stored election keys are for {context.number_of_guardians} guardians with quorum {context.quorum}, "
+            f"configured for {ceremony_details.number_of_guardians} with quorum {ceremony_details.quorum}"
+        )
+    guardians = [
+        _restore_guardian(PrivateGuardianRecord.from_json_object(record), ceremony_details)
+        for record in keys["guardians"]
+    ]
+    joint_public_key = ElectionJointKey(
+        hex_to_p(keys["joint_public_key"]["joint_public_key"]),
+        hex_to_q(keys["joint_public_key"]["commitment_hash"])
+    )
+    return guardians, joint_public_key, context
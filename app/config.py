@@ -10,13 +10,73 @@ BALLOTSERVER_NAME = environ.get("BALLOTSERVER_NAME", "example_ballot_mediator_se
 STORAGE_DIR = environ.get("STORAGE_DIR", join(_CONFIG_PATH, "data/storage"))
 RECEIVED_HASH_FILE = environ.get("RECEIVED_HASH_FILE", "received_hashes.txt")
 COUNTED_HASH_FILE = environ.get("COUNTED_HASH_FILE", "counted_hashes.txt")
-
-def store_hash(hash: str, filename: str) -> None:
-    """
-    appends a ballot hash to the end of a file
-    :param hash: string of the ballot hash to record
-    :param filename: filename within config.STORAGE_DIR to write to
-    :return: None
-    """
-    with open(join(STORAGE_DIR, filename), "a") as f:
-        f.write(hash + "\n")
\ No newline at end of file
+# Key ceremony output within STORAGE_DIR, holds the guardians' private keys
+ELECTION_KEYS_FILE = environ.get("ELECTION_KEYS_FILE", "election_keys.json")
+# Key signing the Merkle tree heads of received ballot hashes, within STORAGE_DIR
+TREE_SIGNING_KEY_FILE = environ.get("TREE_SIGNING_KEY_FILE", "tree_signing_key.json")
+# Directory of hosted elections served at /elections/{election_id}, each in a subdirectory holding its manifest.json and storage
+ELECTIONS_DIR = environ.get("ELECTIONS_DIR", join(STORAGE_DIR, "elections"))
+# Estimated memory in MB of the loaded elections above which idle ones are closed until they are used again
+ELECTION_MEMORY_BUDGET = int(environ.get("ELECTION_MEMORY_BUDGET", 1024))
+# Where cast and spoiled ballots are kept: "sqlite" (durable, under STORAGE_DIR) or "memory" (lost on restart, spilled to a temporary file under STORAGE_DIR)
+BALLOT_STORE = environ.get("BALLOT_STORE", "sqlite")
+# Number of cast ballots between running tally checkpoints in the ballot store
+TALLY_CHECKPOINT_INTERVAL = int(environ.get("TALLY_CHECKPOINT_INTERVAL", 1000))
+# Number of ballot box shards, each with its own encryption device, ballot chain, store and running tally
+BALLOT_BOX_SHARDS = int(environ.get("BALLOT_BOX_SHARDS", 1))
+# How ballots are assigned to shards: "round_robin" or "ballot_style"
+SHARD_PARTITION = environ.get("SHARD_PARTITION", "round_robin")
+# How ballots are encrypted: "inline", "thread" or "process"
+ENCRYPTION_EXECUTOR = environ.get("ENCRYPTION_EXECUTOR", "process")
+# Number of encryption workers, defaults to the number of CPUs
+ENCRYPTION_WORKERS = int(environ["ENCRYPTION_WORKERS"]) if environ.get("ENCRYPTION_WORKERS") else None
+# Most precomputed encryption pads kept per loaded election in each process encrypting ballots (about 1.2 KB each), 0 disables precomputation
+PRECOMPUTE_POOL_SIZE = int(environ.get("PRECOMPUTE_POOL_SIZE", 10000))
+# How guardian decryption shares are computed: "inline", "thread" or "process"
+DECRYPTION_EXECUTOR = environ.get("DECRYPTION_EXECUTOR", "process")
+# Number of decryption workers, defaults to one per guardian
+DECRYPTION_WORKERS = int(environ["DECRYPTION_WORKERS"]) if environ.get("DECRYPTION_WORKERS") else None
+# Number of decrypted spoiled ballots kept per election for repeat challenges
+CHALLENGE_CACHE_SIZE = int(environ.get("CHALLENGE_CACHE_SIZE", 10000))
+# Number of submission receipts kept per election so retried submissions get the original receipt, 0 disables the cache
+SUBMISSION_CACHE_SIZE = int(environ.get("SUBMISSION_CACHE_SIZE", 100000))
+# Seconds a submission receipt is kept for retries
+SUBMISSION_CACHE_TTL = float(environ.get("SUBMISSION_CACHE_TTL", 86400))
+# Submission receipts within STORAGE_DIR, kept when BALLOT_STORE is "sqlite"
+SUBMISSION_CACHE_FILE = environ.get("SUBMISSION_CACHE_FILE", "submission_receipts.jsonl")
+# Largest page of ballot hashes the /hashes endpoints return
+HASH_PAGE_SIZE = int(environ.get("HASH_PAGE_SIZE", 1000))
+# Largest number of ballots accepted by /ballot/submit-batch
+SUBMIT_BATCH_SIZE = int(environ.get("SUBMIT_BATCH_SIZE", 100))
+# Most CPU-heavy jobs (submissions, challenges, tallies and record exports) run at once per process, defaults to 4 per CPU
+ADMISSION_CONCURRENCY = int(environ["ADMISSION_CONCURRENCY"]) if environ.get("ADMISSION_CONCURRENCY") else None
+# Most challenge decryptions run at once per process, defaults to the number of CPUs
+CHALLENGE_CONCURRENCY = int(environ["CHALLENGE_CONCURRENCY"]) if environ.get("CHALLENGE_CONCURRENCY") else None
+# Most result tallies run at once per process
+TALLY_CONCURRENCY = int(environ.get("TALLY_CONCURRENCY", 1))
+# Submissions waiting to start per process before further ones get 503 with Retry-After
+SUBMIT_QUEUE_SIZE = int(environ.get("SUBMIT_QUEUE_SIZE", 1000))
+# Challenges waiting to start per process before further ones get 503 with Retry-After
+CHALLENGE_QUEUE_SIZE = int(environ.get("CHALLENGE_QUEUE_SIZE", 100))
+# Result tallies waiting to start per process before further ones get 503 with Retry-After
+TALLY_QUEUE_SIZE = int(environ.get("TALLY_QUEUE_SIZE", 10))
+# Election record chunks /election/publish builds at once per process, run after every other job class
+PUBLISH_CONCURRENCY = int(environ.get("PUBLISH_CONCURRENCY", 1))
+# Election record downloads waiting for a chunk per process before further ones get 503 with Retry-After
+PUBLISH_QUEUE_SIZE = int(environ.get("PUBLISH_QUEUE_SIZE", 10))
+# Ballots per compressed chunk of /election/publish, a download can be resumed after any chunk
+PUBLISH_CHUNK_SIZE = int(environ.get("PUBLISH_CHUNK_SIZE", 500))
+# Seconds between tally snapshots, /election/result serves results at most this old while ballots are being cast, 0 decrypts only for requests
+RESULT_SNAPSHOT_INTERVAL = float(environ.get("RESULT_SNAPSHOT_INTERVAL", 5))
+# Seconds between keep-alive comments on /election/result/stream while no new results come
+RESULT_STREAM_KEEPALIVE = float(environ.get("RESULT_STREAM_KEEPALIVE", 15))
+# Set to "worker" by run.py runserver --workers for HTTP workers that call the election coordinator
+BALLOTSERVER_ROLE = environ.get("BALLOTSERVER_ROLE", "standalone")
+# Unix socket the election coordinator listens on in multi-worker mode
+COORDINATOR_SOCKET = environ.get("COORDINATOR_SOCKET", join(STORAGE_DIR, "coordinator.sock"))
+# Seconds a worker waits for the election coordinator to start, the first boot runs the key ceremony
+COORDINATOR_TIMEOUT = float(environ.get("COORDINATOR_TIMEOUT", 300))
+# Per-phase timing histograms for /metrics, "false" removes the timing calls entirely
+METRICS_ENABLED = environ.get("METRICS_ENABLED", "true").lower() != "false"
+# Serve the /metrics/profiler endpoints, "true" only where the server isn't reachable by voters
+PROFILER_ENABLED = environ.get("PROFILER_ENABLED", "false").lower() == "true"
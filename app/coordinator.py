@@ -0,0 +1,280 @@
+from base64 import b64encode
+from electionguard.ballot import CiphertextBallot
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+
+from .admission import Overloaded
+from .metrics import snapshot, timed
+from .publish import RecordCursor
+from .results import TallyUnavailable
+from .store import BallotStoreUnavailable, SubmissionNotDurable
+
+logger = logging.getLogger(__name__)
+
+# Batches of ballots are sent as one message, each encrypted ballot is about 26 KB of JSON
+MESSAGE_LIMIT = 64 * 1024 * 1024
+
+
+class CoordinatorError(Exception):
+    """
+    Raised by the client when the coordinator failed to handle a call.
+    """
+
+
+def _encode(message: Any) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+
+def _error_response(error: Exception) -> dict:
+    # Errors the HTTP workers answer with their own status codes are sent with what it takes to raise them again
+    response = {"error": f"{type(error).__name__}: {error}"}
+    if isinstance(error, (Overloaded, TallyUnavailable, BallotStoreUnavailable)):
+        response["type"] = type(error).__name__
+        response["message"] = str(error)
+        for field in ("job_class", "retry_after", "results"):
+            if hasattr(error, field):
+                response[field] = getattr(error, field)
+    return response
+
+
+def _remote_error(response: dict) -> Exception:
+    error_type = response.get("type")
+    if error_type == "Overloaded":
+        return Overloaded(response["job_class"], response["retry_after"])
+    if error_type == "TallyUnavailable":
+        return TallyUnavailable(response["message"])
+    if error_type == "SubmissionNotDurable":
+        return SubmissionNotDurable(response["message"], response["retry_after"], response["results"])
+    if error_type == "BallotStoreUnavailable":
+        return BallotStoreUnavailable(response["message"], response["retry_after"])
+    return CoordinatorError(response["error"])
+
+
+def _decode_response(line: bytes) -> Any:
+    if not line:
+        raise ConnectionError("Coordinator closed the connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise _remote_error(response)
+    return response["result"]
+
+
+class CoordinatorClient():
+    """
+    Calls the election coordinator over its Unix socket.
+
+    Messages are one JSON document per line: {"method": ..., "election": ..., "params": {...}}
+    answered by {"result": ...} or {"error": ...}. Connections are kept open and reused between calls.
+    Overloaded, TallyUnavailable and BallotStoreUnavailable raised at the coordinator are raised again
+    by the client, so workers answer them like a standalone server, other errors become CoordinatorError.
+    """
+    path: str
+    _idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]
+
+    def __init__(self, path: str):
+        self.path = path
+        self._idle = list()
+
+    def call_blocking(self, method: str, timeout: float, election_id: Optional[str] = None, **params) -> Any:
+        """
+        Call the coordinator without an event loop, waiting for it to come up.
+        Used while a worker starts, when the coordinator may still be running the key ceremony.
+
+        Args:
+            method: coordinator method name
+            timeout: seconds to keep retrying while the coordinator isn't listening
+            election_id: election the method is called on, None for methods of the coordinator itself
+        Returns:
+            result of the call
+        Raises:
+            TimeoutError if the coordinator didn't start listening in time
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                    connection.connect(self.path)
+                    connection.sendall(_encode({"method": method, "election": election_id, "params": params}))
+                    with connection.makefile("rb") as f:
+                        return _decode_response(f.readline())
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Election coordinator at {self.path} didn't start within {timeout}s")
+                time.sleep(0.5)
+
+    async def call(self, method: str, election_id: Optional[str] = None, **params) -> Any:
+        """
+        Call a coordinator method.
+
+        Args:
+            method: coordinator method name
+            election_id: election the method is called on, None for methods of the coordinator itself
+            params: JSON-serializable keyword arguments of the method
+        Returns:
+            result of the call
+        Raises:
+            Overloaded, TallyUnavailable or BallotStoreUnavailable as raised by the coordinator
+            CoordinatorError if the coordinator failed to handle the call otherwise
+        """
+        if self._idle:
+            reader, writer = self._idle.pop()
+        else:
+            reader, writer = await asyncio.open_unix_connection(self.path, limit=MESSAGE_LIMIT)
+        try:
+            with timed(f"coordinator.{method}"):
+                writer.write(_encode({"method": method, "election": election_id, "params": params}))
+                await writer.drain()
+                line = await reader.readline()
+        except BaseException:
+            writer.close()
+            raise
+        # The connection can be reused after an error response too, just not after the coordinator closed it
+        if line:
+            self._idle.append((reader, writer))
+        return _decode_response(line)
+
+    def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+def _coordinator_methods() -> Dict[str, Callable[..., Awaitable[Any]]]:
+    # Every call the HTTP workers make on an election, with the conversions to and from JSON
+    async def get_context(election) -> dict:
+        return {
+            "context": election.election_context.to_json_object(),
+            "manifest_hash": election.internal_manifest.manifest_hash.to_hex()
+        }
+
+    async def submit_ballots(election, ballots: List[Tuple[Any, str]]) -> List[dict]:
+        return await election.submit_ballots([
+            (CiphertextBallot.from_json_object(ballot) if ballot is not None else None, action)
+            for ballot, action in ballots
+        ])
+
+    async def claim_submissions(election, keys: List[str]) -> List[Optional[dict]]:
+        return await election.claim_submissions(keys)
+
+    async def wait_submission(election, key: str) -> Optional[dict]:
+        return await election.wait_submission(key)
+
+    async def complete_submissions(election, receipts: List[Tuple[str, Optional[dict]]]) -> None:
+        await election.complete_submissions(receipts)
+
+    # None tells the worker there are no results yet, so it answers 503 like a standalone server
+    async def get_tally_snapshot(election) -> Optional[dict]:
+        try:
+            return (await election.get_tally_snapshot()).body
+        except TallyUnavailable:
+            return None
+
+    async def wait_tally_snapshot(election, tag: str, timeout: float) -> Optional[dict]:
+        try:
+            return (await election.wait_tally_snapshot(tag, timeout)).body
+        except TallyUnavailable:
+            return None
+
+    async def challenge_ballot(election, verification_code: str) -> Any:
+        challenged = await election.challenge_ballot(verification_code)
+        return challenged.to_json_object() if challenged is not None else None
+
+    async def get_record_chunk(election, cursor: Optional[str]) -> Tuple[str, Optional[str]]:
+        # The chunk is already compressed, base64 keeps it intact in the JSON message
+        chunk, next_cursor = await election.get_record_chunk(
+                RecordCursor.decode(cursor, len(election.shards), election.context_hash) if cursor is not None else None
+            )
+        return b64encode(chunk).decode(), next_cursor.encode() if next_cursor is not None else None
+
+    async def get_hashes(election, ledger: str, cursor: int, limit: int) -> dict:
+        return await election.get_hashes(ledger, cursor, limit)
+
+    async def find_hash(election, ledger: str, ballot_hash: str) -> dict:
+        return await election.find_hash(ledger, ballot_hash)
+
+    async def get_tree_head(election) -> dict:
+        return await election.get_tree_head()
+
+    async def get_inclusion_proof(election, ballot_hash: str, tree_size: Optional[int]) -> dict:
+        return await election.get_inclusion_proof(ballot_hash, tree_size)
+
+    async def get_consistency_proof(election, first: int, second: Optional[int]) -> dict:
+        return await election.get_consistency_proof(first, second)
+
+    return {
+        "get_context": get_context,
+        "submit_ballots": submit_ballots,
+        "claim_submissions": claim_submissions,
+        "wait_submission": wait_submission,
+        "complete_submissions": complete_submissions,
+        "get_tally_snapshot": get_tally_snapshot,
+        "wait_tally_snapshot": wait_tally_snapshot,
+        "challenge_ballot": challenge_ballot,
+        "get_record_chunk": get_record_chunk,
+        "get_hashes": get_hashes,
+        "find_hash": find_hash,
+        "get_tree_head": get_tree_head,
+        "get_inclusion_proof": get_inclusion_proof,
+        "get_consistency_proof": get_consistency_proof
+    }
+
+
+async def serve_coordinator(registry, path: str, stop: asyncio.Event) -> None:
+    """
+    Serve elections to HTTP workers over a Unix socket until stop is set.
+    Each call holds a lease on its election, which is loaded on the first call for it.
+
+    Args:
+        registry: started ElectionRegistry of the Elections owning the keys, ballot stores and tallies
+        path: Unix socket to listen on, replaced if it already exists
+        stop: event that shuts the server down
+    """
+    methods = _coordinator_methods()
+    connections: Dict[asyncio.Task, asyncio.StreamWriter] = dict()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                try:
+                    if request["method"] == "get_metrics":
+                        response = {"result": snapshot()}
+                    else:
+                        async with registry.use(request["election"]) as election:
+                            response = {"result": await methods[request["method"]](election, **request["params"])}
+                except (Overloaded, TallyUnavailable, BallotStoreUnavailable) as e:
+                    # Answered with a 503 by the worker, no traceback needed
+                    logger.warning(f"Coordinator call {request.get('method')} refused: {e}")
+                    response = _error_response(e)
+                except Exception as e:
+                    logger.exception(f"Coordinator call {request.get('method')} failed")
+                    response = _error_response(e)
+                writer.write(_encode(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del connections[asyncio.current_task()]
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(handle, path, limit=MESSAGE_LIMIT)
+    logger.info(f"Election coordinator listening on {path}")
+    async with server:
+        await stop.wait()
+    # Workers keep their connections open, close them so the handlers finish before the loop does
+    for writer in connections.values():
+        writer.close()
+    await asyncio.gather(*connections, return_exceptions=True)
+    if os.path.exists(path):
+        os.remove(path)
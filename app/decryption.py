@@ -0,0 +1,120 @@
+from concurrent.futures import Executor
+from electionguard.ballot import SubmittedBallot
+from electionguard.decryption import compute_decryption_share, compute_decryption_share_for_ballot
+from electionguard.decryption_mediator import DecryptionMediator
+from electionguard.decryption_share import DecryptionShare
+from electionguard.election import CiphertextElectionContext
+from electionguard.guardian import Guardian
+from electionguard.key_ceremony import ElectionKeyPair
+from electionguard.tally import PlaintextTally, PublishedCiphertextTally
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import asyncio
+
+from .metrics import timed
+
+
+class InlineScheduler():
+    """
+    Stand-in for electionguard's Scheduler, which opens a new process pool and thread pool
+    every time it is constructed. Guardian work is already spread across our own executor.
+    """
+
+    def schedule(self, task: Callable, arguments: Iterable[Iterable[Any]], with_shared_resources: bool = False) -> List[Any]:
+        return [task(*args) for args in arguments]
+
+
+def _tally_share(keys: ElectionKeyPair, context: CiphertextElectionContext, tally: PublishedCiphertextTally) -> Optional[DecryptionShare]:
+    return compute_decryption_share(keys, tally, context, InlineScheduler())
+
+
+def _ballot_share(keys: ElectionKeyPair, context: CiphertextElectionContext, ballot: SubmittedBallot) -> Optional[DecryptionShare]:
+    return compute_decryption_share_for_ballot(keys, ballot, context, InlineScheduler())
+
+
+class GuardianPool():
+    """
+    Computes guardian decryption shares in parallel across guardians and combines them.
+
+    Tally decryption only computes tally shares. Ballot shares are only computed for
+    the single ballot being decrypted, never for the whole ballot box.
+    """
+    mediator_id: str
+    context: CiphertextElectionContext
+    _guardians: List[Guardian]
+    _keys: Dict[str, ElectionKeyPair]
+    _executor: Optional[Executor]
+
+    def __init__(
+            self,
+            mediator_id: str,
+            guardians: List[Guardian],
+            context: CiphertextElectionContext,
+            executor: Optional[Executor] = None
+        ):
+        """
+        Args:
+            mediator_id: ID given to the decryption mediators
+            guardians: guardians taking part in decryption
+            context: election context
+            executor: executor the shares are computed on, which can be shared between elections
+                since each share's key pair is sent with it, None to compute them on the calling thread
+        """
+        self.mediator_id = mediator_id
+        self.context = context
+        self._guardians = guardians
+        self._keys = {guardian.id: guardian.export_private_data().election_keys for guardian in guardians}
+        self._executor = executor
+
+    async def _compute_shares(self, share_function: Callable, target: Any) -> Optional[Dict[str, DecryptionShare]]:
+        if self._executor is None:
+            shares = [share_function(self._keys[guardian.id], self.context, target) for guardian in self._guardians]
+        else:
+            loop = asyncio.get_running_loop()
+            shares = await asyncio.gather(*[
+                    loop.run_in_executor(self._executor, share_function, self._keys[guardian.id], self.context, target)
+                    for guardian in self._guardians
+                ])
+        if any(share is None for share in shares):
+            return None
+        return {guardian.id: share for guardian, share in zip(self._guardians, shares)}
+
+    async def decrypt_tally(self, tally: PublishedCiphertextTally) -> Optional[PlaintextTally]:
+        """
+        Decrypt an encrypted tally using only the guardians' tally shares.
+
+        Args:
+            tally: encrypted tally, usually a RunningTally snapshot
+        Returns:
+            PlaintextTally, None if a share could not be computed or combined
+        """
+        with timed("decrypt.tally_shares"):
+            shares = await self._compute_shares(_tally_share, tally)
+        if shares is None:
+            return None
+        with timed("decrypt.tally_combine"):
+            mediator = DecryptionMediator(self.mediator_id, self.context)
+            for guardian in self._guardians:
+                mediator.announce(guardian.share_election_public_key(), shares[guardian.id])
+            return mediator.get_plaintext_tally(tally)
+
+    async def decrypt_ballot(self, ballot: SubmittedBallot) -> Optional[PlaintextTally]:
+        """
+        Decrypt a single submitted ballot.
+
+        Args:
+            ballot: ballot to decrypt
+        Returns:
+            Plaintext representation of the ballot, None if a share could not be computed or combined
+        """
+        with timed("decrypt.ballot_shares"):
+            shares = await self._compute_shares(_ballot_share, ballot)
+        if shares is None:
+            return None
+        with timed("decrypt.ballot_combine"):
+            mediator = DecryptionMediator(self.mediator_id, self.context)
+            for guardian in self._guardians:
+                # The mediator requires a tally share to announce, the ballot share stands in for it
+                share = shares[guardian.id]
+                mediator.announce(guardian.share_election_public_key(), share, {ballot.object_id: share})
+            return mediator.get_plaintext_ballots([ballot]).get(ballot.object_id)
+
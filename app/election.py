@@ -1,24 +1,80 @@
-from dataclasses import dataclass
-from datetime import datetime
-from electionguard.ballot import BallotBoxState, PlaintextBallot
-from electionguard.ballot_box import BallotBox, get_ballots
-from electionguard.data_store import DataStore
-from electionguard.decryption_mediator import DecryptionMediator
-from electionguard.election import CiphertextElectionContext
+from base64 import b64decode
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from electionguard.ballot import BallotBoxState, CiphertextBallot, SubmittedBallot
+from electionguard.election import CiphertextElectionContext, ElectionConstants
 from electionguard.election_builder import ElectionBuilder
-from electionguard.encrypt import EncryptionDevice, EncryptionMediator, generate_device_uuid
+from electionguard.elgamal import ElGamalKeyPair
+from electionguard.encrypt import EncryptionDevice, generate_device_uuid
 from electionguard.guardian import Guardian
 from electionguard.key_ceremony import CeremonyDetails, ElectionJointKey
 from electionguard.key_ceremony_mediator import KeyCeremonyMediator
 from electionguard.manifest import InternalManifest, Manifest
-from electionguard.tally import CiphertextTally, PlaintextTally
+from electionguard.tally import PlaintextTally
+from functools import partial
 from electionguard.group import int_to_q
-from fastapi import APIRouter
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from time import perf_counter
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import logging
 import os.path
+import time
 
-from .manifest import load_manifest_from_file
-from .config import COUNTED_HASH_FILE, STORAGE_DIR, store_hash
+from .admission import scheduler
+from .cache import LRUCache
+from .coordinator import CoordinatorClient
+from .ceremony import create_guardian, generate_backups, load_election_keys, save_election_keys, verify_backups
+from .decryption import GuardianPool
+from .idempotency import SubmissionCache
+from .encryption import BallotChain, EncryptionPool, EncryptionWorkers
+from .ledger import HashLedger, consistency_proof, hash_lookup, hashes_page, inclusion_proof, stream_hashes
+from .manifest import ManifestIndex, load_manifest_from_file
+from .merkle import load_signing_key, sign_tree_head
+from .metrics import register_gauge, snapshot, timed
+from .publish import SPOILED_CHUNK_SIZE, RecordCursor, ballot_members, compress_records, finish_chunk, record, stream_record
+from .registry import DEFAULT_ELECTION, ElectionRegistry, UnknownElection
+from .results import TallySnapshot, TallySnapshots, TallyUnavailable, etag_matches, stream_results
+from .serialization import FastJSONRoute
+from .shard import BallotBoxShard
+from .store import BallotStore, BallotStoreUnavailable, SubmissionNotDurable, check_shard_count, deserialize_ballot, open_ballot_store
+from .tally import RunningTally, merge_tallies
+from .config import (
+    BALLOT_BOX_SHARDS,
+    BALLOT_STORE,
+    BALLOTSERVER_ROLE,
+    CHALLENGE_CACHE_SIZE,
+    COORDINATOR_SOCKET,
+    COORDINATOR_TIMEOUT,
+    COUNTED_HASH_FILE,
+    ELECTION_KEYS_FILE,
+    ELECTION_MEMORY_BUDGET,
+    HASH_PAGE_SIZE,
+    PRECOMPUTE_POOL_SIZE,
+    PUBLISH_CHUNK_SIZE,
+    RECEIVED_HASH_FILE,
+    RESULT_SNAPSHOT_INTERVAL,
+    RESULT_STREAM_KEEPALIVE,
+    SHARD_PARTITION,
+    SUBMISSION_CACHE_FILE,
+    SUBMISSION_CACHE_SIZE,
+    SUBMISSION_CACHE_TTL,
+    TALLY_CHECKPOINT_INTERVAL,
+    TREE_SIGNING_KEY_FILE
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Rough sizes for Election.memory_size of what isn't packed: the manifest, keys and context,
+# each selection's descriptions and running tallies, a submission receipt and each selection of a
+# decrypted spoiled ballot with its guardian shares and proofs
+ELECTION_BYTES = 256 * 1024
+SELECTION_BYTES = 2 * 1024
+RECEIPT_BYTES = 800
+DECRYPTED_SELECTION_BYTES = 6 * 1024
 
 
 @dataclass
@@ -28,6 +84,7 @@ class BallotServerElectionConfig():
     launch_code: int
     ballotserver_name: str
     manifest_path: str
+    storage_dir: str
 
 
 class Election():
@@ -37,52 +94,81 @@ class Election():
     
     TODO: make this not a local thing (mediators on different host)
     """
+    election_id: str
+    storage_dir: str
+    manifest_path: str
     manifest: Manifest
+    manifest_index: ManifestIndex
     internal_manifest: InternalManifest
     ceremony_details = CeremonyDetails
     guardians: List[Guardian]
     key_ceremony_mediator: KeyCeremonyMediator
-    encryption_mediator: EncryptionMediator
-    decryption_mediator: DecryptionMediator
+    encryption_pool: EncryptionPool
+    guardian_pool: GuardianPool
+    tally_snapshots: TallySnapshots
     joint_public_key: ElectionJointKey
     election_context: CiphertextElectionContext
-    ballotbox: BallotBox
-    datastore: DataStore
+    shards: List[BallotBoxShard]
+    _ballot_boxes: List[Tuple[BallotChain, BallotStore, RunningTally]]
+    _selections: int
+    _style_shards: Dict[str, int]
+    _next_shard: int
+    challenge_cache: LRUCache[PlaintextTally]
+    _pending_challenges: Dict[str, asyncio.Future]
+    submission_cache: Optional[SubmissionCache]
+    received_hashes: Optional[HashLedger]
+    counted_hashes: Optional[HashLedger]
+    tree_signing_key: ElGamalKeyPair
+    _signed_tree_head: Optional[dict]
     ballotserver_name: str
+    startup_timings: Dict[str, float]
+
+    def __init__(self, election_id: str = DEFAULT_ELECTION):
+        self.election_id = election_id
+        self.shards = list()
+        self._ballot_boxes = list()
+        self.submission_cache = None
+        self.received_hashes = None
+        self.counted_hashes = None
 
     def _load_manifest(self, path: str):
+        self.manifest_path = path
         self.manifest = load_manifest_from_file(path)
+        self.manifest_index = ManifestIndex(self.manifest)
 
     def _set_ceremony_details(self, num_guardians: int, quorum: int):
         self.ceremony_details = CeremonyDetails(num_guardians, quorum)
 
-    def _create_guardians(self):
-        self.guardians = [
-                Guardian(
-                        f"Guardian-{i+1:02}", i+1, 
+    def _create_guardians(self, executor: Executor):
+        # Key generation is independent per guardian
+        futures = [
+                executor.submit(
+                        create_guardian,
+                        f"Guardian-{i+1:02}", i+1,
                         self.ceremony_details.number_of_guardians,
                         self.ceremony_details.quorum
                     )
                 for i in range(self.ceremony_details.number_of_guardians)
             ]
-    
+        self.guardians = [future.result() for future in futures]
+
     def _create_key_ceremony_mediator(self, id):
         self.key_ceremony_mediator = KeyCeremonyMediator(id, self.ceremony_details)
-    
-    def _perform_key_ceremony(self):
+
+    def _perform_key_ceremony(self, executor: Executor):
         # Announce each guardian
         for guardian in self.guardians:
             self.key_ceremony_mediator.announce(guardian.share_public_keys())
-        
+
         # Each guardian saves others announced keys
         for guardian in self.guardians:
             others = self.key_ceremony_mediator.share_announced(guardian.id)
             for keys in others:
                 guardian.save_guardian_public_keys(keys)
 
-        # Each guardian generates partial key backups
+        # Each guardian generates partial key backups, in parallel
+        self.guardians = list(executor.map(generate_backups, self.guardians))
         for guardian in self.guardians:
-            guardian.generate_election_partial_key_backups()
             self.key_ceremony_mediator.receive_backups(guardian.share_election_partial_key_backups())
 
         # Each guardian receives others' partial key backups
@@ -91,150 +177,916 @@ class Election():
             for backup in backups:
                 guardian.save_election_partial_key_backup(backup)
 
-        # Backup verifications
-        for guardian in self.guardians:
-            for other in self.guardians:
-                verifications = list()
-                if guardian.id is not other.id:
-                    verifications.append(guardian.verify_election_partial_key_backup(other.id))
-                self.key_ceremony_mediator.receive_backup_verifications(verifications)
-        
+        # Backup verifications, each guardian verifies the backups it received in parallel
+        futures = [
+                executor.submit(verify_backups, guardian, [other.id for other in self.guardians if other.id != guardian.id])
+                for guardian in self.guardians
+            ]
+        for future in futures:
+            self.key_ceremony_mediator.receive_backup_verifications(future.result())
+
         # Save joint public key
         self.joint_public_key = self.key_ceremony_mediator.publish_joint_key()
 
+    def _load_election_keys(self, path: str) -> bool:
+        """
+        Load guardians and the joint key from a previous key ceremony.
+
+        Returns:
+            True if stored keys were loaded
+        Raises:
+            ValueError if the manifest changed since the keys were stored
+        """
+        stored = load_election_keys(path, self.ceremony_details)
+        if stored is None:
+            return False
+        self.guardians, self.joint_public_key, stored_context = stored
+        self._build_election()
+        if self.election_context.crypto_extended_base_hash != stored_context.crypto_extended_base_hash:
+            raise ValueError(f"Manifest or election parameters changed since the key ceremony stored in {path}")
+        return True
+
     def _build_election(self):
         builder = ElectionBuilder(self.ceremony_details.number_of_guardians, self.ceremony_details.quorum, self.manifest)
         builder.set_commitment_hash(self.joint_public_key.commitment_hash)
         builder.set_public_key(self.joint_public_key.joint_public_key)
         self.internal_manifest, self.election_context = builder.build()
 
-    def _create_encryption_mediator(self, launch_code: int, location: str):
-        encryption_device = EncryptionDevice(generate_device_uuid(), 1, launch_code, location)
-        self.encryption_mediator = EncryptionMediator(self.internal_manifest, self.election_context, encryption_device)
-
-    def _create_decryption_mediator(self, id: str):
-        self.decryption_mediator = DecryptionMediator(id, self.election_context)
+    def _create_encryption_pool(self, workers: EncryptionWorkers):
+        self.encryption_pool = EncryptionPool(
+                self.internal_manifest,
+                self.election_context,
+                self.manifest_path,
+                workers,
+                PRECOMPUTE_POOL_SIZE
+            )
 
-    def _make_ballotbox(self):
-        self.datastore = DataStore()
-        self.ballotbox = BallotBox(self.internal_manifest, self.election_context, self.datastore)
+    def _create_guardian_pool(self, executor: Optional[Executor]):
+        self.guardian_pool = GuardianPool(
+                f"{self.ballotserver_name}-decryption-mediator",
+                self.guardians,
+                self.election_context,
+                executor
+            )
 
-    def _create_encrypted_tally(self) -> CiphertextTally:
-        return CiphertextTally(
-                f"{self.ballotserver_name}-tally-{datetime.utcnow().isoformat()}",
-                self.internal_manifest,
-                self.election_context
+    def _create_tally_snapshots(self):
+        self.tally_snapshots = TallySnapshots(
+                lambda: sum(shard.running_tally.cast_count for shard in self.shards),
+                self._decrypt_tally,
+                RESULT_SNAPSHOT_INTERVAL
             )
+        self.tally_snapshots.start()
+
+    def _open_ballot_box(self, launch_code: int, location: str):
+        check_shard_count(BALLOT_STORE, self.storage_dir, BALLOT_BOX_SHARDS)
+        # Each shard has its own encryption device, so its own ballot chain, and picks up ballots cast before a restart.
+        # Every boot is a new session, so its chain starts from a device hash no other boot recorded.
+        session_id = int(time.time())
+        for i in range(BALLOT_BOX_SHARDS):
+            device = EncryptionDevice(generate_device_uuid(), session_id, launch_code, f"{location}-shard-{i}")
+            chain = BallotChain(device)
+            datastore = open_ballot_store(BALLOT_STORE, self.storage_dir, self.election_context, i)
+            datastore.record_device(device.get_hash().to_hex())
+            running_tally = RunningTally(f"{self.ballotserver_name}-tally-{i}", self.internal_manifest, self.election_context)
+            self._ballot_boxes.append((chain, datastore, running_tally))
+            datastore.recover_tally(running_tally)
+        self._style_shards = {
+            style.object_id: i % BALLOT_BOX_SHARDS for i, style in enumerate(self.manifest.ballot_styles)
+        }
+        self._next_shard = 0
+        self._selections = sum(
+            len(contest.ballot_selections) + len(contest.placeholder_selections)
+            for contest in self.internal_manifest.contests
+        )
+        self.challenge_cache = LRUCache(CHALLENGE_CACHE_SIZE)
+        self._pending_challenges = dict()
 
+    def _open_submission_cache(self):
+        # Receipts outliving the ballots they are for would tell a retry its ballot was stored
+        path = os.path.join(self.storage_dir, SUBMISSION_CACHE_FILE) if BALLOT_STORE == "sqlite" else None
+        self.submission_cache = SubmissionCache(path, SUBMISSION_CACHE_SIZE, SUBMISSION_CACHE_TTL)
+
+    def _open_hash_ledgers(self):
+        self.received_hashes = HashLedger(os.path.join(self.storage_dir, RECEIVED_HASH_FILE), merkle=True)
+        self.counted_hashes = HashLedger(os.path.join(self.storage_dir, COUNTED_HASH_FILE))
+        self.tree_signing_key = load_signing_key(os.path.join(self.storage_dir, TREE_SIGNING_KEY_FILE))
+        self._signed_tree_head = None
+
+    @contextmanager
+    def _timed(self, phase: str) -> Iterator[None]:
+        start = perf_counter()
+        with timed(f"startup.{phase}"):
+            yield
+        self.startup_timings[phase] = perf_counter() - start
 
     def initialize_election(self, election_config: BallotServerElectionConfig):
+        """
+        Load the manifest, keys, ballot stores and ledgers, running the key ceremony on first boot.
+        Doesn't use the event loop, so elections can be loaded on a worker thread. start() must be
+        called on the event loop before the election is used.
+        """
+        self.startup_timings = dict()
         self.ballotserver_name = election_config.ballotserver_name
-        self._load_manifest(election_config.manifest_path)
+        self.storage_dir = election_config.storage_dir
+        with self._timed("load_manifest"):
+            self._load_manifest(election_config.manifest_path)
         self._set_ceremony_details(election_config.number_of_guardians, election_config.quorum)
-        self._create_guardians()
-        self._create_key_ceremony_mediator(f"{self.ballotserver_name}-key-ceremony-mediator")
-        self._perform_key_ceremony()
-        self._build_election()
-        self._create_encryption_mediator(election_config.launch_code, f"{self.ballotserver_name}-encryption-mediator")
-        self._create_decryption_mediator(f"{self.ballotserver_name}-decryption-mediator")
-        self._make_ballotbox()
+
+        keys_path = os.path.join(self.storage_dir, ELECTION_KEYS_FILE)
+        with self._timed("load_keys"):
+            keys_loaded = self._load_election_keys(keys_path)
+        if not keys_loaded:
+            # First boot, run the key ceremony once and keep its output
+            with ProcessPoolExecutor(max_workers=self.ceremony_details.number_of_guardians) as executor:
+                with self._timed("create_guardians"):
+                    self._create_guardians(executor)
+                self._create_key_ceremony_mediator(f"{self.ballotserver_name}-key-ceremony-mediator")
+                with self._timed("key_ceremony"):
+                    self._perform_key_ceremony(executor)
+            with self._timed("build_election"):
+                self._build_election()
+            with self._timed("save_keys"):
+                save_election_keys(keys_path, self.guardians, self.joint_public_key, self.election_context)
+
+        with self._timed("recover_ballotbox"):
+            self._open_ballot_box(election_config.launch_code, f"{self.ballotserver_name}-encryption-mediator")
+            self._open_submission_cache()
+        with self._timed("load_hash_ledgers"):
+            self._open_hash_ledgers()
+
+        report = ", ".join(f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in self.startup_timings.items())
+        logger.info(f"Election {self.ballotserver_name} started in {sum(self.startup_timings.values()):.2f}s: {report}")
+
+    def start(self, encryption_workers: EncryptionWorkers, decryption_executor: Optional[Executor]):
+        """
+        Make the shard locks, the encryption and decryption pools and the tally snapshotter,
+        on the event loop after initialize_election.
+
+        Args:
+            encryption_workers: encryption executor shared by the process's elections
+            decryption_executor: decryption executor shared by the process's elections, None to decrypt inline
+        """
+        self._create_encryption_pool(encryption_workers)
+        self._create_guardian_pool(decryption_executor)
+        self.shards = [
+            BallotBoxShard(i, chain, datastore, running_tally)
+            for i, (chain, datastore, running_tally) in enumerate(self._ballot_boxes)
+        ]
+        self._create_tally_snapshots()
 
     def store_election_state(self, storage_dir: str):
-        # TODO: serialize election state and deserialize it
-        # this might be doable by dumping all the ballots and keys and then importing them back in
-        # for now, this is just a stub that's called during the shutdown process
-        pass
+        # Keys are stored after the key ceremony and ballots as they are cast, this only flushes the last batch.
+        # Also releases what a failed initialize_election opened.
+        for _, datastore, _ in self._ballot_boxes:
+            datastore.close()
+        for opened in (self.submission_cache, self.received_hashes, self.counted_hashes):
+            if opened is not None:
+                opened.close()
+
+    async def flush(self):
+        """
+        Wait until every ballot and hash recorded so far is durable.
+        """
+        await asyncio.gather(
+                *(shard.datastore.flush() for shard in self.shards),
+                self.received_hashes.flush(),
+                self.counted_hashes.flush()
+            )
+
+    def shutdown(self):
+        """
+        Stop the election's background work, the executors are shared and shut down by the registry.
+        """
+        self.encryption_pool.shutdown()
+        self.tally_snapshots.shutdown()
+
+    @property
+    def evictable(self) -> bool:
+        """
+        Whether the election can be closed and loaded again without losing anything: its ballots are
+        durable and no submission or challenge is in progress.
+        """
+        return BALLOT_STORE != "memory" and not self.submission_cache.in_flight and not self._pending_challenges
+
+    def memory_size(self) -> int:
+        """
+        Estimate the bytes the election holds in memory, for ElectionRegistry's budget.
+        Packed ledgers and store indexes are counted as they are, Python objects at a typical size.
+        """
+        return (
+            ELECTION_BYTES
+            + SELECTION_BYTES * self._selections * (1 + len(self.shards))
+            + sum(shard.datastore.nbytes for shard in self.shards)
+            + self.received_hashes.nbytes
+            + self.counted_hashes.nbytes
+            + RECEIPT_BYTES * len(self.submission_cache)
+            + DECRYPTED_SELECTION_BYTES * self._selections * len(self.challenge_cache)
+            + self.encryption_pool.pads.nbytes
+        )
+
+    def gauge_values(self) -> Dict[str, float]:
+        """
+        Values of the election's gauges, summed over the loaded elections on /metrics, see ELECTION_GAUGES.
+        """
+        pads = self.encryption_pool.pads
+        return {
+            "ballotserver_precompute_pads": len(pads),
+            "ballotserver_precompute_hits": pads.hits,
+            "ballotserver_precompute_misses": pads.misses,
+            "ballotserver_ballots_cast": sum(shard.running_tally.cast_count for shard in self.shards),
+            "ballotserver_ballots_stored": sum(len(shard.datastore) for shard in self.shards),
+            "ballotserver_challenge_cache_entries": len(self.challenge_cache),
+            "ballotserver_submission_cache_entries": len(self.submission_cache),
+            "ballotserver_submission_cache_hits": self.submission_cache.hits,
+            "ballotserver_received_hashes": len(self.received_hashes),
+            "ballotserver_counted_hashes": len(self.counted_hashes),
+            "ballotserver_tally_snapshots": self.tally_snapshots.decryptions
+        }
 
+    def cast_ballot(self, shard: BallotBoxShard, ballot: CiphertextBallot) -> Optional[SubmittedBallot]:
+        """
+        Cast a verified encrypted ballot and add it to the shard's running tally.
+        Callers must hold the shard's lock.
 
-    def get_election_tally(self) -> PlaintextTally:
+        Args:
+            shard: ballot box shard the ballot was chained in
+            ballot: chained encrypted ballot
+        Returns:
+            SubmittedBallot stored in the ballot box, None if the ballot box rejected it
         """
-        Tally up the results of the election and return the plaintext tally
+        with timed("submit.cast"):
+            submitted = shard.accept(ballot, BallotBoxState.CAST)
+        if submitted is None:
+            return None
+        with timed("submit.tally_append"):
+            appended = shard.running_tally.append(submitted)
+        if appended:
+            with timed("submit.hash_ledger"):
+                self.counted_hashes.append(submitted.crypto_hash_with(int_to_q(0)).to_hex())
+            if shard.running_tally.cast_count % TALLY_CHECKPOINT_INTERVAL == 0:
+                with timed("submit.tally_checkpoint"):
+                    shard.datastore.checkpoint_tally(shard.running_tally)
+        return submitted
 
+    def spoil_ballot(self, shard: BallotBoxShard, ballot: CiphertextBallot) -> Optional[SubmittedBallot]:
+        """
+        Spoil a verified encrypted ballot.
+        Callers must hold the shard's lock.
+
+        Args:
+            shard: ballot box shard the ballot was chained in
+            ballot: chained encrypted ballot
         Returns:
-            PlaintextTally object of the election
-        
-        # TODO separate out the decryption encrypted tally portion
-        """
-        encrypted_tally = self._create_encrypted_tally()
-        cast_ballots = get_ballots(self.datastore, BallotBoxState.CAST)
-        for ballot in cast_ballots.values():
-            encrypted_tally.append(ballot)
-            store_hash(ballot.crypto_hash_with(int_to_q(0)).to_hex(), COUNTED_HASH_FILE)
-        for guardian in self.guardians:
-            guardian_key = guardian.share_election_public_key()
-            tally_share = guardian.compute_tally_share(encrypted_tally, self.election_context)
-            ballot_share = guardian.compute_ballot_shares(cast_ballots.values(), self.election_context)
-            self.decryption_mediator.announce(guardian_key, tally_share, ballot_share)
-        plaintext_tally = self.decryption_mediator.get_plaintext_tally(encrypted_tally)
-        return plaintext_tally
+            SubmittedBallot stored in the ballot box, None if the ballot box rejected it
+        """
+        with timed("submit.spoil"):
+            return shard.accept(ballot, BallotBoxState.SPOILED)
+
+    def _find_ballot(self, object_id: str) -> Optional[SubmittedBallot]:
+        for shard in self.shards:
+            ballot = shard.datastore.get(object_id)
+            if ballot is not None:
+                return ballot
+        return None
+
+    def _shard_for(self, ballot: CiphertextBallot) -> BallotBoxShard:
+        if SHARD_PARTITION == "ballot_style":
+            return self.shards[self._style_shards.get(ballot.style_id, 0)]
+        shard = self.shards[self._next_shard]
+        self._next_shard = (self._next_shard + 1) % len(self.shards)
+        return shard
+
+    def _submit_ballot(
+            self,
+            shard: BallotBoxShard,
+            encrypted_ballot: Optional[CiphertextBallot],
+            valid: bool,
+            action: str
+        ) -> dict:
+        # Callers must hold the shard's lock
+        if encrypted_ballot is None:
+            return {"error": "Ballot could not be encrypted"}
+        # Ballot IDs are unique across shards. Nothing awaits between this check and the ballot
+        # being stored, so no other shard can take the same ID in between.
+        if not valid or self._find_ballot(encrypted_ballot.object_id) is not None:
+            return {"error": "Ballot was rejected by the ballot box"}
+
+        # Chain the ballot to the previously submitted one in its shard
+        with timed("submit.chain"):
+            encrypted_ballot = shard.chain.chain(encrypted_ballot)
+
+        # the ballot type has a function to run it through sha256 with something prepended to it
+        # this returns an ElementModQ, a variety of BigInteger, which has .to_hex() to make a hex string
+        with timed("submit.enc_hash"):
+            enc_hash = encrypted_ballot.crypto_hash_with(int_to_q(0)).to_hex()
+
+        # Cast or spoil ballot depending on action
+        if action == "CAST":
+            submitted = self.cast_ballot(shard, encrypted_ballot)
+            if submitted is not None:
+                with timed("submit.hash_ledger"):
+                    self.received_hashes.append(enc_hash)
+        else:
+            submitted = self.spoil_ballot(shard, encrypted_ballot)
+        if submitted is None:
+            return {"error": "Ballot was rejected by the ballot box"}
+        return {
+            "verification_code": encrypted_ballot.object_id,
+            "timestamp": encrypted_ballot.timestamp,
+            "enc_hash": enc_hash
+        }
+
+    async def submit_ballots(self, ballots: List[Tuple[Optional[CiphertextBallot], str]]) -> List[dict]:
+        """
+        Verify encrypted ballots, then chain and cast or spoil them in order within their shards,
+        in one store transaction per shard. Returns once the ballots and their hashes are durable.
+
+        Args:
+            ballots: unchained encrypted ballots (None if encryption failed) with "CAST" or "SPOIL"
+        Returns:
+            one entry per ballot, its verification_code, timestamp and enc_hash, or an error
+        Raises:
+            BallotStoreUnavailable if a shard's store is failing to write, before its ballots are chained
+            SubmissionNotDurable if the ballots were submitted but not committed in time
+        """
+        # Checking the proofs is most of the work of casting, do it concurrently before taking any lock
+        with timed("submit.verify"):
+            valid = await asyncio.gather(*(
+                    self.encryption_pool.verify(encrypted_ballot)
+                    for encrypted_ballot, _ in ballots if encrypted_ballot is not None
+                ))
+        valid = iter(valid)
+
+        by_shard: Dict[int, List[Tuple[int, Optional[CiphertextBallot], bool, str]]] = dict()
+        for position, (encrypted_ballot, action) in enumerate(ballots):
+            ballot_valid = next(valid) if encrypted_ballot is not None else False
+            shard = self._shard_for(encrypted_ballot) if encrypted_ballot is not None else self.shards[0]
+            by_shard.setdefault(shard.index, []).append((position, encrypted_ballot, ballot_valid, action))
+
+        results: List[Optional[dict]] = [None] * len(ballots)
+
+        async def submit_to_shard(shard: BallotBoxShard, entries) -> None:
+            with timed("submit.lock_wait"):
+                await shard.lock.acquire()
+            try:
+                # Refuse the ballots before they are chained or tallied if the store can't take them
+                shard.datastore.check_writable()
+                with shard.datastore.transaction():
+                    for position, encrypted_ballot, ballot_valid, action in entries:
+                        results[position] = self._submit_ballot(shard, encrypted_ballot, ballot_valid, action)
+            finally:
+                shard.lock.release()
+
+        await asyncio.gather(*(submit_to_shard(self.shards[index], entries) for index, entries in by_shard.items()))
+
+        # Only report ballots as submitted once they are durable, concurrent submissions share the commit
+        with timed("submit.durable"):
+            try:
+                await self.flush()
+            except BallotStoreUnavailable as e:
+                raise SubmissionNotDurable(str(e), e.retry_after, results)
+        return results
+
+    async def claim_submissions(self, keys: List[str]) -> List[Optional[dict]]:
+        """
+        Claim idempotency keys before encrypting their ballots.
+
+        Args:
+            keys: idempotency keys, the action with the unenc_hash or a client-supplied key
+        Returns:
+            for each key, the original receipt if its ballot was already submitted, IN_FLIGHT if another
+            request is submitting it, or None if the caller now holds the key and must complete it
+        """
+        return [self.submission_cache.claim(key) for key in keys]
+
+    async def wait_submission(self, key: str) -> Optional[dict]:
+        """
+        Wait for another request's submission of a key.
+
+        Returns:
+            its receipt, None if it failed and the key can be claimed again
+        """
+        return await self.submission_cache.wait(key)
+
+    async def complete_submissions(self, receipts: List[Tuple[str, Optional[dict]]]) -> None:
+        """
+        Release claimed keys with the receipts returned for them, None or an error if the ballot wasn't submitted.
+        """
+        for key, receipt in receipts:
+            self.submission_cache.complete(key, receipt)
+
+    async def get_hashes(self, ledger: str, cursor: int, limit: int) -> dict:
+        """
+        Get a page of the "received" or "counted" hash ledger, see ledger.hashes_page.
+        """
+        return hashes_page(self._hash_ledger(ledger), cursor, limit)
+
+    async def find_hash(self, ledger: str, ballot_hash: str) -> dict:
+        """
+        Look a hash up in the "received" or "counted" hash ledger, see ledger.hash_lookup.
+        """
+        return hash_lookup(self._hash_ledger(ledger), ballot_hash)
+
+    async def get_tree_head(self) -> dict:
+        """
+        Get the signed head of the Merkle tree over received hashes, see merkle.sign_tree_head.
+        The head is signed again only once the tree has grown.
+        """
+        tree = self.received_hashes.tree
+        if self._signed_tree_head is None or self._signed_tree_head["tree_size"] != len(tree):
+            with timed("tree_head.sign"):
+                self._signed_tree_head = sign_tree_head(self.tree_signing_key, {
+                    "extended_base_hash": self.election_context.crypto_extended_base_hash.to_hex(),
+                    "tree_size": len(tree),
+                    "root_hash": tree.root().hex(),
+                    "timestamp": int(time.time())
+                })
+        return self._signed_tree_head
+
+    async def get_inclusion_proof(self, ballot_hash: str, tree_size: Optional[int]) -> dict:
+        """
+        Prove a hash is in the Merkle tree over received hashes, see ledger.inclusion_proof.
+        """
+        with timed("tree.inclusion_proof"):
+            return inclusion_proof(self.received_hashes, ballot_hash, tree_size)
+
+    async def get_consistency_proof(self, first: int, second: Optional[int]) -> dict:
+        """
+        Prove an earlier Merkle tree over received hashes is a prefix of a later one, see ledger.consistency_proof.
+        """
+        with timed("tree.consistency_proof"):
+            return consistency_proof(self.received_hashes, first, second)
+
+    @property
+    def context_hash(self) -> str:
+        """
+        Hex extended base hash of the election context, different for every election and set of keys.
+        """
+        return self.election_context.crypto_extended_base_hash.to_hex()
+
+    def _hash_ledger(self, ledger: str) -> HashLedger:
+        if ledger == "received":
+            return self.received_hashes
+        if ledger == "counted":
+            return self.counted_hashes
+        raise ValueError(f"Unknown hash ledger: {ledger}")
+
+    async def get_tally_snapshot(self) -> TallySnapshot:
+        """
+        Get the decrypted results, shared by every request while no ballots are cast, see TallySnapshots.get.
+        """
+        return await self.tally_snapshots.get()
+
+    async def wait_tally_snapshot(self, tag: str, timeout: float) -> TallySnapshot:
+        """
+        Wait for results other than the tagged ones, see TallySnapshots.wait.
+        """
+        return await self.tally_snapshots.wait(tag, timeout)
+
+    async def _decrypt_tally(self) -> Tuple[int, Optional[PlaintextTally]]:
+        """
+        Decrypt the running tally and return the plaintext tally.
+        Only tally shares are computed, so the cost depends on the number of contests, not ballots.
+
+        Returns:
+            number of cast ballots in the tally and the PlaintextTally of the election,
+            None if a guardian share couldn't be computed or combined
+        """
+        with timed("tally.snapshot"):
+            cast_count = sum(shard.running_tally.cast_count for shard in self.shards)
+            tally = merge_tallies(
+                    f"{self.ballotserver_name}-tally",
+                    [shard.running_tally.snapshot() for shard in self.shards]
+                )
+        with timed("tally.decrypt"):
+            return cast_count, await self.guardian_pool.decrypt_tally(tally)
     
-    def challenge_ballot(self, verification_code: str) -> PlaintextBallot:
+    async def challenge_ballot(self, verification_code: str) -> Optional[PlaintextTally]:
         """
-        Return the proof of ballot spoiling
+        Return the proof of ballot spoiling.
+        Only the requested ballot is decrypted and the result is cached by verification code.
+        Only decryptions are admitted as challenge jobs, cached ballots are returned straight away.
 
         Returns:
             Plaintext spoiled ballot matching verification code, None if not found
-
-        # TODO separate out the decryption encrypted tally portion
+        Raises:
+            Overloaded if the ballot has to be decrypted and the challenge queue is full
         """
-        encrypted_tally = self._create_encrypted_tally()
-        spoiled_ballots = get_ballots(self.datastore, BallotBoxState.SPOILED)
+        decrypted = self.challenge_cache.get(verification_code)
+        if decrypted is not None:
+            return decrypted
+
         # Return before decryption if ballot isn't there to begin with
-        if not spoiled_ballots.get(verification_code):
+        with timed("challenge.lookup"):
+            ballot = self._find_ballot(verification_code)
+        if ballot is None or ballot.state != BallotBoxState.SPOILED:
             return None
-        for ballot in spoiled_ballots.values():
-            encrypted_tally.append(ballot)
-        for guardian in self.guardians:
-            guardian_key = guardian.share_election_public_key()
-            tally_share = guardian.compute_tally_share(encrypted_tally, self.election_context)
-            # Only need to decrypt the one ballot
-            ballot_share = guardian.compute_ballot_shares([spoiled_ballots[verification_code]], self.election_context)
-            self.decryption_mediator.announce(guardian_key, tally_share, ballot_share)
-        # Decrypt the ballot
-        decrypted_ballots = self.decryption_mediator.get_plaintext_ballots([spoiled_ballots[verification_code]])
-        return decrypted_ballots[verification_code]
 
+        # Share one decryption between concurrent challenges of the same ballot
+        pending = self._pending_challenges.get(verification_code)
+        if pending is None:
+            pending = asyncio.ensure_future(self._decrypt_challenged_ballot(ballot))
+            self._pending_challenges[verification_code] = pending
+        return await asyncio.shield(pending)
+
+    async def _decrypt_challenged_ballot(self, ballot: SubmittedBallot) -> Optional[PlaintextTally]:
+        try:
+            async with scheduler.admit("challenge"):
+                with timed("challenge.decrypt"):
+                    decrypted = await self.guardian_pool.decrypt_ballot(ballot)
+            if decrypted is not None:
+                self.challenge_cache.set(ballot.object_id, decrypted)
+            return decrypted
+        finally:
+            del self._pending_challenges[ballot.object_id]
+
+    async def get_record_chunk(self, cursor: Optional[RecordCursor]) -> Tuple[bytes, Optional[RecordCursor]]:
+        """
+        Build the next chunk of the election record export, see publish.finish_chunk.
+
+        The record is the manifest, context, constants, guardian records and tallies, then every
+        ballot shard by shard, then the decryption of every spoiled ballot, as NDJSON records.
+        Ballots are read from the ballot stores a chunk at a time, never all at once.
+
+        Args:
+            cursor: where to continue, None to start a new export
+        Returns:
+            gzip members of the chunk, and the cursor of the next chunk, None after the last one
+        """
+        if cursor is None:
+            with timed("publish.header"):
+                records, next_cursor = await self._record_header()
+        elif cursor.section == "ballots":
+            # Reading ballots and checksumming them is the bulk of an export, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            with timed("publish.ballots"):
+                return await loop.run_in_executor(None, self._record_ballots, cursor)
+        else:
+            with timed("publish.spoiled"):
+                records, next_cursor = await self._record_spoiled(cursor)
+        return finish_chunk([compress_records(records)], next_cursor), next_cursor
+
+    async def _record_header(self) -> Tuple[List[bytes], RecordCursor]:
+        # Count the stored ballots and snapshot the tally without yielding, so the record's ballots add up to its tally
+        counts = [len(shard.datastore) for shard in self.shards]
+        tally = merge_tallies(
+                f"{self.ballotserver_name}-tally",
+                [shard.running_tally.snapshot() for shard in self.shards]
+            )
+        await self.flush()
+        bounds = [shard.datastore.end_position(count) for shard, count in zip(self.shards, counts)]
+        plaintext_tally = await self.guardian_pool.decrypt_tally(tally)
+        records = [
+            record("election_record", ballot_box_shards=len(self.shards), ballots=sum(counts)),
+            record("manifest", manifest=self.manifest.to_json_object()),
+            record("context", context=self.election_context.to_json_object()),
+            record("constants", constants=ElectionConstants().to_json_object()),
+            *(record("guardian", guardian=guardian.publish().to_json_object()) for guardian in self.guardians),
+            record("encrypted_tally", tally=tally.to_json_object()),
+            record("tally", tally=plaintext_tally.to_json_object() if plaintext_tally is not None else None)
+        ]
+        return records, RecordCursor("ballots", bounds, 0, 0, self.context_hash)
+
+    def _record_page(
+            self,
+            cursor: RecordCursor,
+            limit: int,
+            state: Optional[BallotBoxState]
+        ) -> Tuple[List[Tuple[int, int, bytes]], Optional[RecordCursor]]:
+        # Read up to limit ballots from the cursor on, moving through the shards. The cursor is None once the section ends.
+        page = []
+        shard, after = cursor.shard, cursor.after
+        while shard < len(self.shards) and len(page) < limit:
+            wanted = limit - len(page)
+            ballots = self.shards[shard].datastore.serialized_page(after, cursor.bounds[shard], wanted, state)
+            page.extend((shard, position, serialized) for position, serialized in ballots)
+            if len(ballots) == wanted:
+                after = ballots[-1][0]
+            else:
+                shard, after = shard + 1, 0
+        if shard == len(self.shards):
+            return page, None
+        return page, replace(cursor, shard=shard, after=after)
+
+    def _record_ballots(self, cursor: RecordCursor) -> Tuple[bytes, RecordCursor]:
+        page, next_cursor = self._record_page(cursor, PUBLISH_CHUNK_SIZE, None)
+        if next_cursor is None:
+            next_cursor = replace(cursor, section="spoiled", shard=0, after=0)
+        return finish_chunk(ballot_members("submitted_ballot", page), next_cursor), next_cursor
+
+    async def _record_spoiled(self, cursor: RecordCursor) -> Tuple[List[bytes], Optional[RecordCursor]]:
+        loop = asyncio.get_running_loop()
+        page, next_cursor = await loop.run_in_executor(None, self._record_page, cursor, SPOILED_CHUNK_SIZE, BallotBoxState.SPOILED)
+        ballots = [(shard, position, deserialize_ballot(serialized)) for shard, position, serialized in page]
+
+        async def decrypt(ballot: SubmittedBallot) -> Optional[PlaintextTally]:
+            # Reuse challenge decryptions, but don't push voters' challenges out of the cache with the whole box
+            decrypted = self.challenge_cache.get(ballot.object_id)
+            return decrypted if decrypted is not None else await self.guardian_pool.decrypt_ballot(ballot)
+
+        decrypted = await asyncio.gather(*(decrypt(ballot) for _, _, ballot in ballots))
+        records = [
+            record(
+                "spoiled_ballot",
+                shard=shard,
+                position=position,
+                object_id=ballot.object_id,
+                ballot=plaintext.to_json_object() if plaintext is not None else None
+            )
+            for (shard, position, ballot), plaintext in zip(ballots, decrypted)
+        ]
+        return records, next_cursor
+
+
+class RemoteElection(Election):
+    """
+    The election as seen by an HTTP worker in multi-worker mode.
+
+    Ballot info, marking and encryption are handled in the worker. Everything that needs the
+    guardians, ballot store or tally is a call to the coordinator process that owns them.
+    """
+    coordinator: CoordinatorClient
+    _tally_waits: Dict[str, asyncio.Future]
+
+    def __init__(self, election_id: str, coordinator: CoordinatorClient):
+        """
+        Args:
+            election_id: id of the election at the coordinator
+            coordinator: client of the coordinator, shared by the worker's elections
+        """
+        super().__init__(election_id)
+        self.coordinator = coordinator
+        self._tally_waits = dict()
+
+    def initialize_election(self, election_config: BallotServerElectionConfig):
+        self.ballotserver_name = election_config.ballotserver_name
+        self.storage_dir = election_config.storage_dir
+        self._load_manifest(election_config.manifest_path)
+        # Also loads the election in the coordinator if it isn't loaded there
+        election_info = self.coordinator.call_blocking("get_context", COORDINATOR_TIMEOUT, self.election_id)
+        self.election_context = CiphertextElectionContext.from_json_object(election_info["context"])
+        self.internal_manifest = InternalManifest(self.manifest)
+        if self.internal_manifest.manifest_hash.to_hex() != election_info["manifest_hash"]:
+            raise ValueError(f"Manifest {election_config.manifest_path} doesn't match the election coordinator's")
+        self._selections = sum(
+            len(contest.ballot_selections) + len(contest.placeholder_selections)
+            for contest in self.internal_manifest.contests
+        )
+
+    def start(self, encryption_workers: EncryptionWorkers, decryption_executor: Optional[Executor]):
+        # The coordinator verifies and chains ballots, workers only encrypt
+        self._create_encryption_pool(encryption_workers)
+
+    def store_election_state(self, storage_dir: str):
+        # The coordinator owns all stored state
+        pass
+
+    def shutdown(self):
+        self.encryption_pool.shutdown()
+        for waiting in list(self._tally_waits.values()):
+            waiting.cancel()
+
+    @property
+    def evictable(self) -> bool:
+        return True
+
+    def memory_size(self) -> int:
+        return ELECTION_BYTES + SELECTION_BYTES * self._selections + self.encryption_pool.pads.nbytes
+
+    def gauge_values(self) -> Dict[str, float]:
+        pads = self.encryption_pool.pads
+        return {
+            "ballotserver_precompute_pads": len(pads),
+            "ballotserver_precompute_hits": pads.hits,
+            "ballotserver_precompute_misses": pads.misses
+        }
+
+    async def submit_ballots(self, ballots: List[Tuple[Optional[CiphertextBallot], str]]) -> List[dict]:
+        return await self.coordinator.call(
+                "submit_ballots",
+                self.election_id,
+                ballots=[
+                    (encrypted_ballot.to_json_object(strip_privates=False) if encrypted_ballot is not None else None, action)
+                    for encrypted_ballot, action in ballots
+                ]
+            )
 
-router = APIRouter()
+    async def claim_submissions(self, keys: List[str]) -> List[Optional[dict]]:
+        return await self.coordinator.call("claim_submissions", self.election_id, keys=keys)
 
-election = Election()
+    async def wait_submission(self, key: str) -> Optional[dict]:
+        return await self.coordinator.call("wait_submission", self.election_id, key=key)
+
+    async def complete_submissions(self, receipts: List[Tuple[str, Optional[dict]]]) -> None:
+        await self.coordinator.call("complete_submissions", self.election_id, receipts=receipts)
+
+    async def get_tally_snapshot(self) -> TallySnapshot:
+        # The coordinator decrypts once for every worker
+        body = await self.coordinator.call("get_tally_snapshot", self.election_id)
+        if body is None:
+            raise TallyUnavailable("The tally couldn't be decrypted, try again later")
+        return TallySnapshot.from_body(body)
+
+    async def wait_tally_snapshot(self, tag: str, timeout: float) -> TallySnapshot:
+        # Live feeds of the worker waiting for the same results share one call
+        waiting = self._tally_waits.get(tag)
+        if waiting is None:
+            waiting = asyncio.ensure_future(
+                    self.coordinator.call("wait_tally_snapshot", self.election_id, tag=tag, timeout=timeout)
+                )
+            self._tally_waits[tag] = waiting
+            waiting.add_done_callback(lambda _: self._tally_waits.pop(tag, None))
+        body = await asyncio.shield(waiting)
+        if body is None:
+            raise TallyUnavailable("The tally couldn't be decrypted, try again later")
+        return TallySnapshot.from_body(body)
+
+    async def challenge_ballot(self, verification_code: str) -> Optional[PlaintextTally]:
+        challenged = await self.coordinator.call("challenge_ballot", self.election_id, verification_code=verification_code)
+        return PlaintextTally.from_json_object(challenged) if challenged is not None else None
+
+    async def get_record_chunk(self, cursor: Optional[RecordCursor]) -> Tuple[bytes, Optional[RecordCursor]]:
+        chunk, next_cursor = await self.coordinator.call(
+                "get_record_chunk",
+                self.election_id,
+                cursor=cursor.encode() if cursor is not None else None
+            )
+        if next_cursor is None:
+            return b64decode(chunk), None
+        return b64decode(chunk), RecordCursor.decode(next_cursor, BALLOT_BOX_SHARDS, self.context_hash)
+
+    async def get_hashes(self, ledger: str, cursor: int, limit: int) -> dict:
+        return await self.coordinator.call("get_hashes", self.election_id, ledger=ledger, cursor=cursor, limit=limit)
+
+    async def find_hash(self, ledger: str, ballot_hash: str) -> dict:
+        return await self.coordinator.call("find_hash", self.election_id, ledger=ledger, ballot_hash=ballot_hash)
+
+    async def get_tree_head(self) -> dict:
+        return await self.coordinator.call("get_tree_head", self.election_id)
+
+    async def get_inclusion_proof(self, ballot_hash: str, tree_size: Optional[int]) -> dict:
+        return await self.coordinator.call("get_inclusion_proof", self.election_id, ballot_hash=ballot_hash, tree_size=tree_size)
+
+    async def get_consistency_proof(self, first: int, second: Optional[int]) -> dict:
+        return await self.coordinator.call("get_consistency_proof", self.election_id, first=first, second=second)
+
+
+coordinator = CoordinatorClient(COORDINATOR_SOCKET) if BALLOTSERVER_ROLE == "worker" else None
+
+
+def _new_election(election_id: str) -> Election:
+    if coordinator is not None:
+        return RemoteElection(election_id, coordinator)
+    return Election(election_id)
+
+
+elections = ElectionRegistry(_new_election, ELECTION_MEMORY_BUDGET * 1024 * 1024)
+
+# Gauges of each election, summed over the elections loaded in the process
+ELECTION_GAUGES = {
+    "ballotserver_precompute_pads": "Precomputed encryption pads ready",
+    "ballotserver_precompute_hits": "Ballots encrypted with precomputed pads",
+    "ballotserver_precompute_misses": "Ballots encrypted without pads because the pool ran short",
+    "ballotserver_ballots_cast": "Cast ballots in the running tally",
+    "ballotserver_ballots_stored": "Cast and spoiled ballots in the ballot store",
+    "ballotserver_challenge_cache_entries": "Decrypted spoiled ballots cached",
+    "ballotserver_submission_cache_entries": "Submission receipts kept for retries",
+    "ballotserver_submission_cache_hits": "Retried submissions answered with the original receipt",
+    "ballotserver_received_hashes": "Hashes in the received hash ledger",
+    "ballotserver_counted_hashes": "Hashes in the counted hash ledger",
+    "ballotserver_tally_snapshots": "Tally snapshots decrypted"
+}
+
+for _name, _help in ELECTION_GAUGES.items():
+    register_gauge(
+            _name,
+            _help,
+            partial(lambda name: sum(e.gauge_values().get(name, 0) for e in elections.loaded().values()), _name)
+        )
+
+
+async def metrics_snapshots() -> List[Tuple[Dict[str, str], dict]]:
+    """
+    Metrics of every process serving the elections, see metrics.render.
+    """
+    if coordinator is not None:
+        return [
+            ({"role": "worker", "pid": str(os.getpid())}, snapshot()),
+            ({"role": "coordinator"}, await coordinator.call("get_metrics"))
+        ]
+    return [({}, snapshot())]
+
+
+async def hosted_election(request: Request) -> AsyncIterator[Election]:
+    """
+    Dependency giving the election a request is for, leased for the whole request.
+    Routes under /elections/{election_id} serve that election, the others the default one.
+
+    Raises:
+        HTTPException 404 if there is no such election
+    """
+    election_id = request.path_params.get("election_id", DEFAULT_ELECTION)
+    try:
+        async with elections.use(election_id) as election:
+            yield election
+    except UnknownElection as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+router = APIRouter(route_class=FastJSONRoute, default_response_class=ORJSONResponse)
 
 
 @router.get("/result")
-async def tally():
+async def tally(
+        if_none_match: Optional[str] = Header(None),
+        election: Election = Depends(hosted_election)
+    ):
     """
     Get the results of all election tallies.
 
+    Results are decrypted at most every RESULT_SNAPSHOT_INTERVAL seconds while ballots are being
+    cast and shared by every request. The ETag changes with the results, a client sending it back
+    in If-None-Match gets 304 until there are new ones.
+
     Returns:
-        Tally results for each contest in the election
-    """
-    tally = election.get_election_tally()
-    results = {
-        "contests": [
-            {
-                "contest": contest,
-                "selections": [
-                    {
-                        "selection": selection,
-                        "tally": selection_details.tally
-                    } for selection, selection_details in contest_details.selections.items()
-                ]
-            } for contest, contest_details in tally.contests.items()
-        ]
-    }
-    return results
+        Tally results for each contest in the election, with the number of cast ballots they
+        include as version and when they were decrypted
+    Raises:
+        TallyUnavailable, answered with 503, if the tally couldn't be decrypted and there are no earlier results
+    """
+    snapshot = await election.get_tally_snapshot()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, snapshot):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.encoded, media_type="application/json", headers=headers)
+
+
+@router.get("/result/stream")
+async def tally_stream(
+        last_event_id: Optional[str] = Header(None),
+        election: Election = Depends(hosted_election)
+    ):
+    """
+    Follow the results as Server-Sent Events: a "result" event with the JSON of /election/result
+    for the latest results and again for each new snapshot, with its ETag value as event id.
+    A reconnecting client sending Last-Event-ID only gets results it hasn't seen.
+
+    Returns:
+        text/event-stream of the results
+    """
+    snapshot = await election.get_tally_snapshot()
+    return stream_results(snapshot, election.wait_tally_snapshot, last_event_id, RESULT_STREAM_KEEPALIVE)
 
 
 @router.get("/publish")
-async def publish():
-    return {"hi": "there"}
+async def publish(cursor: Optional[str] = None, election: Election = Depends(hosted_election)):
+    """
+    Download the election record as gzip-compressed NDJSON, streamed from the ballot stores.
+
+    Every chunk is its own gzip member ending in a "resume" record, the last one in an "end" record.
+    A download cut short is resumed by passing the cursor of its last resume record.
+
+    Args:
+        cursor: cursor of a resume record, none to start from the beginning
+    Returns:
+        streamed election-record.ndjson.gz
+    Raises:
+        HTTPException 400 if the cursor isn't one of this election's
+    """
+    try:
+        start = RecordCursor.decode(cursor, BALLOT_BOX_SHARDS, election.context_hash) if cursor is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await stream_record(election.get_record_chunk, start)
 
 @router.get("/hashes")
-async def get_counted_hashes():
+async def get_counted_hashes(
+        cursor: int = Query(0, ge=0),
+        limit: int = Query(HASH_PAGE_SIZE, ge=1, le=HASH_PAGE_SIZE),
+        format: str = Query("json", regex="^(json|ndjson)$"),
+        election: Election = Depends(hosted_election)
+    ):
     """
-    Get the hash of every ballot that was counted
-    :return: JSON array with all the hashes as strings
+    Get the hashes of counted ballots in the order they were counted
+
+    Args:
+        cursor: position of the first hash, next_cursor of the previous page
+        limit: maximum number of hashes in a JSON page
+        format: "json" for one page, "ndjson" to stream every hash from cursor on
+    Returns:
+        JSON page with the hashes and next_cursor, or an NDJSON stream of hashes
+    """
+    if format == "ndjson":
+        return stream_hashes(partial(election.get_hashes, "counted"), cursor)
+    return await election.get_hashes("counted", cursor, limit)
+
+
+@router.get("/hashes/{ballot_hash}")
+async def get_counted_hash(ballot_hash: str, election: Election = Depends(hosted_election)):
+    """
+    Check whether a ballot hash was counted
+
+    Returns:
+        JSON with whether the hash is present and its position
     """
-    with open(os.path.join(STORAGE_DIR, COUNTED_HASH_FILE), "r") as f:
-        contents = f.read()
-        return {"hashes": contents.splitlines()}
+    return await election.find_hash("counted", ballot_hash)
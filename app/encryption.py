@@ -0,0 +1,305 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from electionguard.ballot import CiphertextBallot, PlaintextBallot, make_ciphertext_ballot
+from electionguard.ballot_validator import ballot_is_valid_for_election
+from electionguard.election import CiphertextElectionContext
+from electionguard.encrypt import EncryptionDevice, encrypt_ballot
+from electionguard.group import ElementModQ
+from electionguard.manifest import InternalManifest
+from typing import Dict, List, Optional
+import asyncio
+import logging
+
+from .cache import LRUCache
+from .manifest import load_manifest_from_file
+from .metrics import timed
+from .precompute import Pad, PadPool, check_pad_encryption, compute_pads, encrypt_with_pads, pads_per_style
+
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+# Pads computed per executor call, small enough that a ballot arriving meanwhile barely waits
+PRECOMPUTE_BATCH = 8
+
+# Internal manifests of the elections each worker process has encrypted for, by extended base hash.
+# A worker loads an election's manifest the first time it gets one of its ballots, so the manifest
+# isn't pickled with every ballot.
+WORKER_MANIFESTS = 64
+_worker_manifests: LRUCache[InternalManifest] = LRUCache(WORKER_MANIFESTS)
+
+
+def _worker_manifest(manifest_path: str, context: CiphertextElectionContext) -> InternalManifest:
+    key = context.crypto_extended_base_hash.to_hex()
+    internal_manifest = _worker_manifests.get(key)
+    if internal_manifest is None:
+        internal_manifest = InternalManifest(load_manifest_from_file(manifest_path))
+        if internal_manifest.manifest_hash != context.manifest_hash:
+            raise ValueError(f"Manifest {manifest_path} changed since the election was loaded")
+        _worker_manifests.set(key, internal_manifest)
+    return internal_manifest
+
+
+def _encrypt_in_worker(manifest_path: str, context: CiphertextElectionContext, ballot: PlaintextBallot) -> Optional[CiphertextBallot]:
+    return encrypt_unchained(ballot, _worker_manifest(manifest_path, context), context)
+
+
+def _encrypt_with_pads_in_worker(
+        manifest_path: str,
+        context: CiphertextElectionContext,
+        ballot: PlaintextBallot,
+        pads: List[Pad]
+    ) -> Optional[CiphertextBallot]:
+    return encrypt_with_pads(ballot, _worker_manifest(manifest_path, context), context, pads)
+
+
+def _verify_in_worker(manifest_path: str, context: CiphertextElectionContext, ballot: CiphertextBallot) -> bool:
+    return ballot_is_valid_for_election(ballot, _worker_manifest(manifest_path, context), context)
+
+
+def create_executor(mode: str, workers: Optional[int], thread_name_prefix: str) -> Optional[Executor]:
+    """
+    Create the executor of an executor mode.
+
+    Args:
+        mode: "inline", "thread" or "process"
+        workers: number of pool workers, defaults to the executor's own default
+        thread_name_prefix: name of the threads in "thread" mode
+    Returns:
+        the executor, None in "inline" mode
+    Raises:
+        ValueError if mode is unknown
+    """
+    if mode not in EXECUTOR_MODES:
+        raise ValueError(f"Unknown executor mode: {mode}")
+    if mode == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if mode == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+    return None
+
+
+def encrypt_unchained(
+        ballot: PlaintextBallot,
+        internal_manifest: InternalManifest,
+        context: CiphertextElectionContext
+    ) -> Optional[CiphertextBallot]:
+    """
+    Encrypt a ballot and verify its proofs without linking it into a device's ballot chain.
+
+    The ballot code is seeded with the manifest hash as a placeholder. It is replaced by
+    EncryptionPool.chain once the ballot's position in the chain is known.
+
+    Args:
+        ballot: plaintext ballot to encrypt
+        internal_manifest: internal manifest of the election
+        context: election context holding the joint public key
+    Returns:
+        CiphertextBallot with verified proofs, None if the ballot could not be encrypted
+    """
+    return encrypt_ballot(ballot, internal_manifest, context, internal_manifest.manifest_hash)
+
+
+class BallotChain():
+    """
+    Links encrypted ballots into the chain of ballot codes of one encryption device.
+    """
+    _encryption_seed: ElementModQ
+
+    def __init__(self, encryption_device: EncryptionDevice):
+        self._encryption_seed = encryption_device.get_hash()
+
+    def chain(self, ballot: CiphertextBallot) -> CiphertextBallot:
+        """
+        Link an encrypted ballot into the device's ballot chain.
+        Must be called in the order ballots are cast or spoiled.
+
+        Args:
+            ballot: ballot returned by EncryptionPool.encrypt()
+        Returns:
+            Copy of the ballot with its code seeded by the previous ballot's code
+        """
+        chained = make_ciphertext_ballot(
+                ballot.object_id,
+                ballot.style_id,
+                ballot.manifest_hash,
+                self._encryption_seed,
+                ballot.contests,
+                ballot.nonce
+            )
+        self._encryption_seed = chained.code
+        return chained
+
+
+class EncryptionWorkers():
+    """
+    Executor shared by the encryption pools of every election a process serves, so loading an
+    election doesn't start worker processes of its own.
+
+    Ballots in flight are counted across elections. Pads are only precomputed while no ballot of
+    any election is being encrypted, one batch at a time whichever election it is for.
+    Must be created on the event loop.
+    """
+    mode: str
+    executor: Optional[Executor]
+    in_flight: int
+    idle: asyncio.Event
+    precompute_lock: asyncio.Lock
+
+    def __init__(self, mode: str = "process", workers: Optional[int] = None):
+        """
+        Args:
+            mode: "inline" to encrypt on the calling thread, "thread" or "process" for a worker pool
+            workers: number of pool workers, defaults to the executor's own default
+        Raises:
+            ValueError if mode is unknown
+        """
+        self.mode = mode
+        self.executor = create_executor(mode, workers, "ballot-encryption")
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.precompute_lock = asyncio.Lock()
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+class EncryptionPool():
+    """
+    Encrypts and verifies one election's ballots off the event loop.
+
+    The expensive part of encryption (ElGamal encryptions and Chaum-Pedersen proofs) doesn't
+    depend on the previous ballot, so it runs concurrently on the shared EncryptionWorkers, and so
+    does checking the proofs. Only BallotChain.chain() has to be called in cast/spoil order, and it is a single hash.
+
+    Once start_precompute() is called, the workers also fill the election's pool of pads whenever no
+    ballot is being encrypted, and ballots are encrypted from the pool with multiplications only while it lasts.
+    Pads are only used once a ballot of every style encrypted with them has passed check_pad_encryption.
+    """
+    internal_manifest: InternalManifest
+    context: CiphertextElectionContext
+    manifest_path: str
+    pads: PadPool
+    _workers: EncryptionWorkers
+    _pads_per_style: Dict[str, int]
+    _precompute_task: Optional[asyncio.Task]
+
+    def __init__(
+            self,
+            internal_manifest: InternalManifest,
+            context: CiphertextElectionContext,
+            manifest_path: str,
+            workers: EncryptionWorkers,
+            precompute_size: int = 0
+        ):
+        """
+        Args:
+            internal_manifest: internal manifest of the election
+            context: election context holding the joint public key
+            manifest_path: manifest file of the election, worker processes load the manifest from it
+            workers: executor to encrypt and verify on
+            precompute_size: most precomputed pads kept, 0 disables precomputation
+        """
+        self.internal_manifest = internal_manifest
+        self.context = context
+        self.manifest_path = manifest_path
+        self.pads = PadPool(precompute_size)
+        self._workers = workers
+        self._pads_per_style = pads_per_style(internal_manifest)
+        self._precompute_task = None
+
+    async def encrypt(self, ballot: PlaintextBallot) -> Optional[CiphertextBallot]:
+        """
+        Encrypt a ballot without blocking the event loop.
+
+        Args:
+            ballot: plaintext ballot to encrypt
+        Returns:
+            Unchained CiphertextBallot, None if the ballot could not be encrypted
+        """
+        pads = None
+        pads_needed = self._pads_per_style.get(ballot.style_id)
+        if self.pads.size and pads_needed is not None:
+            pads = self.pads.take(pads_needed)
+        self._workers.in_flight += 1
+        try:
+            if pads is not None:
+                with timed("encrypt.with_pads"):
+                    return await self._run(
+                            _encrypt_with_pads_in_worker, (ballot, pads),
+                            encrypt_with_pads, (ballot, self.internal_manifest, self.context, pads)
+                        )
+            if self._workers.executor is None:
+                return encrypt_unchained(ballot, self.internal_manifest, self.context)
+            return await self._run(
+                    _encrypt_in_worker, (ballot,),
+                    encrypt_unchained, (ballot, self.internal_manifest, self.context)
+                )
+        finally:
+            self._workers.in_flight -= 1
+            if self._workers.in_flight == 0:
+                self._workers.idle.set()
+
+    async def _run(self, worker_function, worker_args: tuple, function, args: tuple):
+        # Worker processes get the manifest path and context to find the election's manifest, threads get the manifest itself
+        loop = asyncio.get_running_loop()
+        if self._workers.mode == "process":
+            return await loop.run_in_executor(
+                    self._workers.executor, worker_function, self.manifest_path, self.context, *worker_args
+                )
+        # Inline mode computes on the default thread pool rather than blocking the event loop
+        return await loop.run_in_executor(self._workers.executor, function, *args)
+
+    def start_precompute(self) -> None:
+        """
+        Start filling the pad pool in the background, on the encryption workers while they are idle.
+        Must be called from the event loop, does nothing if precomputation is disabled.
+        """
+        if self.pads.size and self._precompute_task is None:
+            self._precompute_task = asyncio.ensure_future(self._precompute())
+
+    async def _precompute(self) -> None:
+        workers = self._workers
+        loop = asyncio.get_running_loop()
+        with timed("precompute.check"):
+            error = await loop.run_in_executor(None, check_pad_encryption, self.internal_manifest, self.context)
+        if error is not None:
+            logger.error(f"{error}, encrypting without precomputed pads")
+            self.pads.size = 0
+            return
+        while True:
+            if workers.in_flight or not self.pads.missing:
+                workers.idle.clear()
+                await workers.idle.wait()
+                continue
+            async with workers.precompute_lock:
+                # Another election's batch or a ballot may have come first
+                if workers.in_flight:
+                    continue
+                with timed("precompute.batch"):
+                    pads = await loop.run_in_executor(
+                            workers.executor, compute_pads, self.context.elgamal_public_key, PRECOMPUTE_BATCH
+                        )
+            self.pads.add(pads)
+
+    async def verify(self, ballot: CiphertextBallot) -> bool:
+        """
+        Check an encrypted ballot's proofs and that it matches the manifest, without blocking the event loop.
+
+        Returns:
+            True if the ballot is valid for the election
+        """
+        if self._workers.executor is None:
+            return ballot_is_valid_for_election(ballot, self.internal_manifest, self.context)
+        return await self._run(
+                _verify_in_worker, (ballot,),
+                ballot_is_valid_for_election, (ballot, self.internal_manifest, self.context)
+            )
+
+    def shutdown(self) -> None:
+        """
+        Stop precomputing pads, the shared workers are shut down by their owner.
+        """
+        if self._precompute_task is not None:
+            self._precompute_task.cancel()
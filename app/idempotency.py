@@ -0,0 +1,161 @@
+from typing import Dict, Optional, TextIO, Tuple
+import asyncio
+import json
+import os
+import time
+
+from .cache import LRUCache
+
+
+# Returned by SubmissionCache.claim() while another request is submitting the same ballot
+IN_FLIGHT = {"in_flight": True}
+
+
+class SubmissionCache():
+    """
+    Receipts of submitted ballots by idempotency key, so a retried submission gets the original
+    receipt back instead of being encrypted and submitted a second time.
+
+    Receipts expire after a TTL and the least recently used are evicted once the cache is full.
+    They are appended to a JSON lines file, which is reloaded at startup and rewritten with only
+    the live receipts whenever it grows to twice the cache size.
+    A key is claimed while its ballot is being submitted, concurrent duplicates wait for that submission.
+    """
+    path: Optional[str]
+    ttl: float
+    hits: int
+    _receipts: LRUCache[Tuple[float, dict]]
+    _in_flight: Dict[str, asyncio.Future]
+    _file: Optional[TextIO]
+    _lines: int
+
+    def __init__(self, path: Optional[str], max_size: int, ttl: float):
+        """
+        Args:
+            path: receipts file, None to keep receipts in memory only
+            max_size: most receipts kept, 0 disables the cache
+            ttl: seconds a receipt is kept after its ballot was submitted
+        """
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self._receipts = LRUCache(max_size)
+        self._in_flight = dict()
+        self._file = None
+        self._lines = 0
+        if path is None or max_size <= 0:
+            return
+
+        if os.path.exists(path):
+            now = time.time()
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line can be cut short by a crash
+                        continue
+                    if entry["expires_at"] > now:
+                        self._receipts.set(entry["key"], (entry["expires_at"], entry["receipt"]))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._compact()
+
+    def __len__(self) -> int:
+        return len(self._receipts)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of keys claimed and not completed yet.
+        """
+        return len(self._in_flight)
+
+    @staticmethod
+    def _line(key: str, expires_at: float, receipt: dict) -> str:
+        return json.dumps({"key": key, "expires_at": expires_at, "receipt": receipt}) + "\n"
+
+    def _compact(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            for key, (expires_at, receipt) in self._receipts.items():
+                f.write(self._line(key, expires_at, receipt))
+        os.replace(temp_path, self.path)
+        self._lines = len(self._receipts)
+        self._file = open(self.path, "a")
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Get the receipt of a submitted ballot.
+
+        Returns:
+            the receipt, None if the key wasn't submitted or its receipt expired or was evicted
+        """
+        entry = self._receipts.get(key)
+        if entry is None:
+            return None
+        expires_at, receipt = entry
+        if expires_at <= time.time():
+            self._receipts.pop(key)
+            return None
+        return receipt
+
+    def claim(self, key: str) -> Optional[dict]:
+        """
+        Claim a key before submitting its ballot.
+
+        Returns:
+            the original receipt if the key was already submitted, IN_FLIGHT if another request
+            is submitting it, None if the caller now holds the key and must complete() it
+        """
+        receipt = self.get(key)
+        if receipt is None and key in self._in_flight:
+            receipt = IN_FLIGHT
+        if receipt is not None:
+            self.hits += 1
+            return receipt
+        self._in_flight[key] = asyncio.get_event_loop().create_future()
+        return None
+
+    async def wait(self, key: str) -> Optional[dict]:
+        """
+        Wait for the request holding a key to complete it.
+
+        Returns:
+            the receipt, None if that submission failed and the key can be claimed again
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            return self.get(key)
+        return await asyncio.shield(future)
+
+    def complete(self, key: str, receipt: Optional[dict]) -> None:
+        """
+        Release a claimed key, keeping its receipt if the ballot was submitted.
+
+        Args:
+            key: key returned as claimed by claim()
+            receipt: receipt returned to the client, None or an error to let the ballot be submitted again
+        """
+        if receipt is not None and "error" in receipt:
+            receipt = None
+        if receipt is not None:
+            expires_at = time.time() + self.ttl
+            self._receipts.set(key, (expires_at, receipt))
+            if self._file is not None:
+                # Not fsynced, the ballot itself is already durable. A receipt lost in a power
+                # failure only means a retry is rejected as a duplicate ballot.
+                self._file.write(self._line(key, expires_at, receipt))
+                self._file.flush()
+                self._lines += 1
+                if self._lines >= 2 * self._receipts.max_size:
+                    self._compact()
+        future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(receipt)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
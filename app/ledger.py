@@ -0,0 +1,246 @@
+from concurrent.futures import Future
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+import asyncio
+import logging
+import os
+import threading
+
+from .merkle import MerkleTree
+from .packed import PackedHashes
+
+logger = logging.getLogger(__name__)
+
+
+class HashLedger():
+    """
+    Append-only file of ballot hashes, one per line, with a packed in-memory index.
+
+    Appends go to memory immediately and are written by a background thread that batches
+    every hash appended while the previous write was being fsynced. Reads never touch the file.
+    A ledger can also keep a Merkle tree over its hashes, rebuilt from the file at startup.
+    """
+    path: str
+    tree: Optional[MerkleTree]
+    _hashes: PackedHashes
+    _pending: List[str]
+    _pending_future: Future
+    _last_future: Optional[Future]
+    _cond: threading.Condition
+    _closing: bool
+    _writer: threading.Thread
+
+    def __init__(self, path: str, merkle: bool = False):
+        """
+        Args:
+            path: ledger file, created if missing and indexed if it already exists
+            merkle: keep a Merkle tree with one leaf per hash, in ledger order
+        """
+        self.path = path
+        self.tree = MerkleTree() if merkle else None
+        self._hashes = PackedHashes()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    self._add(line.rstrip("\n"))
+
+        self._pending = list()
+        self._pending_future = Future()
+        self._last_future = None
+        self._cond = threading.Condition()
+        self._closing = False
+        self._writer = threading.Thread(target=self._write_loop, name=f"hash-ledger-writer-{os.path.basename(path)}", daemon=True)
+        self._writer.start()
+
+    def _add(self, ballot_hash: str) -> None:
+        if ballot_hash and self._hashes.position(ballot_hash) is None:
+            self._hashes.append(ballot_hash)
+            if self.tree is not None:
+                self.tree.append(ballot_hash.encode())
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held in memory by the ledger's packed hashes and Merkle tree.
+        """
+        return self._hashes.nbytes + (self.tree.nbytes if self.tree is not None else 0)
+
+    def __contains__(self, ballot_hash: str) -> bool:
+        return self._hashes.position(ballot_hash) is not None
+
+    def append(self, ballot_hash: str) -> None:
+        """
+        Record a ballot hash, hashes already in the ledger are ignored.
+
+        Args:
+            ballot_hash: hex string of the ballot hash
+        """
+        if ballot_hash in self:
+            return
+        self._add(ballot_hash)
+        with self._cond:
+            self._pending.append(ballot_hash)
+            self._last_future = self._pending_future
+            self._cond.notify()
+
+    def position(self, ballot_hash: str) -> Optional[int]:
+        """
+        Get the position of a hash in the ledger.
+
+        Returns:
+            zero-based position, None if the hash isn't in the ledger
+        """
+        return self._hashes.position(ballot_hash)
+
+    def page(self, cursor: int, limit: int) -> List[str]:
+        """
+        Get up to limit hashes starting at position cursor.
+        """
+        return self._hashes.page(cursor, limit)
+
+    def _write_loop(self) -> None:
+        with open(self.path, "a") as f:
+            while True:
+                with self._cond:
+                    while not self._pending and not self._closing:
+                        self._cond.wait()
+                    if not self._pending:
+                        break
+                    hashes, future = self._pending, self._pending_future
+                    self._pending, self._pending_future = list(), Future()
+                try:
+                    f.write("".join(f"{ballot_hash}\n" for ballot_hash in hashes))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    future.set_result(len(hashes))
+                except Exception as e:
+                    logger.exception(f"Writing {self.path} failed")
+                    future.set_exception(e)
+
+    async def flush(self) -> None:
+        """
+        Wait until every hash appended so far is on disk.
+        """
+        future = self._last_future
+        if future is not None and not future.done():
+            await asyncio.wrap_future(future)
+        elif future is not None:
+            future.result()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._writer.join()
+
+
+def hashes_page(ledger: HashLedger, cursor: int, limit: int) -> dict:
+    """
+    Build a page of a hash ledger for the /hashes endpoints.
+
+    Args:
+        ledger: ledger to read
+        cursor: position of the first hash to return
+        limit: maximum number of hashes to return
+    Returns:
+        JSON structure with the hashes, the cursor for the next page (None at the end) and the ledger size
+    """
+    hashes = ledger.page(cursor, limit)
+    next_cursor = cursor + len(hashes)
+    return {
+        "hashes": hashes,
+        "next_cursor": next_cursor if next_cursor < len(ledger) else None,
+        "total": len(ledger)
+    }
+
+
+def stream_hashes(get_page: Callable[[int, int], Awaitable[dict]], cursor: int, chunk_size: int = 1000) -> StreamingResponse:
+    """
+    Stream a hash ledger from a position as NDJSON, one JSON string per line.
+    The stream ends at the ledger size when the request was made.
+
+    Args:
+        get_page: coroutine function returning hashes_page(ledger, cursor, limit) for the ledger
+        cursor: position of the first hash to stream
+        chunk_size: number of hashes fetched at a time
+    """
+    async def lines() -> AsyncIterator[str]:
+        page = await get_page(cursor, chunk_size)
+        end = page["total"]
+        position = cursor
+        while page["hashes"]:
+            hashes = page["hashes"][:end - position]
+            yield "".join(f"\"{ballot_hash}\"\n" for ballot_hash in hashes)
+            position += len(hashes)
+            if position >= end:
+                break
+            page = await get_page(position, chunk_size)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def hash_lookup(ledger: HashLedger, ballot_hash: str) -> dict:
+    """
+    Check whether a hash is in a ledger for the /hashes/{hash} endpoints.
+    """
+    ballot_hash = ballot_hash.upper()
+    position = ledger.position(ballot_hash)
+    return {
+        "hash": ballot_hash,
+        "present": position is not None,
+        "position": position
+    }
+
+
+def inclusion_proof(ledger: HashLedger, ballot_hash: str, tree_size: Optional[int]) -> dict:
+    """
+    Prove a hash is in a ledger's Merkle tree for the /inclusion/{hash} endpoint.
+
+    Args:
+        ledger: ledger with a Merkle tree
+        ballot_hash: hex ballot hash, the leaf data
+        tree_size: size of the tree to prove inclusion in, the current size if None
+    Returns:
+        JSON structure with the leaf index, the tree size and root and the hex audit path
+        ordered from the leaf up, or an error if the tree size is out of range
+    """
+    ballot_hash = ballot_hash.upper()
+    tree_size = len(ledger.tree) if tree_size is None else tree_size
+    if not 0 <= tree_size <= len(ledger.tree):
+        return {"error": f"Tree size {tree_size} is outside 0 to {len(ledger.tree)}"}
+    position = ledger.position(ballot_hash)
+    if position is None or position >= tree_size:
+        return {"hash": ballot_hash, "present": False, "tree_size": tree_size}
+    path = ledger.tree.inclusion_proof(position, tree_size)
+    return {
+        "hash": ballot_hash,
+        "present": True,
+        "leaf_index": position,
+        "tree_size": tree_size,
+        "root_hash": ledger.tree.root(tree_size).hex(),
+        "audit_path": [node.hex() for node in path]
+    }
+
+
+def consistency_proof(ledger: HashLedger, first: int, second: Optional[int]) -> dict:
+    """
+    Prove a ledger's Merkle tree of size first is a prefix of the tree of size second, for the /consistency endpoint.
+
+    Returns:
+        JSON structure with both tree sizes and roots and the hex proof, or an error if a size is out of range
+    """
+    second = len(ledger.tree) if second is None else second
+    try:
+        proof = ledger.tree.consistency_proof(first, second)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {
+        "first": first,
+        "second": second,
+        "first_root": ledger.tree.root(first).hex(),
+        "second_root": ledger.tree.root(second).hex(),
+        "proof": [node.hex() for node in proof]
+    }
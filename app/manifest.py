@@ -1,5 +1,8 @@
-from electionguard.manifest import Manifest
+from dataclasses import dataclass
+from electionguard.manifest import BallotStyle, Candidate, ContestDescription, Manifest, Party, SelectionDescription
+from fastapi.encoders import jsonable_encoder
 from os.path import dirname, split, splitext
+from typing import Any, Dict, FrozenSet, List, Optional
 
 
 def load_manifest_from_file(path: str) -> Manifest:
@@ -19,29 +22,194 @@ def load_manifest_from_file(path: str) -> Manifest:
     return manifest
 
 
-def generate_ballot_style_contests(manifest: Manifest, ballot_style_id: str) -> dict:
+@dataclass(frozen=True)
+class ContestRule():
     """
-    Generate the dict structure for the relevant contests for a given ballot style.
+    What a ballot may contain for one contest.
+    """
+    selection_ids: FrozenSet[str]
+    # Most selections a voter can make, the encryption fills the remaining placeholders
+    max_votes: int
+
+
+class BallotStyleValidator():
+    """
+    Structural checks of a plaintext ballot for one ballot style, compiled when the manifest is loaded.
+
+    These are the checks electionguard makes while encrypting, plus the ones it skips (unknown contests
+    and selections are silently dropped, duplicate selections break the placeholder count), so a ballot
+    that passes can be encrypted and one that doesn't is rejected before any encryption work.
+    """
+    style_id: str
+    contests: Dict[str, ContestRule]
+
+    def __init__(self, style_id: str, contests: List[ContestDescription]):
+        self.style_id = style_id
+        self.contests = {
+            contest.object_id: ContestRule(
+                frozenset(selection.object_id for selection in contest.ballot_selections),
+                min(contest.number_elected, contest.votes_allowed or contest.number_elected)
+            )
+            for contest in contests
+        }
+
+    def validate(self, ballot: Dict[str, Any]) -> Optional[str]:
+        """
+        Check a plaintext ballot in its JSON form.
+
+        Args:
+            ballot: PlaintextBallot JSON, as returned by /ballot/mark
+        Returns:
+            reason the ballot is invalid, None if it is valid
+        """
+        if ballot.get("style_id") != self.style_id:
+            return f"Ballot style is not {self.style_id}"
+        if not isinstance(ballot.get("object_id"), str) or not ballot["object_id"]:
+            return "Ballot has no object_id"
+        contests = ballot.get("contests")
+        if not isinstance(contests, list):
+            return "Ballot contests must be a list"
+
+        seen_contests = set()
+        for contest in contests:
+            contest_id = contest.get("object_id") if isinstance(contest, dict) else None
+            rule = self.contests.get(contest_id)
+            if rule is None:
+                return f"Contest {contest_id} is not on ballot style {self.style_id}"
+            if contest_id in seen_contests:
+                return f"Contest {contest_id} appears more than once"
+            seen_contests.add(contest_id)
+
+            selections = contest.get("ballot_selections")
+            if not isinstance(selections, list):
+                return f"Selections of contest {contest_id} must be a list"
+            seen_selections = set()
+            votes = 0
+            for selection in selections:
+                selection_id = selection.get("object_id") if isinstance(selection, dict) else None
+                if selection_id not in rule.selection_ids:
+                    return f"Selection {selection_id} is not in contest {contest_id}"
+                if selection_id in seen_selections:
+                    return f"Selection {selection_id} appears more than once"
+                seen_selections.add(selection_id)
+                if selection.get("is_placeholder_selection"):
+                    return f"Selection {selection_id} is marked as a placeholder"
+                vote = selection.get("vote")
+                # electionguard only encrypts 0 or 1 per selection
+                if type(vote) is not int or not 0 <= vote <= 1:
+                    return f"Vote for selection {selection_id} must be 0 or 1"
+                votes += vote
+            if votes > rule.max_votes:
+                return f"Contest {contest_id} allows {rule.max_votes} votes, ballot has {votes}"
+        return None
+
+
+class ManifestIndex():
+    """
+    Lookup tables over an election manifest.
+    Built once when the manifest is loaded so request handlers never scan the manifest lists.
+    """
+    manifest: Manifest
+    ballot_styles: Dict[str, BallotStyle]
+    contests: Dict[str, ContestDescription]
+    candidates: Dict[str, Candidate]
+    parties: Dict[str, Party]
+    selections: Dict[str, Dict[str, SelectionDescription]]
+    style_contests: Dict[str, List[ContestDescription]]
+    validators: Dict[str, BallotStyleValidator]
+    ballot_info: Dict[str, dict]
+
+    def __init__(self, manifest: Manifest):
+        self.manifest = manifest
+        self.ballot_styles = {style.object_id: style for style in manifest.ballot_styles}
+        self.contests = {contest.object_id: contest for contest in manifest.contests}
+        self.candidates = {candidate.object_id: candidate for candidate in manifest.candidates}
+        self.parties = {party.object_id: party for party in manifest.parties}
+
+        # Contest ID -> candidate ID -> ballot selection
+        self.selections = {
+            contest.object_id: {selection.candidate_id: selection for selection in contest.ballot_selections}
+            for contest in manifest.contests
+        }
+
+        # Ballot style ID -> contests in the style's regions, in manifest order
+        self.style_contests = dict()
+        for style in manifest.ballot_styles:
+            regions = set(style.geopolitical_unit_ids or [])
+            self.style_contests[style.object_id] = [
+                contest for contest in manifest.contests if contest.electoral_district_id in regions
+            ]
+
+        self.validators = {
+            style_id: BallotStyleValidator(style_id, contests)
+            for style_id, contests in self.style_contests.items()
+        }
+
+        # Ready-made /ballot/info payloads, already reduced to JSON-compatible types
+        self.ballot_info = {
+            style_id: jsonable_encoder(self._build_ballot_info(style_id))
+            for style_id in self.style_contests
+        }
+
+    def _build_ballot_info(self, ballot_style_id: str) -> dict:
+        ballot_info = generate_ballot_style_contests(self, ballot_style_id)
+        for contest in ballot_info["contests"]:
+            contest.update(get_contest_info(self, contest["object_id"]))
+        return ballot_info
+
+
+def get_ballot_info(index: ManifestIndex, ballot_style_id: str) -> dict:
+    """
+    Get the precomputed ballot information for a ballot style.
 
     Args:
-        manifest: election manifest
+        index: manifest index
         ballot_style_id: ballot style to reference from the manifest
     Returns:
-        Dict with relevent contest IDs and sequence order
+        Dict with the style's contests and their candidate info, shared between requests (do not mutate)
     Raises:
         ValueError if ballot_style is not in the manifest
     """
-    # Get ballot style object from manifest based by id
     try:
-        ballot_style_object = next(filter(lambda b: b.object_id == ballot_style_id, manifest.ballot_styles))
-    except StopIteration:
+        return index.ballot_info[ballot_style_id]
+    except KeyError:
         raise ValueError("Ballot style not found")
 
-    # Get all regions related for ballot style
-    regions = ballot_style_object.geopolitical_unit_ids
 
-    # Filter out contests for ballot style regions
-    relevant_contests = list(filter(lambda c: c.electoral_district_id in regions, manifest.contests))
+def validate_ballot(index: ManifestIndex, ballot: Any) -> Optional[str]:
+    """
+    Check a plaintext ballot in its JSON form against its ballot style, see BallotStyleValidator.
+
+    Args:
+        index: manifest index
+        ballot: PlaintextBallot JSON
+    Returns:
+        reason the ballot is invalid, None if it is valid
+    """
+    if not isinstance(ballot, dict):
+        return "Ballot must be a JSON object"
+    validator = index.validators.get(ballot.get("style_id"))
+    if validator is None:
+        return f"Ballot style {ballot.get('style_id')} not found"
+    return validator.validate(ballot)
+
+
+def generate_ballot_style_contests(index: ManifestIndex, ballot_style_id: str) -> dict:
+    """
+    Generate the dict structure for the relevant contests for a given ballot style.
+
+    Args:
+        index: manifest index
+        ballot_style_id: ballot style to reference from the manifest
+    Returns:
+        Dict with relevent contest IDs and sequence order
+    Raises:
+        ValueError if ballot_style is not in the manifest
+    """
+    try:
+        relevant_contests = index.style_contests[ballot_style_id]
+    except KeyError:
+        raise ValueError("Ballot style not found")
 
     # Create ballot dictionary with contests and style
     ballot = {
@@ -58,17 +226,17 @@ def generate_ballot_style_contests(manifest: Manifest, ballot_style_id: str) ->
     return ballot
 
 
-def get_candidate_info(manifest: Manifest, candidate_id: str) -> dict:
+def get_candidate_info(index: ManifestIndex, candidate_id: str) -> dict:
     """
     Get relevant information for a candidate.
 
     Args:
-        manifest: election manifest
+        index: manifest index
         candidate_id: candidate to query for in the manifest
     Returns:
         dict with information on candidate such as name, party (if there is one), and ID
     """
-    candidate_object = next(filter(lambda c: c.object_id == candidate_id, manifest.candidates))
+    candidate_object = index.candidates[candidate_id]
 
     candidate = dict()
 
@@ -77,8 +245,9 @@ def get_candidate_info(manifest: Manifest, candidate_id: str) -> dict:
     else:
         candidate["name"] = candidate_object.object_id
 
-    if candidate_object.party_id:
-        candidate["party"] = next(filter(lambda p: p.object_id == candidate.party_id, manifest.parties))
+    party = index.parties.get(candidate_object.party_id) if candidate_object.party_id else None
+    if party is not None:
+        candidate["party"] = party.name.text if party.name.text else party.object_id
     else:
         candidate["party"] = "N/A"
 
@@ -87,18 +256,18 @@ def get_candidate_info(manifest: Manifest, candidate_id: str) -> dict:
     return candidate
 
 
-def get_contest_info(manifest: Manifest, contest_id: str) -> dict:
+def get_contest_info(index: ManifestIndex, contest_id: str) -> dict:
     """
     Get relevant contest information.
 
     Args:
-        manifest: election manifest
+        index: manifest index
         contest_id: contest to query for in the manifest
     Returns:
         Contest name id and the contest candidates and their info
     """
-    contest_object = next(filter(lambda c: c.object_id == contest_id, manifest.contests))
-    candidates = [get_candidate_info(manifest, c.candidate_id) for c in contest_object.ballot_selections]
+    contest_object = index.contests[contest_id]
+    candidates = [get_candidate_info(index, c.candidate_id) for c in contest_object.ballot_selections]
     return {
         "name": contest_object.name,
         "object_id": contest_object.object_id,
@@ -106,31 +275,26 @@ def get_contest_info(manifest: Manifest, contest_id: str) -> dict:
     }
 
 
-def get_selection_info(manifest: Manifest, contest_id: str, candidate_id: str) -> dict:
+def get_selection_info(index: ManifestIndex, contest_id: str, candidate_id: str) -> dict:
     """
     Get information required to fill out ballot selection for contest.
 
     Args:
-        manifest: election manifest
+        index: manifest index
         contest_id: ID of the contest to query for in the manifest
         candidate_id: ID of the candidate to query for in the manifest
     Returns:
         Marking data for a ballot selection
     Raises:
         ValueError if selection is not valid for contest
-    
-    TODO check number of votes and weights
     """
     try:
-        # Get contest from manifest
-        contest = next(filter(lambda c: c.object_id == contest_id, manifest.contests))
-        # Get ballot selection for candidate
-        candidate = next(filter(lambda s: s.candidate_id == candidate_id, contest.ballot_selections))
-        # Object ID and sequence order
-        return {
-            "object_id": candidate.object_id,
-            "sequence_order": candidate.sequence_order,
-            "vote": 1
-        }
-    except StopIteration:
+        candidate = index.selections[contest_id][candidate_id]
+    except KeyError:
         raise ValueError("Invalid Selection")
+    # Object ID and sequence order
+    return {
+        "object_id": candidate.object_id,
+        "sequence_order": candidate.sequence_order,
+        "vote": 1
+    }
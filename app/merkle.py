@@ -0,0 +1,285 @@
+from electionguard.elgamal import ElGamalKeyPair, elgamal_keypair_from_secret, elgamal_keypair_random
+from electionguard.group import a_plus_bc_q, eq_elems, g_pow_p, hex_to_p, hex_to_q, mult_p, pow_p, rand_q
+from electionguard.hash import hash_elems
+from typing import List, Optional
+import hashlib
+import json
+import os
+
+
+HASH_SIZE = 32
+EMPTY_ROOT = hashlib.sha256(b"").digest()
+
+
+def leaf_hash(data: bytes) -> bytes:
+    """
+    RFC 6962 leaf hash, SHA-256 of 0x00 followed by the leaf data.
+    Leaves of the ballot hash tree are the ASCII hex ballot hashes as they appear in the ledger.
+    """
+    return hashlib.sha256(b"\x00" + data).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    """
+    RFC 6962 interior node hash, SHA-256 of 0x01 followed by both children.
+    """
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+class MerkleTree():
+    """
+    Append-only Merkle tree with the hashing, inclusion proofs and consistency proofs of RFC 6962.
+
+    Every complete subtree is kept, one bytearray of 32-byte hashes per level, so an append hashes
+    at most one node per level and roots and proofs of any earlier tree size take O(log n) hashes.
+    """
+    _levels: List[bytearray]
+
+    def __init__(self):
+        self._levels = [bytearray()]
+
+    def __len__(self) -> int:
+        return len(self._levels[0]) // HASH_SIZE
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the stored subtree hashes, about 64 per leaf.
+        """
+        return sum(len(level) for level in self._levels)
+
+    def _node(self, level: int, index: int) -> bytes:
+        return bytes(self._levels[level][index * HASH_SIZE:(index + 1) * HASH_SIZE])
+
+    def append(self, data: bytes) -> None:
+        """
+        Add a leaf, completing the subtrees it closes.
+        """
+        self._levels[0] += leaf_hash(data)
+        index = len(self) - 1
+        level = 0
+        # A right child completes its parent
+        while index % 2 == 1:
+            parent = node_hash(self._node(level, index - 1), self._node(level, index))
+            level += 1
+            if level == len(self._levels):
+                self._levels.append(bytearray())
+            self._levels[level] += parent
+            index //= 2
+
+    def _subtree_root(self, start: int, size: int) -> bytes:
+        # Splits always leave start aligned to a power of two at least as large as size
+        if size & (size - 1) == 0:
+            level = size.bit_length() - 1
+            return self._node(level, start >> level)
+        split = 1 << ((size - 1).bit_length() - 1)
+        return node_hash(self._subtree_root(start, split), self._subtree_root(start + split, size - split))
+
+    def _check_size(self, tree_size: Optional[int]) -> int:
+        if tree_size is None:
+            return len(self)
+        if not 0 <= tree_size <= len(self):
+            raise ValueError(f"Tree size {tree_size} is outside 0 to {len(self)}")
+        return tree_size
+
+    def root(self, tree_size: Optional[int] = None) -> bytes:
+        """
+        Get the root of the tree of the first tree_size leaves.
+
+        Args:
+            tree_size: number of leaves, the current size by default
+        Raises:
+            ValueError if the tree has fewer leaves
+        """
+        tree_size = self._check_size(tree_size)
+        if tree_size == 0:
+            return EMPTY_ROOT
+        return self._subtree_root(0, tree_size)
+
+    def inclusion_proof(self, index: int, tree_size: Optional[int] = None) -> List[bytes]:
+        """
+        Get the audit path of a leaf (RFC 6962 section 2.1.1), ordered from the leaf up.
+
+        Args:
+            index: zero-based leaf index
+            tree_size: size of the tree the proof is for, the current size by default
+        Raises:
+            ValueError if the leaf isn't in a tree of that size
+        """
+        tree_size = self._check_size(tree_size)
+        if not 0 <= index < tree_size:
+            raise ValueError(f"Leaf {index} is not in a tree of size {tree_size}")
+        path = []
+        start, size = 0, tree_size
+        while size > 1:
+            split = 1 << ((size - 1).bit_length() - 1)
+            if index < start + split:
+                path.append(self._subtree_root(start + split, size - split))
+                size = split
+            else:
+                path.append(self._subtree_root(start, split))
+                start, size = start + split, size - split
+        path.reverse()
+        return path
+
+    def consistency_proof(self, first: int, second: Optional[int] = None) -> List[bytes]:
+        """
+        Prove that the tree of size first is a prefix of the tree of size second (RFC 6962 section 2.1.2).
+
+        Args:
+            first: size of the earlier tree, at least 1
+            second: size of the later tree, the current size by default
+        Raises:
+            ValueError if the sizes aren't 1 <= first <= second <= current size
+        """
+        second = self._check_size(second)
+        if not 1 <= first <= second:
+            raise ValueError(f"Cannot prove consistency from tree size {first} to {second}")
+        proof = []
+        start, size, complete = 0, second, True
+        while first != size:
+            split = 1 << ((size - 1).bit_length() - 1)
+            if first <= split:
+                proof.append(self._subtree_root(start + split, size - split))
+                size = split
+            else:
+                proof.append(self._subtree_root(start, split))
+                start, first, size, complete = start + split, first - split, size - split, False
+        if not complete:
+            proof.append(self._subtree_root(start, size))
+        proof.reverse()
+        return proof
+
+
+def verify_inclusion(data: bytes, index: int, tree_size: int, path: List[bytes], root: bytes) -> bool:
+    """
+    Check an audit path from inclusion_proof against a tree root (RFC 9162 section 2.1.3.2).
+
+    Args:
+        data: leaf data, the ASCII hex ballot hash
+        index: zero-based leaf index
+        tree_size: size of the tree the root is for
+        path: audit path ordered from the leaf up
+        root: expected root
+    """
+    if not 0 <= index < tree_size:
+        return False
+    fn, sn = index, tree_size - 1
+    result = leaf_hash(data)
+    for sibling in path:
+        if sn == 0:
+            return False
+        if fn % 2 == 1 or fn == sn:
+            result = node_hash(sibling, result)
+            while fn % 2 == 0 and fn != 0:
+                fn, sn = fn >> 1, sn >> 1
+        else:
+            result = node_hash(result, sibling)
+        fn, sn = fn >> 1, sn >> 1
+    return sn == 0 and result == root
+
+
+def verify_consistency(first: int, second: int, proof: List[bytes], first_root: bytes, second_root: bytes) -> bool:
+    """
+    Check a proof from consistency_proof against the roots of both trees (RFC 9162 section 2.1.4.2).
+    """
+    if not 1 <= first <= second:
+        return False
+    if first == second:
+        return not proof and first_root == second_root
+    if not proof:
+        return False
+    # A power of two first tree is a complete subtree of the second, its root is left out of the proof
+    if first & (first - 1) == 0:
+        proof = [first_root] + proof
+    fn, sn = first - 1, second - 1
+    while fn % 2 == 1:
+        fn, sn = fn >> 1, sn >> 1
+    first_result = second_result = proof[0]
+    for node in proof[1:]:
+        if sn == 0:
+            return False
+        if fn % 2 == 1 or fn == sn:
+            first_result = node_hash(node, first_result)
+            second_result = node_hash(node, second_result)
+            while fn % 2 == 0 and fn != 0:
+                fn, sn = fn >> 1, sn >> 1
+        else:
+            second_result = node_hash(second_result, node)
+        fn, sn = fn >> 1, sn >> 1
+    return first_result == first_root and second_result == second_root and sn == 0
+
+
+def _tree_head_hash(public_key, commitment, tree_head: dict):
+    return hash_elems(
+            commitment,
+            public_key,
+            tree_head["extended_base_hash"],
+            tree_head["tree_size"],
+            tree_head["root_hash"],
+            tree_head["timestamp"]
+        )
+
+
+def sign_tree_head(key: ElGamalKeyPair, tree_head: dict) -> dict:
+    """
+    Sign a tree head with a Schnorr signature in the election's group.
+
+    The challenge is electionguard's hash_elems(commitment, public_key, extended_base_hash, tree_size,
+    root_hash, timestamp) and the signature verifies when g^response = commitment * public_key^challenge.
+
+    Args:
+        key: signing key pair of the ballot server
+        tree_head: extended_base_hash of the election, tree_size, hex root_hash and timestamp
+    Returns:
+        the tree head with the public key and signature added
+    """
+    nonce = rand_q()
+    commitment = g_pow_p(nonce)
+    challenge = _tree_head_hash(key.public_key, commitment, tree_head)
+    response = a_plus_bc_q(nonce, challenge, key.secret_key)
+    return {
+        **tree_head,
+        "public_key": key.public_key.to_hex(),
+        "signature": {"commitment": commitment.to_hex(), "response": response.to_hex()}
+    }
+
+
+def verify_tree_head(signed_tree_head: dict) -> bool:
+    """
+    Check the signature of a tree head returned by sign_tree_head.
+    Callers should also check the public key is the one the ballot server publishes.
+    """
+    public_key = hex_to_p(signed_tree_head["public_key"])
+    commitment = hex_to_p(signed_tree_head["signature"]["commitment"])
+    response = hex_to_q(signed_tree_head["signature"]["response"])
+    if public_key is None or commitment is None or response is None:
+        return False
+    challenge = _tree_head_hash(public_key, commitment, signed_tree_head)
+    return eq_elems(g_pow_p(response), mult_p(commitment, pow_p(public_key, challenge)))
+
+
+def load_signing_key(path: str) -> ElGamalKeyPair:
+    """
+    Load the tree head signing key, generating it on first boot.
+    The file holds the secret key, it is written with owner-only permissions.
+
+    Args:
+        path: key file
+    """
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            key = elgamal_keypair_from_secret(hex_to_q(json.load(f)["secret_key"]))
+        if key is None:
+            raise ValueError(f"Invalid tree signing key in {path}")
+        return key
+
+    key = elgamal_keypair_random()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        json.dump({"secret_key": key.secret_key.to_hex()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return key
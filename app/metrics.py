@@ -0,0 +1,315 @@
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+from time import perf_counter
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+import os.path
+import sys
+import threading
+
+from .config import METRICS_ENABLED
+
+
+# Upper bounds in seconds, from dictionary lookups to key ceremonies
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram():
+    """
+    Latency histogram family with one label, rendered in the Prometheus text format.
+    """
+    name: str
+    help: str
+    label: str
+    buckets: Tuple[float, ...]
+    _series: Dict[str, List[float]]
+    _lock: threading.Lock
+
+    def __init__(self, name: str, help: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        # label value -> per-bucket counts (not cumulative), then +Inf count and sum
+        self._series = dict()
+        self._lock = threading.Lock()
+        _histograms.append(self)
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, seconds)] += 1
+            series[-1] += seconds
+
+    @contextmanager
+    def _time(self, label_value: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, perf_counter() - start)
+
+    def time(self, label_value: str) -> ContextManager[None]:
+        """
+        Context manager observing the time spent in its block, nothing at all when metrics are disabled.
+        """
+        if not METRICS_ENABLED:
+            return nullcontext()
+        return self._time(label_value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = {label_value: list(counts) for label_value, counts in self._series.items()}
+        return {"help": self.help, "label": self.label, "buckets": list(self.buckets), "series": series}
+
+
+_histograms: List[Histogram] = list()
+_gauges: Dict[str, Tuple[str, Callable[[], float]]] = dict()
+
+phase_seconds = Histogram(
+        "ballotserver_phase_seconds",
+        "Time spent in each phase of request handling, startup and decryption",
+        "phase"
+    )
+request_seconds = Histogram(
+        "ballotserver_request_seconds",
+        "Time spent handling each route, from the start of body parsing to the encoded response",
+        "route"
+    )
+framework_seconds = Histogram(
+        "ballotserver_request_framework_seconds",
+        "Time each route spends outside its endpoint function: body parsing, Pydantic validation and response encoding",
+        "route"
+    )
+
+
+def timed(phase: str) -> ContextManager[None]:
+    """
+    Time a block as a phase of ballotserver_phase_seconds.
+
+    Args:
+        phase: phase name, e.g. "submit.encrypt"
+    """
+    return phase_seconds.time(phase)
+
+
+def register_gauge(name: str, help: str, read: Callable[[], float]) -> None:
+    """
+    Expose a value on /metrics, read when the metrics are rendered.
+    Registering a name again replaces the previous gauge.
+    """
+    _gauges[name] = (help, read)
+
+
+def snapshot() -> dict:
+    """
+    Copy every histogram and read every gauge, JSON-serializable so a coordinator can send it to workers.
+    """
+    gauges = dict()
+    for name, (help, read) in _gauges.items():
+        try:
+            gauges[name] = {"help": help, "value": read()}
+        except Exception:
+            # A gauge on state that isn't initialized yet is left out
+            pass
+    return {
+        "histograms": {histogram.name: histogram.snapshot() for histogram in _histograms},
+        "gauges": gauges
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def render(snapshots: List[Tuple[Dict[str, str], dict]]) -> str:
+    """
+    Render metric snapshots in the Prometheus text exposition format.
+
+    Args:
+        snapshots: (labels added to every sample, snapshot()) pairs, one per process
+    Returns:
+        text for the /metrics endpoint
+    """
+    lines = []
+    histogram_names = list(dict.fromkeys(name for _, data in snapshots for name in data["histograms"]))
+    for name in histogram_names:
+        header_written = False
+        for extra_labels, data in snapshots:
+            histogram = data["histograms"].get(name)
+            if histogram is None:
+                continue
+            if not header_written:
+                lines.append(f"# HELP {name} {histogram['help']}")
+                lines.append(f"# TYPE {name} histogram")
+                header_written = True
+            for label_value, counts in sorted(histogram["series"].items()):
+                labels = {**extra_labels, histogram["label"]: label_value}
+                cumulative = 0
+                for bound, count in zip(histogram["buckets"], counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': repr(float(bound))})} {cumulative}")
+                cumulative += counts[-2]
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {counts[-1]}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    gauge_names = list(dict.fromkeys(name for _, data in snapshots for name in data["gauges"]))
+    for name in gauge_names:
+        header_written = False
+        for extra_labels, data in snapshots:
+            gauge = data["gauges"].get(name)
+            if gauge is None:
+                continue
+            if not header_written:
+                lines.append(f"# HELP {name} {gauge['help']}")
+                lines.append(f"# TYPE {name} gauge")
+                header_written = True
+            lines.append(f"{name}{_labels(extra_labels)} {gauge['value']}")
+    return "\n".join(lines) + "\n"
+
+
+_endpoint_seconds: ContextVar[Optional[List[float]]] = ContextVar("_endpoint_seconds", default=None)
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that records each request in ballotserver_request_seconds, and the part of it spent
+    outside the endpoint function (parsing, validation, encoding) in ballotserver_request_framework_seconds.
+    """
+
+    def get_route_handler(self) -> Callable:
+        if not METRICS_ENABLED:
+            return super().get_route_handler()
+
+        endpoint = self.dependant.call
+
+        async def timed_endpoint(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                elapsed = _endpoint_seconds.get()
+                if elapsed is not None:
+                    elapsed[0] += perf_counter() - start
+
+        # The handler calls dependant.call with the validated parameters, the signature was read in __init__
+        self.dependant.call = timed_endpoint
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def timed_handler(request):
+            elapsed = [0.0]
+            token = _endpoint_seconds.set(elapsed)
+            start = perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                total = perf_counter() - start
+                _endpoint_seconds.reset(token)
+                request_seconds.observe(route, total)
+                framework_seconds.observe(route, total - elapsed[0])
+
+        return timed_handler
+
+
+# Shortest interval between samples, shorter ones would keep the GIL busy sampling
+MIN_PROFILER_INTERVAL = 0.001
+
+
+class SamplingProfiler():
+    """
+    Statistical profiler that samples the stacks of every thread from a background thread.
+
+    Samples are aggregated in the collapsed-stack format flame graph tools read ("frame;frame;frame count").
+    Nothing runs while the profiler is stopped.
+    """
+    interval: float
+    _stacks: Counter
+    _samples: int
+    _thread: Optional[threading.Thread]
+    _stop: threading.Event
+    _lock: threading.Lock
+
+    def __init__(self):
+        self.interval = 0.005
+        self._stacks = Counter()
+        self._samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float) -> None:
+        """
+        Start sampling, discarding the samples of the previous run.
+
+        Args:
+            interval: seconds between samples
+        Raises:
+            ValueError if the interval is shorter than MIN_PROFILER_INTERVAL
+        """
+        if not interval >= MIN_PROFILER_INTERVAL:
+            raise ValueError(f"Profiler interval must be at least {MIN_PROFILER_INTERVAL}s")
+        if self.running:
+            return
+        with self._lock:
+            self._stacks = Counter()
+            self._samples = 0
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks.append(";".join(reversed(stack)))
+            del frames
+            with self._lock:
+                self._stacks.update(stacks)
+                self._samples += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"running": self.running, "interval": self.interval, "samples": self._samples}
+
+    def collapsed(self) -> str:
+        """
+        Samples so far in the collapsed-stack format, most frequent stacks first.
+        """
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,151 @@
+from array import array
+from typing import Iterator, List, Optional
+
+
+HASH_SIZE = 32
+
+
+class PackedIndex():
+    """
+    Open-addressing hash table from 64-bit keys to row numbers, in two flat arrays.
+
+    Rows are numbered in the order they are added. Each row keeps its key (8 bytes) and the table
+    keeps row + 1 per slot (4 bytes), at most half full, so an index costs 16 to 24 bytes per row
+    where a dict costs around 100 plus its keys. Keys should be hashes or digests, different
+    values can share a key, so callers check the rows they get back.
+    """
+    _row_keys: array
+    _slots: array
+
+    def __init__(self):
+        self._row_keys = array("Q")
+        self._slots = array("I", bytes(4 * 16))
+
+    def __len__(self) -> int:
+        return len(self._row_keys)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the index's arrays.
+        """
+        return len(self._row_keys) * self._row_keys.itemsize + len(self._slots) * self._slots.itemsize
+
+    def _insert(self, key: int, row: int) -> None:
+        mask = len(self._slots) - 1
+        slot = key & mask
+        while self._slots[slot]:
+            slot = (slot + 1) & mask
+        self._slots[slot] = row + 1
+
+    def add(self, key: int) -> int:
+        """
+        Add a row under a key.
+
+        Returns:
+            the new row number
+        """
+        row = len(self._row_keys)
+        self._row_keys.append(key)
+        if 2 * len(self._row_keys) > len(self._slots):
+            self._slots = array("I", bytes(8 * len(self._slots)))
+            for existing_row, existing_key in enumerate(self._row_keys):
+                self._insert(existing_key, existing_row)
+        else:
+            self._insert(key, row)
+        return row
+
+    def rows(self, key: int) -> Iterator[int]:
+        """
+        Iterate over the rows added under a key.
+        """
+        mask = len(self._slots) - 1
+        slot = key & mask
+        while self._slots[slot]:
+            row = self._slots[slot] - 1
+            if self._row_keys[row] == key:
+                yield row
+            slot = (slot + 1) & mask
+
+
+class PackedHashes():
+    """
+    Append-only list of distinct hex hashes of up to 32 bytes, as returned by electionguard's to_hex().
+
+    Each hash is kept as 32 right-aligned bytes and a length byte, with a PackedIndex on its
+    last 8 bytes: about 55 bytes per hash against about 190 for a list of str with a dict of positions.
+    """
+    _data: bytearray
+    _lengths: bytearray
+    _index: PackedIndex
+
+    def __init__(self):
+        self._data = bytearray()
+        self._lengths = bytearray()
+        self._index = PackedIndex()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the packed hashes and their index.
+        """
+        return len(self._data) + len(self._lengths) + self._index.nbytes
+
+    @staticmethod
+    def _pack(hex_hash: str) -> Optional[bytes]:
+        try:
+            packed = bytes.fromhex(hex_hash)
+        except ValueError:
+            return None
+        if not 0 < len(packed) <= HASH_SIZE or len(hex_hash) != 2 * len(packed):
+            return None
+        return packed
+
+    @staticmethod
+    def _key(packed: bytes) -> int:
+        return int.from_bytes(packed[-8:], "little")
+
+    def position(self, hex_hash: str) -> Optional[int]:
+        """
+        Get the position of a hash, compared case-insensitively.
+
+        Returns:
+            zero-based position, None if the hash isn't in the list
+        """
+        packed = self._pack(hex_hash)
+        if packed is None:
+            return None
+        aligned = packed.rjust(HASH_SIZE, b"\x00")
+        for row in self._index.rows(self._key(packed)):
+            if self._lengths[row] == len(packed) and self._data[row * HASH_SIZE:(row + 1) * HASH_SIZE] == aligned:
+                return row
+        return None
+
+    def append(self, hex_hash: str) -> int:
+        """
+        Add a hash that isn't in the list yet.
+
+        Returns:
+            its position
+        Raises:
+            ValueError if it isn't hex of 1 to 32 bytes
+        """
+        packed = self._pack(hex_hash)
+        if packed is None:
+            raise ValueError(f"Not a hex hash of up to {HASH_SIZE} bytes: {hex_hash}")
+        self._data += packed.rjust(HASH_SIZE, b"\x00")
+        self._lengths.append(len(packed))
+        return self._index.add(self._key(packed))
+
+    def __getitem__(self, position: int) -> str:
+        start = (position + 1) * HASH_SIZE - self._lengths[position]
+        return self._data[start:(position + 1) * HASH_SIZE].hex().upper()
+
+    def page(self, start: int, count: int) -> List[str]:
+        """
+        Get up to count hashes from position start, as uppercase hex.
+        """
+        return [self[position] for position in range(start, min(start + count, len(self)))]
@@ -0,0 +1,313 @@
+from collections import deque
+from electionguard.ballot import (
+    CiphertextBallot,
+    CiphertextBallotContest,
+    CiphertextBallotSelection,
+    PlaintextBallot,
+    PlaintextBallotContest,
+    make_ciphertext_ballot,
+    make_ciphertext_ballot_contest,
+    make_ciphertext_ballot_selection
+)
+from electionguard.ballot_validator import ballot_is_valid_for_election
+from electionguard.chaum_pedersen import ConstantChaumPedersenProof, DisjunctiveChaumPedersenProof
+from electionguard.election import CiphertextElectionContext
+from electionguard.elgamal import ElGamalCiphertext, elgamal_add
+from electionguard.encrypt import contest_from, selection_from
+from electionguard.group import (
+    G,
+    ElementModP,
+    ElementModQ,
+    a_minus_b_q,
+    a_plus_bc_q,
+    add_q,
+    g_pow_p,
+    int_to_p_unchecked,
+    mult_p,
+    negate_q,
+    pow_p,
+    rand_q
+)
+from electionguard.hash import hash_elems
+from electionguard.manifest import ContestDescriptionWithPlaceholders, InternalManifest
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+
+# A random exponent e with g^e and K^e for the election's joint public key K
+Pad = Tuple[ElementModQ, ElementModP, ElementModP]
+# Approximate memory a pad takes, two 4096-bit integers and a 256-bit one with their objects
+PAD_BYTES = 1200
+
+# Pads per selection: the encryption nonce, the real proof commitment, the simulated proof commitment and its challenge
+PADS_PER_SELECTION = 4
+# Pads per contest besides its selections: the commitment of the selection limit proof
+PADS_PER_CONTEST = 1
+
+_GENERATOR = int_to_p_unchecked(G)
+
+
+def compute_pads(public_key: ElementModP, count: int) -> List[Pad]:
+    """
+    Compute pads for an election public key, the exponentiations encryption would otherwise do per ballot.
+    """
+    pads = []
+    for _ in range(count):
+        exponent = rand_q()
+        pads.append((exponent, g_pow_p(exponent), pow_p(public_key, exponent)))
+    return pads
+
+
+def pads_per_style(internal_manifest: InternalManifest) -> Dict[str, int]:
+    """
+    Number of pads encrypt_with_pads takes for a ballot of each style.
+    """
+    return {
+        style.object_id: sum(
+            PADS_PER_SELECTION * (len(contest.ballot_selections) + len(contest.placeholder_selections)) + PADS_PER_CONTEST
+            for contest in internal_manifest.get_contests_for(style.object_id)
+        )
+        for style in internal_manifest.ballot_styles
+    }
+
+
+class PadPool():
+    """
+    Bounded pool of precomputed pads with hit and miss counts.
+    Used from the event loop only, pads are computed elsewhere and added in batches.
+    """
+    size: int
+    hits: int
+    misses: int
+    _pads: Deque[Pad]
+
+    def __init__(self, size: int):
+        """
+        Args:
+            size: most pads kept, 0 disables precomputation
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._pads = deque()
+
+    def __len__(self) -> int:
+        return len(self._pads)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated bytes held by the pads.
+        """
+        return len(self._pads) * PAD_BYTES
+
+    @property
+    def missing(self) -> int:
+        return self.size - len(self._pads)
+
+    def add(self, pads: List[Pad]) -> None:
+        self._pads.extend(pads[:self.missing])
+
+    def take(self, count: int) -> Optional[List[Pad]]:
+        """
+        Take pads for one ballot, all or none.
+
+        Returns:
+            count pads, None (a miss) if the pool holds fewer
+        """
+        if count > len(self._pads):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [self._pads.popleft() for _ in range(count)]
+
+
+def _disjunctive_proof(
+        ciphertext: ElGamalCiphertext,
+        vote: int,
+        nonce: ElementModQ,
+        extended_base_hash: ElementModQ,
+        pads: Iterator[Pad]
+    ) -> DisjunctiveChaumPedersenProof:
+    # make_disjunctive_chaum_pedersen without exponentiations. The simulated branch's response is
+    # chosen as w + nonce * challenge, which turns alpha^-c * g^v into g^w and beta^-c * K^v into K^w
+    # times a power of g, all taken from pads.
+    alpha, beta = ciphertext
+    real_exponent, real_pad, real_data = next(pads)
+    fake_exponent, fake_pad, fake_data = next(pads)
+    challenge_exponent, g_pow_challenge, _ = next(pads)
+    if vote == 0:
+        c1 = challenge_exponent
+        a0, b0 = real_pad, real_data
+        a1, b1 = fake_pad, mult_p(fake_data, g_pow_challenge)
+        v1 = a_plus_bc_q(fake_exponent, nonce, c1)
+        c = hash_elems(extended_base_hash, alpha, beta, a0, b0, a1, b1)
+        c0 = a_minus_b_q(c, c1)
+        v0 = a_plus_bc_q(real_exponent, c0, nonce)
+    else:
+        # g^-c0 comes from the pad of -c0
+        c0 = negate_q(challenge_exponent)
+        a0, b0 = fake_pad, mult_p(fake_data, g_pow_challenge)
+        v0 = a_plus_bc_q(fake_exponent, nonce, c0)
+        a1, b1 = real_pad, real_data
+        c = hash_elems(extended_base_hash, alpha, beta, a0, b0, a1, b1)
+        c1 = a_minus_b_q(c, c0)
+        v1 = a_plus_bc_q(real_exponent, c1, nonce)
+    return DisjunctiveChaumPedersenProof(a0, b0, a1, b1, c0, c1, c, v0, v1)
+
+
+def _encrypt_selection(
+        object_id: str,
+        description_hash: ElementModQ,
+        vote: int,
+        is_placeholder: bool,
+        context: CiphertextElectionContext,
+        pads: Iterator[Pad]
+    ) -> CiphertextBallotSelection:
+    nonce, alpha, public_key_pow_nonce = next(pads)
+    beta = public_key_pow_nonce if vote == 0 else mult_p(_GENERATOR, public_key_pow_nonce)
+    ciphertext = ElGamalCiphertext(alpha, beta)
+    return make_ciphertext_ballot_selection(
+            object_id=object_id,
+            description_hash=description_hash,
+            ciphertext=ciphertext,
+            elgamal_public_key=context.elgamal_public_key,
+            crypto_extended_base_hash=context.crypto_extended_base_hash,
+            proof_seed=nonce,
+            selection_representation=vote,
+            is_placeholder_selection=is_placeholder,
+            nonce=nonce,
+            proof=_disjunctive_proof(ciphertext, vote, nonce, context.crypto_extended_base_hash, pads)
+        )
+
+
+def _encrypt_contest(
+        votes: Dict[str, int],
+        description: ContestDescriptionWithPlaceholders,
+        context: CiphertextElectionContext,
+        pads: Iterator[Pad]
+    ) -> CiphertextBallotContest:
+    # Same selections, placeholders and order as electionguard's encrypt_contest
+    description_hash = description.crypto_hash()
+    selections = []
+    selection_count = 0
+    for selection in description.ballot_selections:
+        vote = votes.get(selection.object_id, 0)
+        selection_count += vote
+        selections.append(_encrypt_selection(selection.object_id, selection.crypto_hash(), vote, False, context, pads))
+    for placeholder in description.placeholder_selections:
+        vote = 1 if selection_count < description.number_elected else 0
+        selection_count += vote
+        selections.append(_encrypt_selection(placeholder.object_id, placeholder.crypto_hash(), vote, True, context, pads))
+
+    # Proof that the selections add up to number_elected, make_constant_chaum_pedersen with a pad
+    accumulation = elgamal_add(*(selection.ciphertext for selection in selections))
+    aggregate_nonce = add_q(*(selection.nonce for selection in selections))
+    exponent, pad, data = next(pads)
+    challenge = hash_elems(context.crypto_extended_base_hash, accumulation.pad, accumulation.data, pad, data)
+    proof = ConstantChaumPedersenProof(
+            pad, data, challenge, a_plus_bc_q(exponent, challenge, aggregate_nonce), description.number_elected
+        )
+    return make_ciphertext_ballot_contest(
+            object_id=description.object_id,
+            description_hash=description_hash,
+            ballot_selections=selections,
+            elgamal_public_key=context.elgamal_public_key,
+            crypto_extended_base_hash=context.crypto_extended_base_hash,
+            proof_seed=exponent,
+            number_elected=description.number_elected,
+            proof=proof
+        )
+
+
+def encrypt_with_pads(
+        ballot: PlaintextBallot,
+        internal_manifest: InternalManifest,
+        context: CiphertextElectionContext,
+        pads: List[Pad]
+    ) -> Optional[CiphertextBallot]:
+    """
+    Encrypt a ballot like encryption.encrypt_unchained, using precomputed pads for every exponentiation.
+
+    Nonces and proof commitments come from the pads instead of being derived from a master nonce,
+    so the ballot has no master nonce. The proofs aren't verified here, the ballot box verifies
+    every ballot before casting or spoiling it.
+
+    Args:
+        ballot: plaintext ballot to encrypt
+        internal_manifest: internal manifest of the election
+        context: election context holding the joint public key the pads were computed for
+        pads: pads_per_style(internal_manifest)[ballot.style_id] pads, each used once
+    Returns:
+        unchained CiphertextBallot, None if the ballot is invalid for its style
+    """
+    style = internal_manifest.get_ballot_style(ballot.style_id)
+    if not ballot.is_valid(style.object_id):
+        return None
+    pad_iterator = iter(pads)
+    contests = []
+    for description in internal_manifest.get_contests_for(ballot.style_id):
+        contest = next((contest for contest in ballot.contests if contest.object_id == description.object_id), None)
+        if contest is None:
+            contest = contest_from(description)
+        if not contest.is_valid(
+                description.object_id,
+                len(description.ballot_selections),
+                description.number_elected,
+                description.votes_allowed
+            ):
+            return None
+        votes = {selection.object_id: selection.vote for selection in contest.ballot_selections}
+        contests.append(_encrypt_contest(votes, description, context, pad_iterator))
+    return make_ciphertext_ballot(
+            ballot.object_id,
+            ballot.style_id,
+            internal_manifest.manifest_hash,
+            internal_manifest.manifest_hash,
+            contests
+        )
+
+
+def check_pad_encryption(internal_manifest: InternalManifest, context: CiphertextElectionContext) -> Optional[str]:
+    """
+    Round-trip a ballot of every style through encrypt_with_pads, so broken proof code is caught
+    before any voter's ballot is encrypted with pads.
+
+    Each ballot votes for the first selection of every contest, so both branches of the disjunctive
+    proof are used, and placeholders too where more than one candidate is elected. The ballot must pass
+    ballot_is_valid_for_election, and every selection must decrypt, with its nonce, to the vote encrypted.
+
+    Args:
+        internal_manifest: internal manifest of the election
+        context: election context holding the joint public key
+    Returns:
+        why the check failed, None if every style round-trips
+    """
+    for style in internal_manifest.ballot_styles:
+        contests = []
+        expected = {}
+        for description in internal_manifest.get_contests_for(style.object_id):
+            selections = [
+                selection_from(selection, is_affirmative=index == 0)
+                for index, selection in enumerate(description.ballot_selections)
+            ]
+            contests.append(PlaintextBallotContest(description.object_id, selections))
+            votes = [selection.vote for selection in selections]
+            # Placeholders make up the undervote, like _encrypt_contest
+            undervote = max(description.number_elected - sum(votes), 0)
+            votes += [1 if index < undervote else 0 for index in range(len(description.placeholder_selections))]
+            expected[description.object_id] = votes
+        ballot = PlaintextBallot(f"pad-check-{style.object_id}", style.object_id, contests)
+        pads = compute_pads(context.elgamal_public_key, pads_per_style(internal_manifest)[style.object_id])
+        encrypted = encrypt_with_pads(ballot, internal_manifest, context, pads)
+        if encrypted is None:
+            return f"Ballot of style {style.object_id} couldn't be encrypted with pads"
+        if not ballot_is_valid_for_election(encrypted, internal_manifest, context):
+            return f"Ballot of style {style.object_id} encrypted with pads doesn't verify"
+        for contest in encrypted.contests:
+            votes = [
+                selection.ciphertext.decrypt_known_nonce(context.elgamal_public_key, selection.nonce)
+                for selection in contest.ballot_selections
+            ]
+            if votes != expected[contest.object_id]:
+                return f"Contest {contest.object_id} of style {style.object_id} encrypted with pads decrypts to other votes"
+    return None
@@ -0,0 +1,173 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+import binascii
+import gzip
+import json
+import struct
+import zlib
+
+from .admission import scheduler
+
+
+# Spoiled ballots per chunk, each is decrypted by the guardians so chunks are kept small
+SPOILED_CHUNK_SIZE = 16
+
+SECTIONS = ("ballots", "spoiled")
+
+# gzip level of the records that aren't stored ballots, stored ballots are sent as compressed as they are stored
+COMPRESSION_LEVEL = 6
+
+# Member header without a file name or modification time
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+_RECORD_END = gzip.compress(b"}\n", COMPRESSION_LEVEL, mtime=0)
+
+
+@dataclass
+class RecordCursor():
+    """
+    Where an election record export continues: a section, a shard and a ballot position within it.
+
+    The bounds are fixed when the export starts, so a resumed download ends at the same ballots as
+    the tally at the start of the record, however many ballots were cast since. The cursor carries
+    the extended base hash of the election context, so it only resumes the export it came from.
+    """
+    section: str
+    bounds: List[int]
+    shard: int
+    after: int
+    context_hash: str
+
+    def encode(self) -> str:
+        """
+        Encode the cursor as the opaque token the publish endpoint takes.
+        """
+        fields = [self.section, self.bounds, self.shard, self.after, self.context_hash]
+        return urlsafe_b64encode(json.dumps(fields, separators=(",", ":")).encode()).decode()
+
+    @staticmethod
+    def decode(token: str, shards: int, context_hash: str) -> "RecordCursor":
+        """
+        Decode a token returned by encode().
+
+        Args:
+            token: cursor token from a resume record
+            shards: number of ballot box shards of the election
+            context_hash: hex extended base hash of the election's context
+        Raises:
+            ValueError if the token is malformed, or from another election or one with a different number of shards
+        """
+        try:
+            section, bounds, shard, after, cursor_context_hash = json.loads(urlsafe_b64decode(token.encode()))
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise ValueError(f"Malformed election record cursor: {token}")
+        if cursor_context_hash != context_hash:
+            raise ValueError(f"Election record cursor is from another election: {token}")
+        if (
+                section not in SECTIONS
+                or not isinstance(bounds, list) or len(bounds) != shards
+                or not all(isinstance(bound, int) and bound >= 0 for bound in bounds)
+                or not isinstance(shard, int) or not 0 <= shard < shards
+                or not isinstance(after, int) or after < 0
+            ):
+            raise ValueError(f"Election record cursor doesn't match this election: {token}")
+        return RecordCursor(section, bounds, shard, after, context_hash)
+
+
+def record(record_type: str, **fields) -> bytes:
+    """
+    Serialize one NDJSON record of the election record.
+    """
+    return json.dumps({"type": record_type, **fields}).encode() + b"\n"
+
+
+def compress_records(records: List[bytes]) -> bytes:
+    """
+    Compress records as one gzip member.
+    """
+    return gzip.compress(b"".join(records), COMPRESSION_LEVEL, mtime=0)
+
+
+def _gzip_member(serialized: bytes) -> bytes:
+    # A zlib stream is a 2 byte header, deflate data and an Adler-32 checksum, a gzip member wraps
+    # the same deflate data in its own header and the CRC-32 and length of the uncompressed data
+    data = zlib.decompress(serialized)
+    return _GZIP_HEADER + serialized[2:-4] + struct.pack("<II", zlib.crc32(data), len(data) & 0xFFFFFFFF)
+
+
+def ballot_members(record_type: str, ballots: List[Tuple[int, int, bytes]]) -> List[bytes]:
+    """
+    Turn stored ballots into records without parsing or compressing them again.
+
+    Ballots are stored compressed, see store.serialize_ballot, and each one's deflate data becomes
+    a gzip member of its own, between small members holding the rest of its record.
+
+    Args:
+        record_type: type of the records
+        ballots: shard, position and serialized ballot of each record
+    Returns:
+        gzip members of the records
+    """
+    members = []
+    for shard, position, serialized in ballots:
+        members.append(compress_records([
+            b'{"type": "' + record_type.encode() + b'", "shard": ' + str(shard).encode()
+            + b', "position": ' + str(position).encode() + b', "ballot": '
+        ]))
+        members.append(_gzip_member(serialized))
+        members.append(_RECORD_END)
+    return members
+
+
+def finish_chunk(members: List[bytes], next_cursor: Optional[RecordCursor]) -> bytes:
+    """
+    End a chunk of the record with where to resume after it.
+
+    Gzip members can be concatenated, so the whole download is a single .ndjson.gz file, and a
+    download cut short can be resumed from the resume record of its last complete chunk.
+
+    Args:
+        members: gzip members of the chunk's records
+        next_cursor: where the next chunk starts, None if the chunk ends the record
+    Returns:
+        the chunk's gzip members, ending in a resume record or, for the last chunk, an end record
+    """
+    if next_cursor is not None:
+        members.append(compress_records([record("resume", cursor=next_cursor.encode())]))
+    else:
+        members.append(compress_records([record("end")]))
+    return b"".join(members)
+
+
+async def stream_record(
+        get_chunk: Callable[[Optional[RecordCursor]], Awaitable[Tuple[bytes, Optional[RecordCursor]]]],
+        cursor: Optional[RecordCursor]
+    ) -> StreamingResponse:
+    """
+    Stream the election record chunk by chunk, each chunk admitted as a "publish" job.
+    Only one chunk is held in memory at a time.
+
+    Args:
+        get_chunk: coroutine function returning a compressed chunk and the cursor of the next one
+        cursor: where to start, None for the beginning of the record
+    Raises:
+        Overloaded if the first chunk can't be queued, before anything is sent
+    """
+    # The first chunk is built before the response starts, so overload and errors get a status code
+    async with scheduler.admit("publish"):
+        first_chunk, first_cursor = await get_chunk(cursor)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        yield first_chunk
+        next_cursor = first_cursor
+        while next_cursor is not None:
+            async with scheduler.admit("publish"):
+                chunk, next_cursor = await get_chunk(next_cursor)
+            yield chunk
+
+    return StreamingResponse(
+            chunks(),
+            media_type="application/gzip",
+            headers={"Content-Disposition": "attachment; filename=\"election-record.ndjson.gz\""}
+        )
@@ -0,0 +1,247 @@
+from collections import OrderedDict
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os.path
+import re
+
+from .encryption import EncryptionWorkers, create_executor
+from .metrics import register_gauge, timed
+from .config import (
+    DECRYPTION_EXECUTOR,
+    DECRYPTION_WORKERS,
+    ELECTIONS_DIR,
+    ENCRYPTION_EXECUTOR,
+    ENCRYPTION_WORKERS,
+    MANIFEST_PATH,
+    NUM_GUARDIANS,
+    STORAGE_DIR
+)
+
+if TYPE_CHECKING:
+    from .election import BallotServerElectionConfig, Election
+
+
+logger = logging.getLogger(__name__)
+
+# Election configured by MANIFEST_PATH and STORAGE_DIR, served at /ballot and /election
+DEFAULT_ELECTION = "default"
+
+# Manifest of a hosted election, within its directory under ELECTIONS_DIR
+MANIFEST_FILE = "manifest.json"
+
+# Election ids are directory names, nothing that could leave ELECTIONS_DIR
+_ELECTION_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+
+class UnknownElection(Exception):
+    """
+    Raised for an election id without an election to load.
+    """
+
+
+def election_paths(election_id: str) -> Tuple[str, str]:
+    """
+    Find the manifest and storage directory of an election.
+
+    Args:
+        election_id: DEFAULT_ELECTION, or the name of a directory under ELECTIONS_DIR holding a manifest.json
+    Returns:
+        manifest path and storage directory
+    Raises:
+        UnknownElection if there is no such election
+    """
+    if election_id == DEFAULT_ELECTION:
+        return MANIFEST_PATH, STORAGE_DIR
+    storage_dir = os.path.join(ELECTIONS_DIR, election_id)
+    manifest_path = os.path.join(storage_dir, MANIFEST_FILE)
+    if not _ELECTION_ID.fullmatch(election_id) or not os.path.isfile(manifest_path):
+        raise UnknownElection(f"No election {election_id}")
+    return manifest_path, storage_dir
+
+
+class ElectionRegistry():
+    """
+    The elections a process serves, by election id.
+
+    An election is loaded the first time it is used: its manifest, keys, ballot stores and ledgers
+    are read on a worker thread, so the elections already loaded keep being served, and concurrent
+    requests share one load. Elections encrypt and decrypt on executors shared by the whole process.
+
+    Every request holds a lease on its election. Once the estimated memory of the loaded elections
+    is over the budget, the least recently used ones without leases or submissions and challenges
+    in progress are closed. Their ballots, ledgers and receipts are already in the durable store,
+    so nothing is lost and they are loaded again on their next request.
+    """
+    memory_budget: int
+    loads: int
+    evictions: int
+    encryption_workers: Optional[EncryptionWorkers]
+    decryption_executor: Optional[Executor]
+    _new_election: Callable[[str], "Election"]
+    _election_config: Optional[Callable[[str], "BallotServerElectionConfig"]]
+    _precompute: bool
+    _elections: "OrderedDict[str, Election]"
+    _loading: Dict[str, asyncio.Future]
+    _closing: Dict[str, asyncio.Future]
+    _leases: Dict[str, int]
+
+    def __init__(self, new_election: Callable[[str], "Election"], memory_budget: int):
+        """
+        Args:
+            new_election: makes the uninitialized Election of an election id
+            memory_budget: estimated bytes of loaded elections above which idle ones are closed
+        """
+        self.memory_budget = memory_budget
+        self.loads = 0
+        self.evictions = 0
+        self.encryption_workers = None
+        self.decryption_executor = None
+        self._new_election = new_election
+        self._election_config = None
+        self._precompute = False
+        self._elections = OrderedDict()
+        self._loading = dict()
+        self._closing = dict()
+        self._leases = dict()
+        register_gauge("ballotserver_elections_loaded", "Elections loaded in memory", lambda: len(self._elections))
+        register_gauge("ballotserver_elections_memory_bytes", "Estimated memory held by the loaded elections", self.memory_size)
+        register_gauge("ballotserver_election_loads", "Elections loaded since the process started", lambda: self.loads)
+        register_gauge("ballotserver_election_evictions", "Idle elections closed to stay within the memory budget", lambda: self.evictions)
+
+    def start(self, election_config: Callable[[str], "BallotServerElectionConfig"], precompute: bool) -> None:
+        """
+        Start the shared executors. Must be called on the event loop before any election is used.
+
+        Args:
+            election_config: configuration of an election id, raising UnknownElection if there is none
+            precompute: precompute encryption pads for loaded elections, only for processes serving HTTP
+        """
+        self._election_config = election_config
+        self._precompute = precompute
+        self.encryption_workers = EncryptionWorkers(ENCRYPTION_EXECUTOR, ENCRYPTION_WORKERS)
+        self.decryption_executor = create_executor(DECRYPTION_EXECUTOR, DECRYPTION_WORKERS or NUM_GUARDIANS, "guardian-decryption")
+
+    def loaded(self) -> Dict[str, "Election"]:
+        """
+        The elections loaded right now, by id.
+        """
+        return dict(self._elections)
+
+    def memory_size(self) -> int:
+        """
+        Estimated bytes held by the loaded elections, see Election.memory_size.
+        """
+        return sum(election.memory_size() for election in self._elections.values())
+
+    async def load(self, election_id: str) -> None:
+        """
+        Load an election ahead of its first request, e.g. the default election at startup.
+
+        Raises:
+            UnknownElection if there is no such election
+        """
+        async with self.use(election_id):
+            pass
+
+    @asynccontextmanager
+    async def use(self, election_id: str) -> AsyncIterator["Election"]:
+        """
+        Hold a lease on an election, loading it if it isn't loaded.
+
+        Args:
+            election_id: id of the election
+        Returns:
+            context manager giving the initialized and started Election
+        Raises:
+            UnknownElection if there is no such election
+        """
+        # The lease is taken before loading, so the election can't be evicted before the caller gets it
+        self._leases[election_id] = self._leases.get(election_id, 0) + 1
+        try:
+            yield await self._get(election_id)
+        finally:
+            self._leases[election_id] -= 1
+            if not self._leases[election_id]:
+                del self._leases[election_id]
+            self._evict()
+
+    async def _get(self, election_id: str) -> "Election":
+        while True:
+            election = self._elections.get(election_id)
+            if election is not None:
+                self._elections.move_to_end(election_id)
+                return election
+            # An election being closed is loaded again only once its files are released
+            closing = self._closing.get(election_id)
+            if closing is not None:
+                await asyncio.shield(closing)
+                continue
+            loading = self._loading.get(election_id)
+            if loading is None:
+                loading = asyncio.ensure_future(self._load(election_id))
+                self._loading[election_id] = loading
+            await asyncio.shield(loading)
+
+    async def _load(self, election_id: str) -> None:
+        try:
+            config = self._election_config(election_id)
+            election = self._new_election(election_id)
+            loop = asyncio.get_running_loop()
+            with timed("election.load"):
+                try:
+                    await loop.run_in_executor(None, election.initialize_election, config)
+                except BaseException:
+                    # Release whatever was opened before the failure
+                    await loop.run_in_executor(None, election.store_election_state, config.storage_dir)
+                    raise
+                election.start(self.encryption_workers, self.decryption_executor)
+            if self._precompute:
+                election.encryption_pool.start_precompute()
+            self._elections[election_id] = election
+            self.loads += 1
+        finally:
+            del self._loading[election_id]
+        self._evict()
+
+    def _evict(self) -> None:
+        total = self.memory_size()
+        if total <= self.memory_budget:
+            return
+        # Least recently used first
+        for election_id, election in list(self._elections.items()):
+            if total <= self.memory_budget:
+                break
+            if election_id in self._leases or not election.evictable:
+                continue
+            total -= election.memory_size()
+            del self._elections[election_id]
+            self._closing[election_id] = asyncio.ensure_future(self._close(election_id, election))
+            self.evictions += 1
+
+    async def _close(self, election_id: str, election: "Election") -> None:
+        try:
+            loop = asyncio.get_running_loop()
+            with timed("election.close"):
+                # Closing waits for the store and ledger writers to put their last batch on disk
+                await loop.run_in_executor(None, election.store_election_state, election.storage_dir)
+                election.shutdown()
+            logger.info(f"Closed election {election_id}, {len(self._elections)} elections stay loaded")
+        finally:
+            del self._closing[election_id]
+
+    async def close(self) -> None:
+        """
+        Close every election and the shared executors, at shutdown.
+        """
+        await asyncio.gather(*self._loading.values(), return_exceptions=True)
+        for election_id, election in list(self._elections.items()):
+            del self._elections[election_id]
+            self._closing[election_id] = asyncio.ensure_future(self._close(election_id, election))
+        await asyncio.gather(*self._closing.values(), return_exceptions=True)
+        if self.encryption_workers is not None:
+            self.encryption_workers.shutdown()
+        if self.decryption_executor is not None:
+            self.decryption_executor.shutdown(wait=True)
@@ -0,0 +1,254 @@
+from dataclasses import dataclass
+from electionguard.tally import PlaintextTally
+from fastapi.responses import StreamingResponse
+from time import monotonic
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+import asyncio
+import logging
+import orjson
+import time
+
+from .admission import Overloaded, scheduler
+from .serialization import canonical_hash
+
+
+logger = logging.getLogger(__name__)
+
+
+class TallyUnavailable(Exception):
+    """
+    Raised when the tally couldn't be decrypted and there are no earlier results to serve.
+    """
+
+
+@dataclass
+class TallySnapshot():
+    """
+    Decrypted election results, versioned by the number of cast ballots they include.
+
+    The JSON body is encoded once, every request and live feed serving the snapshot sends the same bytes.
+    """
+    version: int
+    tag: str
+    body: dict
+    encoded: bytes
+
+    @staticmethod
+    def from_body(body: dict) -> "TallySnapshot":
+        """
+        Build a snapshot from its JSON body, e.g. as returned by the election coordinator.
+
+        The tag is the version and a hash of the contest results, so the same results get the
+        same tag in every process, and results recounted after a restart don't reuse a stale one.
+        """
+        tag = f"{body['version']}-{canonical_hash(body['contests'])[:16]}"
+        return TallySnapshot(body["version"], tag, body, orjson.dumps(body))
+
+    @property
+    def etag(self) -> str:
+        return f"\"{self.tag}\""
+
+
+def tally_results(version: int, tally: PlaintextTally) -> TallySnapshot:
+    """
+    Snapshot a decrypted tally in the form /election/result serves it.
+
+    Args:
+        version: number of cast ballots in the tally
+        tally: decrypted tally
+    """
+    return TallySnapshot.from_body({
+        "version": version,
+        "timestamp": int(time.time()),
+        "contests": [
+            {
+                "contest": contest,
+                "selections": [
+                    {
+                        "selection": selection,
+                        "tally": selection_details.tally
+                    } for selection, selection_details in contest_details.selections.items()
+                ]
+            } for contest, contest_details in tally.contests.items()
+        ]
+    })
+
+
+def etag_matches(if_none_match: Optional[str], snapshot: TallySnapshot) -> bool:
+    """
+    Whether an If-None-Match header names the snapshot, so the client's copy is current.
+    """
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as If-None-Match calls for
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == snapshot.etag for tag in tags)
+
+
+class TallySnapshots():
+    """
+    Latest decrypted tally of an election, shared by every request and live feed.
+
+    A background snapshotter decrypts the running tally every interval seconds once new ballots
+    were cast. Requests get the latest snapshot while it is current or younger than the interval,
+    otherwise they decrypt a new one. Concurrent decryptions are merged into one.
+    """
+    interval: float
+    latest: Optional[TallySnapshot]
+    decryptions: int
+    _cast_count: Callable[[], int]
+    _decrypt: Callable[[], Awaitable[Tuple[int, Optional[PlaintextTally]]]]
+    _taken: float
+    _refreshing: Optional[asyncio.Future]
+    _published: asyncio.Event
+    _snapshotter: Optional[asyncio.Task]
+
+    def __init__(
+            self,
+            cast_count: Callable[[], int],
+            decrypt: Callable[[], Awaitable[Tuple[int, Optional[PlaintextTally]]]],
+            interval: float
+        ):
+        """
+        Must be created on the event loop.
+
+        Args:
+            cast_count: number of cast ballots in the running tally right now
+            decrypt: coroutine function decrypting the running tally, returning its cast count and the
+                plaintext tally, None if it couldn't be decrypted
+            interval: seconds between background snapshots, 0 to decrypt only for requests
+        """
+        self.interval = interval
+        self.latest = None
+        self.decryptions = 0
+        self._cast_count = cast_count
+        self._decrypt = decrypt
+        self._taken = 0.0
+        self._refreshing = None
+        self._published = asyncio.Event()
+        self._snapshotter = None
+
+    def start(self) -> None:
+        """
+        Start the background snapshotter, unless the interval is 0.
+        """
+        if self.interval > 0:
+            self._snapshotter = asyncio.ensure_future(self._snapshot_periodically())
+
+    def shutdown(self) -> None:
+        if self._snapshotter is not None:
+            self._snapshotter.cancel()
+        if self._refreshing is not None:
+            self._refreshing.cancel()
+
+    async def get(self) -> TallySnapshot:
+        """
+        Get a snapshot with every cast ballot, or one at most interval seconds old.
+
+        Raises:
+            Overloaded if a decryption is needed and the tally queue is full
+            TallyUnavailable if the first decryption failed
+        """
+        latest = self.latest
+        if latest is not None and (latest.version == self._cast_count() or monotonic() - self._taken < self.interval):
+            return latest
+        return await self.refresh()
+
+    async def wait(self, tag: str, timeout: float) -> TallySnapshot:
+        """
+        Wait for a snapshot other than the one with the given tag, for live feeds.
+
+        Args:
+            tag: tag of the snapshot the caller has
+            timeout: seconds to wait
+        Returns:
+            the new snapshot, or the latest one if none came in time
+        """
+        if self.latest is None:
+            return await self.get()
+        if self.latest.tag == tag:
+            try:
+                await asyncio.wait_for(self._published.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.latest
+
+    async def refresh(self) -> TallySnapshot:
+        """
+        Decrypt a new snapshot, or join the decryption in progress.
+        If the decryption fails the latest snapshot is kept and returned.
+
+        Raises:
+            TallyUnavailable if the decryption failed and there is no earlier snapshot
+        """
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._refreshing)
+
+    async def _refresh(self) -> TallySnapshot:
+        try:
+            async with scheduler.admit("tally"):
+                version, tally = await self._decrypt()
+        finally:
+            self._refreshing = None
+        if tally is None:
+            # Nothing is published, the next request or interval tries again
+            logger.error(f"Tally of {version} cast ballots couldn't be decrypted")
+            if self.latest is None:
+                raise TallyUnavailable("The tally couldn't be decrypted, try again later")
+            return self.latest
+        snapshot = tally_results(version, tally)
+        self.decryptions += 1
+        self.latest = snapshot
+        self._taken = monotonic()
+        # Wake every live feed waiting for this snapshot, later waits use a new event
+        published, self._published = self._published, asyncio.Event()
+        published.set()
+        return snapshot
+
+    async def _snapshot_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.latest is not None and self.latest.version == self._cast_count():
+                continue
+            try:
+                await self.refresh()
+            except Overloaded:
+                # Requests are decrypting already, try again next interval
+                pass
+            except Exception:
+                logger.exception("Tally snapshot failed")
+
+
+def stream_results(
+        first: TallySnapshot,
+        wait: Callable[[str, float], Awaitable[TallySnapshot]],
+        last_event_id: Optional[str],
+        keepalive: float
+    ) -> StreamingResponse:
+    """
+    Stream each new snapshot as a Server-Sent Event, with the snapshot tag as event id.
+
+    Args:
+        first: latest snapshot when the stream starts
+        wait: coroutine function waiting for a snapshot other than the tagged one, see TallySnapshots.wait
+        last_event_id: Last-Event-ID of a reconnecting client, the first snapshot isn't sent again if it has it
+        keepalive: seconds between comments sent while no snapshot comes, so proxies keep the connection open
+    """
+    async def events() -> AsyncIterator[bytes]:
+        snapshot = first
+        sent = last_event_id
+        while True:
+            if snapshot.tag != sent:
+                yield b"id: " + snapshot.tag.encode() + b"\nevent: result\ndata: " + snapshot.encoded + b"\n\n"
+                sent = snapshot.tag
+            else:
+                yield b": keepalive\n\n"
+            snapshot = await wait(snapshot.tag, keepalive)
+
+    return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            # Sent as they come, not buffered by the nginx proxy
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
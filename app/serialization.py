@@ -0,0 +1,87 @@
+from electionguard.ballot import PlaintextBallot, PlaintextBallotContest, PlaintextBallotSelection
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+from typing import Any, Callable
+import hashlib
+import orjson
+
+from .metrics import TimedRoute
+
+
+class ORJSONRequest(Request):
+    """
+    Request whose JSON body is parsed with orjson instead of the json module.
+    """
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class FastJSONRoute(TimedRoute):
+    """
+    TimedRoute that parses request bodies and encodes responses with orjson.
+
+    Whatever the endpoint returns that isn't already a Response is sent as an ORJSONResponse
+    straight away, skipping FastAPI's jsonable_encoder, which walks and copies the whole response
+    before encoding it. Endpoints must return plain JSON types with str keys.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        endpoint = self.dependant.call
+
+        async def encoded_endpoint(*args, **kwargs):
+            response = await endpoint(*args, **kwargs)
+            return response if isinstance(response, Response) else ORJSONResponse(response)
+
+        # Wrapped outside TimedRoute's endpoint timing, so encoding counts as framework time like before
+        self.dependant.call = encoded_endpoint
+
+        async def orjson_handler(request: Request) -> Response:
+            return await handler(ORJSONRequest(request.scope, request.receive))
+
+        return orjson_handler
+
+
+def canonical_hash(value: Any) -> str:
+    """
+    Hash a JSON value in canonical form: keys sorted at every level, no whitespace, UTF-8.
+    The same ballot gets the same hash however the client ordered or spaced its JSON.
+
+    Args:
+        value: parsed JSON value, e.g. a plaintext ballot
+    Returns:
+        hex SHA-256 of the canonical encoding
+    """
+    return hashlib.sha256(orjson.dumps(value, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def plaintext_ballot(ballot: dict) -> PlaintextBallot:
+    """
+    Build a PlaintextBallot from its JSON form, which manifest.validate_ballot must have accepted.
+
+    The ballot objects are constructed directly around the request's strings and ints, where
+    PlaintextBallot.from_json_object converts every field through jsons' type introspection.
+    Write-in extended_data isn't carried over, electionguard doesn't encrypt it.
+
+    Args:
+        ballot: validated PlaintextBallot JSON
+    Returns:
+        PlaintextBallot with the ballot's contests and selections
+    """
+    return PlaintextBallot(
+            ballot["object_id"],
+            ballot["style_id"],
+            [
+                PlaintextBallotContest(
+                    contest["object_id"],
+                    [
+                        PlaintextBallotSelection(selection["object_id"], selection["vote"], False)
+                        for selection in contest["ballot_selections"]
+                    ]
+                )
+                for contest in ballot["contests"]
+            ]
+        )
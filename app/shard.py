@@ -0,0 +1,51 @@
+from electionguard.ballot import BallotBoxState, CiphertextBallot, SubmittedBallot, from_ciphertext_ballot
+from typing import Optional
+import asyncio
+
+from .encryption import BallotChain
+from .store import BallotStore
+from .tally import RunningTally
+
+
+class BallotBoxShard():
+    """
+    One partition of the ballot box, with its own ballot chain, ballot store and running tally.
+
+    Shards share no state, so each one recovers and checkpoints its tally from its own store
+    and can be rebuilt or verified on its own. The election tally is the sum of the shard tallies.
+    """
+    index: int
+    chain: BallotChain
+    datastore: BallotStore
+    running_tally: RunningTally
+    lock: asyncio.Lock
+
+    def __init__(self, index: int, chain: BallotChain, datastore: BallotStore, running_tally: RunningTally):
+        """
+        Args:
+            index: position of the shard, which also picks its store
+            chain: ballot chain of the shard's encryption device
+            datastore: store the shard's ballots are kept in
+            running_tally: tally of the shard's cast ballots, already recovered from the store
+                with BallotStore.recover_tally
+        """
+        self.index = index
+        self.chain = chain
+        self.datastore = datastore
+        self.running_tally = running_tally
+        # Serializes ballot chaining and cast/spoil within the shard
+        self.lock = asyncio.Lock()
+
+    def accept(self, ballot: CiphertextBallot, state: BallotBoxState) -> Optional[SubmittedBallot]:
+        """
+        Store a chained ballot as cast or spoiled, electionguard's accept_ballot without the proof check.
+        Callers must hold the lock and have verified the ballot, see EncryptionPool.verify.
+
+        Returns:
+            SubmittedBallot stored in the shard, None if a ballot with the same ID is already stored
+        """
+        if self.datastore.get(ballot.object_id) is not None:
+            return None
+        submitted = from_ciphertext_ballot(ballot, state)
+        self.datastore.set(submitted.object_id, submitted)
+        return submitted
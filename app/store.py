@@ -0,0 +1,727 @@
+from array import array
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from electionguard.ballot import BallotBoxState, SubmittedBallot
+from electionguard.data_store import DataStore
+from electionguard.election import CiphertextElectionContext
+from electionguard.tally import PublishedCiphertextTally
+from itertools import islice
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import logging
+import math
+import os.path
+import sqlite3
+import tempfile
+import threading
+import zlib
+
+from .packed import PackedIndex
+from .tally import RunningTally
+
+
+logger = logging.getLogger(__name__)
+
+
+class BallotStoreUnavailable(Exception):
+    """
+    Raised when a ballot store can't take new ballots because writes to it are failing.
+    """
+    retry_after: int
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SubmissionNotDurable(BallotStoreUnavailable):
+    """
+    Raised when submitted ballots were chained and tallied but their store couldn't commit them in time.
+    They stay queued and are retried, results holds their receipts so retried submissions get them back.
+    """
+    results: List[dict]
+
+    def __init__(self, message: str, retry_after: int, results: List[dict]):
+        super().__init__(message, retry_after)
+        self.results = results
+
+
+class BallotStore(DataStore):
+    """
+    In-memory ballot store, the DataStore electionguard's BallotBox writes to.
+    Durable backends override the hooks below, which are no-ops for the memory store.
+    """
+
+    async def flush(self) -> None:
+        """
+        Wait until every ballot set so far is durable.
+        """
+        pass
+
+    def record_device(self, device_hash: str) -> None:
+        """
+        Remember the encryption device chaining the ballots set from now on, stored before any of them.
+        Offline verification accepts a ballot chain restarting only from a recorded device hash.
+
+        Args:
+            device_hash: hex hash of the encryption device, the code seed of its first ballot
+        """
+        pass
+
+    def check_writable(self) -> None:
+        """
+        Make sure ballots set now can be stored, before anything is chained or tallied for them.
+
+        Raises:
+            BallotStoreUnavailable if earlier writes failed and haven't been retried successfully yet
+        """
+        pass
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Commit every ballot set inside the block together.
+        """
+        yield
+
+    def checkpoint_tally(self, running_tally: RunningTally) -> None:
+        """
+        Record the running tally so recovery doesn't have to replay every cast ballot.
+        Must be called right after the tally is updated, before any other ballot is set.
+        """
+        pass
+
+    def recover_tally(self, running_tally: RunningTally) -> None:
+        """
+        Rebuild the running tally from the stored ballots.
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimate of the bytes the store keeps in memory, ballots held by the in-memory store aren't counted.
+        """
+        return 0
+
+    def end_position(self, count: int) -> int:
+        """
+        Get the position of the count-th stored ballot, 0 if count is 0.
+        Positions only grow as ballots are stored and are kept when a ballot is stored again.
+        """
+        return count
+
+    def serialized_page(
+            self,
+            after: int,
+            end: int,
+            limit: int,
+            state: Optional[BallotBoxState] = None
+        ) -> List[Tuple[int, bytes]]:
+        """
+        Read stored ballots serialized with serialize_ballot(), in the order they were stored.
+
+        Args:
+            after: position of the last ballot already read, 0 to start
+            end: position of the last ballot to read, from end_position()
+            limit: most ballots returned
+            state: only return ballots in this state
+        Returns:
+            positions and serialized ballots, up to limit and fewer only once end is reached
+        """
+        ballots = islice(enumerate(self.values(), 1), after, end)
+        return [
+            (position, serialize_ballot(ballot))
+            for position, ballot in ballots if state is None or ballot.state == state
+        ][:limit]
+
+
+def serialize_ballot(ballot: SubmittedBallot) -> bytes:
+    """
+    Serialize a ballot as stored by the ballot stores, compressed electionguard JSON.
+    """
+    return zlib.compress(ballot.to_json().encode(), 1)
+
+
+def deserialize_ballot(data: bytes) -> SubmittedBallot:
+    return SubmittedBallot.from_json(zlib.decompress(data).decode())
+
+
+def _object_id_key(object_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(object_id.encode(), digest_size=8).digest(), "little")
+
+
+class SpilledBallotStore(BallotStore):
+    """
+    Ballot store that isn't durable but keeps almost nothing in memory.
+
+    Ballots are appended, serialized and compressed, to an anonymous segment file and read back
+    when they are looked up, e.g. to be challenged. In memory each ballot is a digest of its object_id
+    in a PackedIndex plus its segment offset, length and state, 30 to 38 bytes, where electionguard's
+    dict store keeps the whole SubmittedBallot with its proofs, several KB per contest.
+    Cast ballots are added to the running tally as they are cast, so tallying never reads them back.
+    The segment is deleted when the store is closed or the process exits.
+    """
+    _segment: BinaryIO
+    _size: int
+    _index: PackedIndex
+    _offsets: array
+    _lengths: array
+    _states: array
+
+    def __init__(self, storage_dir: str):
+        """
+        Args:
+            storage_dir: directory the segment file is created in
+        """
+        super().__init__()
+        os.makedirs(storage_dir, exist_ok=True)
+        # On the data volume, a container's temp directory can be memory-backed
+        self._segment = tempfile.TemporaryFile(dir=storage_dir, prefix="ballots-", suffix=".segment")
+        self._size = 0
+        self._index = PackedIndex()
+        self._offsets = array("Q")
+        self._lengths = array("I")
+        self._states = array("H")
+
+    def _read(self, row: int) -> SubmittedBallot:
+        return deserialize_ballot(os.pread(self._segment.fileno(), self._lengths[row], self._offsets[row]))
+
+    def _find(self, key: str) -> Tuple[Optional[int], Optional[SubmittedBallot]]:
+        for row in self._index.rows(_object_id_key(key)):
+            ballot = self._read(row)
+            if ballot.object_id == key:
+                return row, ballot
+        return None, None
+
+    def close(self) -> None:
+        self._segment.close()
+
+    @property
+    def nbytes(self) -> int:
+        return self._index.nbytes + sum(len(column) * column.itemsize for column in (self._offsets, self._lengths, self._states))
+
+    def serialized_page(
+            self,
+            after: int,
+            end: int,
+            limit: int,
+            state: Optional[BallotBoxState] = None
+        ) -> List[Tuple[int, bytes]]:
+        # Positions are rows + 1, rows of other states are skipped without reading them
+        page = []
+        for row in range(after, min(end, len(self._index))):
+            if state is not None and self._states[row] != state.value:
+                continue
+            page.append((row + 1, os.pread(self._segment.fileno(), self._lengths[row], self._offsets[row])))
+            if len(page) == limit:
+                break
+        return page
+
+    # DataStore interface
+
+    def __iter__(self) -> Iterator:
+        return iter(self.items())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def all(self) -> List[SubmittedBallot]:
+        return list(self.values())
+
+    def clear(self) -> None:
+        """
+        Raises:
+            TypeError always, the store is append-only and ballots can't be removed
+        """
+        raise TypeError("The spilled ballot store is append-only, ballots can't be removed")
+
+    def pop(self, key: str) -> Optional[SubmittedBallot]:
+        """
+        Raises:
+            TypeError always, the store is append-only and ballots can't be removed
+        """
+        raise TypeError("The spilled ballot store is append-only, ballots can't be removed")
+
+    def get(self, key: str) -> Optional[SubmittedBallot]:
+        _, ballot = self._find(key)
+        return ballot
+
+    def set(self, key: str, value: SubmittedBallot) -> None:
+        data = serialize_ballot(value)
+        os.pwrite(self._segment.fileno(), data, self._size)
+        row, _ = self._find(key)
+        if row is None:
+            row = self._index.add(_object_id_key(key))
+            self._offsets.append(self._size)
+            self._lengths.append(len(data))
+            self._states.append(value.state.value)
+        else:
+            # A ballot stored again, e.g. with a new state, is appended and its old record left behind
+            self._offsets[row] = self._size
+            self._lengths[row] = len(data)
+            self._states[row] = value.state.value
+        self._size += len(data)
+
+    def items(self) -> Iterator[Tuple[str, SubmittedBallot]]:
+        """
+        Stream stored ballots in the order they were first stored.
+        """
+        for row in range(len(self._index)):
+            ballot = self._read(row)
+            yield ballot.object_id, ballot
+
+    def keys(self) -> Iterator[str]:
+        for key, _ in self.items():
+            yield key
+
+    def values(self) -> Iterator[SubmittedBallot]:
+        for _, ballot in self.items():
+            yield ballot
+
+
+class SqliteBallotStore(BallotStore):
+    """
+    Ballot store backed by an append-only SQLite table in WAL mode.
+
+    Ballots are written by a background thread with group commit: every ballot set while
+    a commit is in progress goes into the next transaction, so a burst of casts shares one fsync.
+    Ballots are stored as compressed electionguard JSON, looked up through the object_id index,
+    and kept in memory only until their transaction commits.
+
+    A batch that fails to commit stays queued and in memory, and is retried until it commits, so
+    the store never falls behind the running tally and hash ledgers its ballots were added to.
+    Flushes wait for the retry, up to FLUSH_TIMEOUT, and check_writable() refuses new ballots until it succeeds.
+
+    Digests of the stored object_ids are kept in a PackedIndex, so looking up a ballot that isn't
+    stored, as every submission does to reject duplicates, doesn't query the database.
+    """
+    PAGE_SIZE = 1000
+    # Most a connection's page cache holds, SQLite's default cache_size of 2000 KiB
+    CACHE_BYTES = 2000 * 1024
+    # Seconds between retries of a failed commit
+    RETRY_SECONDS = 1.0
+    # Seconds a flush follows a failed commit's retries before giving up on it
+    FLUSH_TIMEOUT = 10.0
+
+    path: str
+    _reader: sqlite3.Connection
+    _reader_lock: threading.Lock
+    _count: int
+    _ids: PackedIndex
+    _unflushed: Dict[str, SubmittedBallot]
+    _pending: List[Tuple[str, object]]
+    _pending_future: Future
+    _last_future: Optional[Future]
+    _cond: threading.Condition
+    _held: int
+    _closing: bool
+    _error: Optional[Exception]
+    _writer: threading.Thread
+
+    def __init__(self, path: str, context: CiphertextElectionContext):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            context: election context, stored ballots from a different election are moved aside
+        """
+        super().__init__()
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        context_hash = context.crypto_extended_base_hash.to_hex()
+        connection = self._connect()
+        if self._stored_context_hash(connection) not in (None, context_hash):
+            # Ballots encrypted under other keys can't be tallied with this election
+            connection.close()
+            moved_path = f"{path}.{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.rename(path + suffix, moved_path + suffix)
+            logger.warning(f"Ballot store {path} belongs to another election context, moved to {moved_path}")
+            connection = self._connect()
+        connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('context_hash', ?)", (context_hash,))
+        connection.commit()
+        self._ids = PackedIndex()
+        for (object_id, ) in connection.execute("SELECT object_id FROM ballots ORDER BY seq"):
+            self._ids.add(_object_id_key(object_id))
+        self._count = len(self._ids)
+        connection.close()
+
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._unflushed = dict()
+        self._pending = list()
+        self._pending_future = Future()
+        self._last_future = None
+        self._cond = threading.Condition()
+        self._held = 0
+        self._closing = False
+        self._error = None
+        self._writer = threading.Thread(target=self._write_loop, name=f"ballot-store-writer-{os.path.basename(path)}", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # fsync the WAL on every commit, group commit keeps that to one fsync per batch
+        connection.execute("PRAGMA synchronous=FULL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS ballots (
+                seq INTEGER PRIMARY KEY,
+                object_id TEXT NOT NULL UNIQUE,
+                state INTEGER NOT NULL,
+                ballot BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tally_checkpoints (
+                seq INTEGER PRIMARY KEY,
+                cast_count INTEGER NOT NULL,
+                tally TEXT NOT NULL
+            );
+        """)
+        return connection
+
+    @staticmethod
+    def _stored_context_hash(connection: sqlite3.Connection) -> Optional[str]:
+        row = connection.execute("SELECT value FROM meta WHERE key = 'context_hash'").fetchone()
+        return row[0] if row else None
+
+    def _enqueue(self, record: Tuple[str, object]) -> None:
+        with self._cond:
+            self._pending.append(record)
+            self._last_future = self._pending_future
+            self._cond.notify()
+
+    def _write_loop(self) -> None:
+        connection = self._connect()
+        while True:
+            with self._cond:
+                while (not self._pending or self._held) and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    break
+                records, future = self._pending, self._pending_future
+                self._pending, self._pending_future = list(), Future()
+            try:
+                self._write_batch(connection, records)
+            except Exception as e:
+                with self._cond:
+                    if self._closing:
+                        logger.exception(f"Ballot store write failed while closing, {len(records)} records not stored")
+                        future.set_exception(e)
+                        break
+                    logger.exception(f"Ballot store write failed, retrying {len(records)} records")
+                    # Retried ahead of newer records so seqs keep the order ballots were set in. The retry's
+                    # future is the last one before the failed one is resolved, so flushes move on to it.
+                    self._error = e
+                    self._pending = records + self._pending
+                    self._last_future = self._pending_future
+                    future.set_exception(e)
+                    self._cond.wait(self.RETRY_SECONDS)
+                continue
+            with self._cond:
+                self._error = None
+                for kind, value in records:
+                    if kind == "ballot" and self._unflushed.get(value.object_id) is value:
+                        del self._unflushed[value.object_id]
+            future.set_result(len(records))
+        connection.close()
+
+    @staticmethod
+    def _write_batch(connection: sqlite3.Connection, records: List[Tuple[str, object]]) -> None:
+        with connection:
+            for kind, value in records:
+                if kind == "ballot":
+                    connection.execute(
+                        "INSERT INTO ballots (object_id, state, ballot) VALUES (?, ?, ?) "
+                        "ON CONFLICT (object_id) DO UPDATE SET state = excluded.state, ballot = excluded.ballot",
+                        (value.object_id, value.state.value, serialize_ballot(value))
+                    )
+                elif kind == "device":
+                    connection.execute(
+                        "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                        (f"device:{value}", datetime.utcnow().isoformat() + "Z")
+                    )
+                else:
+                    cast_count, tally = value
+                    connection.execute(
+                        "INSERT OR REPLACE INTO tally_checkpoints (seq, cast_count, tally) "
+                        "VALUES ((SELECT COALESCE(MAX(seq), 0) FROM ballots), ?, ?)",
+                        (cast_count, tally.to_json())
+                    )
+
+    async def flush(self) -> None:
+        """
+        Wait until every ballot set so far is committed, following failed batches to their retries.
+
+        Raises:
+            BallotStoreUnavailable if they aren't committed within FLUSH_TIMEOUT seconds, they stay queued
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.FLUSH_TIMEOUT
+        future = self._last_future
+        while future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), max(deadline - loop.time(), 0))
+                return
+            except asyncio.TimeoutError:
+                error = self._error
+            except Exception as e:
+                error = e
+            if future is self._last_future or loop.time() >= deadline:
+                # Timed out, or the writer stopped without retrying
+                raise BallotStoreUnavailable(
+                        f"Ballot store {self.path} can't be written: {error}", math.ceil(self.RETRY_SECONDS)
+                    )
+            future = self._last_future
+
+    def check_writable(self) -> None:
+        with self._cond:
+            error = self._error
+        if error is not None:
+            raise BallotStoreUnavailable(f"Ballot store {self.path} can't be written: {error}", math.ceil(self.RETRY_SECONDS))
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Hold the writer back so the whole block lands in its next batch
+        with self._cond:
+            self._held += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._held -= 1
+                self._cond.notify()
+
+    def record_device(self, device_hash: str) -> None:
+        # Queued ahead of the device's ballots, so it is committed with or before the first of them
+        self._enqueue(("device", device_hash))
+
+    def checkpoint_tally(self, running_tally: RunningTally) -> None:
+        self._enqueue(("tally", (running_tally.cast_count, running_tally.snapshot())))
+
+    def recover_tally(self, running_tally: RunningTally) -> None:
+        with self._reader_lock:
+            checkpoint = self._reader.execute(
+                    "SELECT seq, cast_count, tally FROM tally_checkpoints ORDER BY seq DESC LIMIT 1"
+                ).fetchone()
+            if checkpoint is not None:
+                seq, cast_count, tally = checkpoint
+                running_tally.restore(PublishedCiphertextTally.from_json(tally), cast_count)
+            else:
+                seq = 0
+            rows = self._reader.execute(
+                    "SELECT ballot FROM ballots WHERE seq > ? AND state = ? ORDER BY seq",
+                    (seq, BallotBoxState.CAST.value)
+                ).fetchall()
+        for (data, ) in rows:
+            running_tally.append(deserialize_ballot(data))
+
+    def end_position(self, count: int) -> int:
+        # Ballots are committed in the order they are set, call flush() first so all of them have a seq
+        with self._reader_lock:
+            return self._reader.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM (SELECT seq FROM ballots ORDER BY seq LIMIT ?)",
+                    (count, )
+                ).fetchone()[0]
+
+    def serialized_page(
+            self,
+            after: int,
+            end: int,
+            limit: int,
+            state: Optional[BallotBoxState] = None
+        ) -> List[Tuple[int, bytes]]:
+        # Positions are seqs, only committed ballots are read
+        query = "SELECT seq, ballot FROM ballots WHERE seq > ? AND seq <= ?"
+        parameters = [after, end]
+        if state is not None:
+            query += " AND state = ?"
+            parameters.append(state.value)
+        with self._reader_lock:
+            rows = self._reader.execute(query + " ORDER BY seq LIMIT ?", (*parameters, limit)).fetchall()
+        return rows
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._writer.join()
+        with self._reader_lock:
+            self._reader.close()
+
+    @property
+    def nbytes(self) -> int:
+        # Ballots are only held until they are committed, the object_id index and page caches are what stays
+        return self._ids.nbytes + 2 * self.CACHE_BYTES
+
+    # DataStore interface
+
+    def __iter__(self) -> Iterator:
+        return iter(self.items())
+
+    def __len__(self) -> int:
+        return self._count
+
+    def all(self) -> List[SubmittedBallot]:
+        return list(self.values())
+
+    def clear(self) -> None:
+        """
+        Raises:
+            TypeError always, the store is append-only and ballots can't be removed
+        """
+        raise TypeError("The durable ballot store is append-only, ballots can't be removed")
+
+    def pop(self, key: str) -> Optional[SubmittedBallot]:
+        """
+        Raises:
+            TypeError always, the store is append-only and ballots can't be removed
+        """
+        raise TypeError("The durable ballot store is append-only, ballots can't be removed")
+
+    def _may_be_stored(self, key: str) -> bool:
+        # False for certain without a query, digests can collide so True has to be checked
+        return next(self._ids.rows(_object_id_key(key)), None) is not None
+
+    def get(self, key: str) -> Optional[SubmittedBallot]:
+        with self._cond:
+            ballot = self._unflushed.get(key)
+        if ballot is not None or not self._may_be_stored(key):
+            return ballot
+        with self._reader_lock:
+            row = self._reader.execute("SELECT ballot FROM ballots WHERE object_id = ?", (key, )).fetchone()
+        return deserialize_ballot(row[0]) if row else None
+
+    def set(self, key: str, value: SubmittedBallot) -> None:
+        # Ballots are only set again after a get() found them, so a new one is rarely a digest match
+        stored = self.get(key) is not None
+        with self._cond:
+            if not stored:
+                self._ids.add(_object_id_key(key))
+                self._count += 1
+            self._unflushed[key] = value
+        self._enqueue(("ballot", value))
+
+    def items(self) -> Iterator[Tuple[str, SubmittedBallot]]:
+        """
+        Stream stored ballots in the order they were stored, ballots still being committed come last.
+        """
+        with self._cond:
+            unflushed = dict(self._unflushed)
+        seq = 0
+        while True:
+            # Read in pages so the reader isn't held while the caller works through the ballots
+            with self._reader_lock:
+                rows = self._reader.execute(
+                        "SELECT seq, object_id, ballot FROM ballots WHERE seq > ? ORDER BY seq LIMIT ?",
+                        (seq, self.PAGE_SIZE)
+                    ).fetchall()
+            for seq, object_id, data in rows:
+                if object_id not in unflushed:
+                    yield object_id, deserialize_ballot(data)
+            if len(rows) < self.PAGE_SIZE:
+                break
+        yield from unflushed.items()
+
+    def keys(self) -> Iterator[str]:
+        for key, _ in self.items():
+            yield key
+
+    def values(self) -> Iterator[SubmittedBallot]:
+        for _, ballot in self.items():
+            yield ballot
+
+
+def _sqlite_path(storage_dir: str, shard: int) -> str:
+    # The first shard keeps the file an unsharded ballot box used
+    return os.path.join(storage_dir, "ballots.db" if shard == 0 else f"ballots-{shard}.db")
+
+
+def open_ballot_store(backend: str, storage_dir: str, context: CiphertextElectionContext, shard: int = 0) -> BallotStore:
+    """
+    Open the configured ballot store.
+
+    Args:
+        backend: "memory" or "sqlite"
+        storage_dir: directory stores keep their files in, the memory store only while it runs
+        context: election context the ballots belong to
+        shard: ballot box shard the store belongs to
+    Returns:
+        BallotStore for the shard's ballot box
+    Raises:
+        ValueError if the backend is unknown
+    """
+    if backend == "memory":
+        return SpilledBallotStore(storage_dir)
+    if backend == "sqlite":
+        return SqliteBallotStore(_sqlite_path(storage_dir, shard), context)
+    raise ValueError(f"Unknown ballot store backend: {backend}")
+
+
+def check_shard_count(backend: str, storage_dir: str, shards: int) -> None:
+    """
+    Make sure no stored shard would be left out of the tally.
+
+    Raises:
+        ValueError if ballots were stored in more shards than configured
+    """
+    if backend == "sqlite" and os.path.exists(_sqlite_path(storage_dir, shards)):
+        raise ValueError(f"{storage_dir} holds ballots in more than {shards} ballot box shards")
+
+
+def stored_ballot_pages(storage_dir: str, page_size: int) -> Iterator[Tuple[int, List[bytes]]]:
+    """
+    Read the ballots of every sqlite ballot box shard, in the order each shard stored them.
+    Ballots are left serialized so offline tools can deserialize them in worker processes.
+
+    Args:
+        storage_dir: directory the sqlite stores are in
+        page_size: most ballots per page
+    Returns:
+        iterator over shard numbers and pages of serialized ballots, shards in order
+    """
+    shard = 0
+    while os.path.exists(_sqlite_path(storage_dir, shard)):
+        connection = sqlite3.connect(_sqlite_path(storage_dir, shard))
+        try:
+            seq = 0
+            while True:
+                rows = connection.execute(
+                        "SELECT seq, ballot FROM ballots WHERE seq > ? ORDER BY seq LIMIT ?",
+                        (seq, page_size)
+                    ).fetchall()
+                if not rows:
+                    break
+                seq = rows[-1][0]
+                yield shard, [data for _, data in rows]
+        finally:
+            connection.close()
+        shard += 1
+
+
+def stored_device_hashes(storage_dir: str, shard: int) -> Set[str]:
+    """
+    Hashes of the encryption devices that chained a sqlite ballot box shard's ballots, one per boot.
+
+    Args:
+        storage_dir: directory the sqlite stores are in
+        shard: ballot box shard
+    Returns:
+        hex device hashes, empty if the shard has no store
+    """
+    path = _sqlite_path(storage_dir, shard)
+    if not os.path.exists(path):
+        return set()
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute("SELECT key FROM meta WHERE key LIKE 'device:%'").fetchall()
+    finally:
+        connection.close()
+    return {key[len("device:"):] for (key, ) in rows}
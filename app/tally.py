@@ -0,0 +1,112 @@
+from dataclasses import replace
+from electionguard.ballot import SubmittedBallot
+from electionguard.election import CiphertextElectionContext
+from electionguard.elgamal import elgamal_add
+from electionguard.manifest import InternalManifest
+from electionguard.tally import CiphertextTally, PublishedCiphertextTally
+from typing import List
+
+
+class RunningTally():
+    """
+    Encrypted tally that cast ballots are homomorphically added to as they are cast.
+    Getting the tally never has to revisit the ballot box.
+    """
+    tally: CiphertextTally
+    cast_count: int
+
+    def __init__(self, tally_id: str, internal_manifest: InternalManifest, context: CiphertextElectionContext):
+        self.tally = CiphertextTally(tally_id, internal_manifest, context)
+        self.cast_count = 0
+
+    def append(self, ballot: SubmittedBallot) -> bool:
+        """
+        Add a cast ballot to the tally.
+        The ballot must already have been accepted by the ballot box, so it isn't validated again.
+
+        Args:
+            ballot: cast ballot to accumulate
+        Returns:
+            True if every contest on the ballot was accumulated
+        """
+        # Check every contest before touching the totals so a bad ballot can't be half-counted
+        accumulations = []
+        for contest in ballot.contests:
+            tally_contest = self.tally.contests.get(contest.object_id)
+            if tally_contest is None:
+                return False
+            selections = {
+                selection.object_id: selection.ciphertext
+                for selection in contest.ballot_selections if not selection.is_placeholder_selection
+            }
+            if selections.keys() != tally_contest.selections.keys():
+                return False
+            accumulations.append((tally_contest, selections))
+
+        # Accumulate in process, the electionguard Scheduler would ship each selection to a process pool
+        for tally_contest, selections in accumulations:
+            for selection_id, ciphertext in selections.items():
+                tally_contest.selections[selection_id].elgamal_accumulate(ciphertext)
+        self.cast_count += 1
+        return True
+
+    def restore(self, tally: PublishedCiphertextTally, cast_count: int) -> None:
+        """
+        Replace the running totals with previously recorded ones.
+
+        Args:
+            tally: encrypted totals, as returned by snapshot()
+            cast_count: number of cast ballots the totals include
+        """
+        for contest_id, contest in tally.contests.items():
+            for selection_id, selection in contest.selections.items():
+                self.tally.contests[contest_id].selections[selection_id].ciphertext = selection.ciphertext
+        self.cast_count = cast_count
+
+    def snapshot(self) -> PublishedCiphertextTally:
+        """
+        Copy the current encrypted totals.
+        Ciphertexts are immutable, so only the contest and selection containers are copied.
+
+        Returns:
+            PublishedCiphertextTally holding the totals at the time of the call
+        """
+        contests = {
+            contest_id: replace(
+                    contest,
+                    selections={
+                        selection_id: replace(selection)
+                        for selection_id, selection in contest.selections.items()
+                    }
+                )
+            for contest_id, contest in self.tally.contests.items()
+        }
+        return PublishedCiphertextTally(self.tally.object_id, contests)
+
+
+def merge_tallies(tally_id: str, tallies: List[PublishedCiphertextTally]) -> PublishedCiphertextTally:
+    """
+    Add encrypted tallies of the same election together, selection by selection.
+
+    Args:
+        tally_id: object_id of the merged tally
+        tallies: snapshots of the running tallies to merge, at least one
+    Returns:
+        PublishedCiphertextTally encrypting the sum of the tallies
+    """
+    contests = {
+        contest_id: replace(
+                contest,
+                selections={
+                    selection_id: replace(
+                            selection,
+                            ciphertext=elgamal_add(
+                                *(tally.contests[contest_id].selections[selection_id].ciphertext for tally in tallies)
+                            )
+                        )
+                    for selection_id, selection in contest.selections.items()
+                }
+            )
+        for contest_id, contest in tallies[0].contests.items()
+    }
+    return PublishedCiphertextTally(tally_id, contests)
@@ -0,0 +1,350 @@
+"""
+Offline verification of a stored election, run with `python run.py verify` while the server is stopped.
+"""
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from electionguard.ballot import BallotBoxState, SubmittedBallot
+from electionguard.ballot_code import get_ballot_code
+from electionguard.ballot_validator import ballot_is_valid_for_election
+from electionguard.election import CiphertextElectionContext
+from electionguard.group import g_pow_p, int_to_q, mult_p
+from electionguard.key_ceremony import CeremonyDetails
+from electionguard.manifest import InternalManifest
+from electionguard.tally import PlaintextTally, PublishedCiphertextTally
+from time import perf_counter
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import os
+
+from .ceremony import load_election_keys
+from .decryption import GuardianPool
+from .manifest import load_manifest_from_file
+from .merkle import MerkleTree
+from .packed import PackedHashes
+from .store import deserialize_ballot, stored_ballot_pages, stored_device_hashes
+from .tally import RunningTally, merge_tallies
+
+
+# Most failures listed individually in the report, the counts always cover every ballot
+MAX_REPORTED_FAILURES = 1000
+
+
+@dataclass
+class VerifyConfig():
+    storage_dir: str
+    manifest_path: str
+    number_of_guardians: int
+    quorum: int
+    keys_file: str
+    received_hash_file: str
+    counted_hash_file: str
+    workers: Optional[int] = None
+    chunk_size: int = 64
+    output: str = "verification.json"
+
+
+_worker_manifest: Optional[InternalManifest] = None
+_worker_context: Optional[CiphertextElectionContext] = None
+
+
+def _init_worker(internal_manifest: InternalManifest, context: CiphertextElectionContext) -> None:
+    global _worker_manifest, _worker_context
+    _worker_manifest = internal_manifest
+    _worker_context = context
+
+
+def _check_ballot(ballot: SubmittedBallot) -> List[str]:
+    problems = []
+    if ballot.manifest_hash != _worker_context.manifest_hash:
+        problems.append("manifest hash differs from the election's")
+    if not ballot_is_valid_for_election(ballot, _worker_manifest, _worker_context):
+        problems.append("invalid proofs or encryption")
+    if ballot.crypto_hash != ballot.crypto_hash_with(ballot.manifest_hash):
+        problems.append("crypto_hash doesn't match the contests")
+    if ballot.code != get_ballot_code(ballot.code_seed, ballot.timestamp, ballot.crypto_hash):
+        problems.append("ballot code doesn't follow from its seed")
+    return problems
+
+
+def _verify_chunk(chunk: List[bytes]) -> Tuple[List[dict], PublishedCiphertextTally, int]:
+    """
+    Verify a chunk of serialized ballots in a worker process.
+
+    Returns:
+        per ballot its object_id, state, chain codes, enc_hash and problems, then the encrypted
+        sum of the chunk's cast ballots and how many were added to it
+    """
+    results = []
+    tally = RunningTally("verify-chunk", _worker_manifest, _worker_context)
+    for data in chunk:
+        try:
+            ballot = deserialize_ballot(data)
+        except Exception as e:
+            results.append({"object_id": None, "problems": [f"unreadable: {e}"]})
+            continue
+        problems = _check_ballot(ballot)
+        if ballot.state == BallotBoxState.CAST and not tally.append(ballot):
+            problems.append("contests don't match the manifest, not tallied")
+        results.append({
+            "object_id": ballot.object_id,
+            "state": ballot.state.name,
+            "code_seed": ballot.code_seed.to_hex(),
+            "code": ballot.code.to_hex(),
+            "enc_hash": ballot.crypto_hash_with(int_to_q(0)).to_hex(),
+            "problems": problems
+        })
+    return results, tally.snapshot(), tally.cast_count
+
+
+def _load_ledger(path: str, merkle: bool) -> Tuple[PackedHashes, Optional[MerkleTree]]:
+    hashes = PackedHashes()
+    tree = MerkleTree() if merkle else None
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                ballot_hash = line.rstrip("\n")
+                if ballot_hash and hashes.position(ballot_hash) is None:
+                    hashes.append(ballot_hash)
+                    if tree is not None:
+                        tree.append(ballot_hash.encode())
+    return hashes, tree
+
+
+class _Ledger():
+    # A hash ledger with which of its entries belong to a stored cast ballot
+    hashes: PackedHashes
+    tree: Optional[MerkleTree]
+    matched: bytearray
+    missing: int
+
+    def __init__(self, path: str, merkle: bool = False):
+        self.hashes, self.tree = _load_ledger(path, merkle)
+        self.matched = bytearray(len(self.hashes))
+        self.missing = 0
+
+    def match(self, ballot_hash: str) -> bool:
+        position = self.hashes.position(ballot_hash)
+        if position is None:
+            self.missing += 1
+            return False
+        self.matched[position] = 1
+        return True
+
+    def report(self) -> dict:
+        report = {
+            "entries": len(self.hashes),
+            "missing_cast_ballots": self.missing,
+            "entries_without_cast_ballot": len(self.matched) - sum(self.matched)
+        }
+        if self.tree is not None:
+            report["tree_size"] = len(self.tree)
+            report["root_hash"] = self.tree.root().hex()
+        return report
+
+
+def _verify_tally(tally: PlaintextTally, public_keys: Dict[str, object], context: CiphertextElectionContext) -> dict:
+    # Every guardian share needs a valid Chaum-Pedersen proof and the shares must combine to g^tally
+    invalid_shares = 0
+    invalid_decryptions = 0
+    selections = 0
+    contests = dict()
+    for contest_id, contest in tally.contests.items():
+        contests[contest_id] = dict()
+        for selection_id, selection in contest.selections.items():
+            selections += 1
+            contests[contest_id][selection_id] = selection.tally
+            for share in selection.shares:
+                if not share.is_valid(selection.message, public_keys[share.guardian_id], context.crypto_extended_base_hash):
+                    invalid_shares += 1
+            combined = mult_p(selection.value, *(share.share for share in selection.shares))
+            if combined != selection.message.data or g_pow_p(int_to_q(selection.tally)) != selection.value:
+                invalid_decryptions += 1
+    return {
+        "selections": selections,
+        "invalid_share_proofs": invalid_shares,
+        "invalid_decryptions": invalid_decryptions,
+        "contests": contests
+    }
+
+
+def run_verification(config: VerifyConfig) -> dict:
+    """
+    Verify every stored ballot, the hash ledgers, the ballot chains and the tally decryption.
+
+    Ballots are streamed from the ballot stores in chunks of chunk_size, and at most two chunks per
+    worker are in flight, so memory doesn't grow with the ballot box beyond the packed ledgers. Each
+    worker checks its ballots' Chaum-Pedersen proofs, crypto_hash and ballot code and adds cast
+    ballots to a partial encrypted tally. Chain links are checked in store order: every ballot's
+    code seed must be the previous ballot's code, except where the server restarted with a new
+    encryption device, which shows up as a new chain segment. A segment may only start from a device
+    hash recorded in the store, once per device, any other break, e.g. from a removed or reordered ballot,
+    is a problem.
+    The summed tally is decrypted with the stored guardian keys and every decryption share proof is checked.
+
+    Args:
+        config: storage, election configuration, workers and report file
+    Returns:
+        the report, also written to config.output as JSON
+    Raises:
+        ValueError if the election keys haven't been stored or don't match the manifest
+    """
+    started = datetime.utcnow()
+    start = perf_counter()
+    timings = dict()
+
+    loaded = load_election_keys(
+            os.path.join(config.storage_dir, config.keys_file),
+            CeremonyDetails(config.number_of_guardians, config.quorum)
+        )
+    if loaded is None:
+        raise ValueError(f"No election keys in {config.storage_dir}, nothing has been stored")
+    guardians, _, context = loaded
+    internal_manifest = InternalManifest(load_manifest_from_file(config.manifest_path))
+    if internal_manifest.manifest_hash != context.manifest_hash:
+        raise ValueError(f"Manifest {config.manifest_path} isn't the one the election was built with")
+
+    phase_start = perf_counter()
+    received = _Ledger(os.path.join(config.storage_dir, config.received_hash_file), merkle=True)
+    counted = _Ledger(os.path.join(config.storage_dir, config.counted_hash_file))
+    timings["load_ledgers"] = perf_counter() - phase_start
+
+    counts = {"total": 0, "cast": 0, "spoiled": 0, "with_problems": 0}
+    chains: Dict[int, dict] = dict()
+    devices: Dict[int, Set[str]] = dict()
+    failures: List[dict] = list()
+    tally: Optional[PublishedCiphertextTally] = None
+    tallied = 0
+
+    def record(shard: int, results: List[dict]) -> None:
+        if shard not in chains:
+            chains[shard] = {"ballots": 0, "segments": 0, "breaks": 0, "segment_starts": [], "_last_code": None}
+            devices[shard] = stored_device_hashes(config.storage_dir, shard)
+        chain = chains[shard]
+        for result in results:
+            position = chain["ballots"]
+            chain["ballots"] += 1
+            counts["total"] += 1
+            problems = result["problems"]
+            if result["object_id"] is not None:
+                if result["code_seed"] != chain["_last_code"]:
+                    chain["segments"] += 1
+                    if len(chain["segment_starts"]) < MAX_REPORTED_FAILURES:
+                        chain["segment_starts"].append(position)
+                    if result["code_seed"] in devices[shard]:
+                        # Each boot's device starts one segment
+                        devices[shard].discard(result["code_seed"])
+                    else:
+                        chain["breaks"] += 1
+                        problems.append("code seed is neither the previous ballot's code nor a recorded encryption device")
+                chain["_last_code"] = result["code"]
+                if result["state"] == BallotBoxState.CAST.name:
+                    counts["cast"] += 1
+                    if not received.match(result["enc_hash"]):
+                        problems.append("cast ballot missing from the received hash ledger")
+                    if not counted.match(result["enc_hash"]):
+                        problems.append("cast ballot missing from the counted hash ledger")
+                else:
+                    counts["spoiled"] += 1
+            if problems:
+                counts["with_problems"] += 1
+                if len(failures) < MAX_REPORTED_FAILURES:
+                    failures.append({"shard": shard, "position": position, "object_id": result["object_id"], "problems": problems})
+
+    workers = config.workers or os.cpu_count() or 1
+    phase_start = perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(internal_manifest, context)) as executor:
+        in_flight: Deque[Tuple[int, Future]] = deque()
+
+        def collect() -> None:
+            nonlocal tally, tallied
+            shard, future = in_flight.popleft()
+            results, partial, cast_count = future.result()
+            record(shard, results)
+            tally = partial if tally is None else merge_tallies("verify-tally", [tally, partial])
+            tallied += cast_count
+
+        for shard, chunk in stored_ballot_pages(config.storage_dir, config.chunk_size):
+            if len(in_flight) >= 2 * workers:
+                collect()
+            in_flight.append((shard, executor.submit(_verify_chunk, chunk)))
+        while in_flight:
+            collect()
+    timings["verify_ballots"] = perf_counter() - phase_start
+
+    phase_start = perf_counter()
+    if tally is None:
+        tally = RunningTally("verify-tally", internal_manifest, context).snapshot()
+    with ProcessPoolExecutor(max_workers=min(workers, len(guardians))) as executor:
+        guardian_pool = GuardianPool("verify-decryption-mediator", guardians, context, executor)
+        plaintext_tally = asyncio.run(guardian_pool.decrypt_tally(tally))
+    public_keys = {guardian.id: guardian.share_election_public_key().key for guardian in guardians}
+    if plaintext_tally is not None:
+        tally_report = _verify_tally(plaintext_tally, public_keys, context)
+    else:
+        tally_report = {"error": "The tally could not be decrypted"}
+    tally_report["cast_ballots"] = tallied
+    timings["verify_tally"] = perf_counter() - phase_start
+
+    for chain in chains.values():
+        del chain["_last_code"]
+    elapsed = perf_counter() - start
+    ledgers = {"received": received.report(), "counted": counted.report()}
+    valid = (
+        counts["with_problems"] == 0
+        and all(ledger["missing_cast_ballots"] == 0 and ledger["entries_without_cast_ballot"] == 0 for ledger in ledgers.values())
+        and tally_report.get("invalid_share_proofs") == 0
+        and tally_report.get("invalid_decryptions") == 0
+        and tallied == counts["cast"]
+    )
+    report = {
+        "valid": valid,
+        "started": started.isoformat() + "Z",
+        "storage_dir": config.storage_dir,
+        "election": context.crypto_extended_base_hash.to_hex(),
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "ballots_per_second": round(counts["total"] / timings["verify_ballots"], 1) if timings["verify_ballots"] else None,
+        "timings": {phase: round(seconds, 3) for phase, seconds in timings.items()},
+        "ballots": counts,
+        "chains": {str(shard): chain for shard, chain in chains.items()},
+        "ledgers": ledgers,
+        "tally": tally_report,
+        "failures": failures
+    }
+    with open(config.output, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def format_report(report: dict) -> str:
+    """
+    Summarize a verification report for the console.
+    """
+    ballots = report["ballots"]
+    lines = [
+        f"{'VALID' if report['valid'] else 'INVALID'}: {ballots['total']} ballots "
+        f"({ballots['cast']} cast, {ballots['spoiled']} spoiled), {ballots['with_problems']} with problems",
+        f"{report['ballots_per_second']} ballots/s on {report['workers']} workers, {report['elapsed_seconds']}s in total "
+        f"({', '.join(f'{phase} {seconds}s' for phase, seconds in report['timings'].items())})"
+    ]
+    for shard, chain in report["chains"].items():
+        lines.append(f"Shard {shard}: {chain['ballots']} ballots in {chain['segments']} chain segments, {chain['breaks']} broken links")
+    for name, ledger in report["ledgers"].items():
+        lines.append(
+            f"{name} ledger: {ledger['entries']} hashes, {ledger['missing_cast_ballots']} cast ballots missing, "
+            f"{ledger['entries_without_cast_ballot']} hashes without a cast ballot"
+        )
+    tally = report["tally"]
+    if "error" in tally:
+        lines.append(f"Tally: {tally['error']}")
+    else:
+        lines.append(
+            f"Tally: {tally['cast_ballots']} ballots, {tally['selections']} selections, "
+            f"{tally['invalid_share_proofs']} invalid share proofs, {tally['invalid_decryptions']} invalid decryptions"
+        )
+    for failure in report["failures"][:10]:
+        lines.append(f"  shard {failure['shard']} #{failure['position']} {failure['object_id']}: {'; '.join(failure['problems'])}")
+    return "\n".join(lines)
@@ -0,0 +1,478 @@
+"""
+Load test and benchmark for the ballot endpoints, run with `python run.py bench`.
+
+Nothing from the app package is imported at module level: the app reads its configuration from the
+environment when it is imported, so the benchmark points MANIFEST_PATH and STORAGE_DIR at its own
+manifest and storage first.
+"""
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+
+
+# method, path, JSON body
+Request = Tuple[str, str, Optional[Any]]
+# status code, response body
+Response = Tuple[int, bytes]
+
+
+@dataclass
+class BenchConfig():
+    styles: int = 1
+    contests: int = 1
+    candidates: int = 2
+    manifest_path: Optional[str] = None
+    ballots: int = 20
+    spoil_rate: float = 0.1
+    results: int = 5
+    rounds: int = 1
+    concurrency: int = 4
+    driver: str = "inprocess"
+    workers: int = 1
+    port: int = 8123
+    storage_dir: Optional[str] = None
+    seed: int = 0
+    output: str = "bench.json"
+
+
+def generate_manifest(styles: int, contests: int, candidates: int) -> dict:
+    """
+    Generate an election manifest with contests spread round-robin over the ballot styles.
+
+    Args:
+        styles: number of ballot styles, each with its own district
+        contests: number of contests, at least one per style
+        candidates: number of candidates in each one-of-m contest
+    Returns:
+        manifest JSON structure
+    Raises:
+        ValueError if a ballot style would have no contests
+    """
+    if styles < 1 or contests < styles or candidates < 2:
+        raise ValueError("Need at least one style, one contest per style and two candidates per contest")
+    return {
+        "spec_version": "v0.95",
+        "election_scope_id": f"bench-{styles}-styles-{contests}-contests-{candidates}-candidates",
+        "type": "general",
+        "geopolitical_units": [
+            {"object_id": f"district-{i}", "name": f"District {i}", "type": "municipality"}
+            for i in range(styles)
+        ],
+        "parties": [{"object_id": "N/A"}],
+        "candidates": [
+            {"object_id": f"contest-{j}-candidate-{k}"}
+            for j in range(contests) for k in range(candidates)
+        ],
+        "contests": [
+            {
+                "@type": "CandidateContest",
+                "object_id": f"contest-{j}",
+                "name": f"Contest {j}",
+                "sequence_order": j,
+                "vote_variation": "one_of_m",
+                "electoral_district_id": f"district-{j % styles}",
+                "number_elected": 1,
+                "votes_allowed": 1,
+                "ballot_selections": [
+                    {
+                        "object_id": f"contest-{j}-candidate-{k}-selection",
+                        "sequence_order": k,
+                        "candidate_id": f"contest-{j}-candidate-{k}"
+                    }
+                    for k in range(candidates)
+                ]
+            }
+            for j in range(contests)
+        ],
+        "ballot_styles": [
+            {"object_id": f"ballot-style-{i:02}", "geopolitical_unit_ids": [f"district-{i}"]}
+            for i in range(styles)
+        ],
+        "name": {"text": [{"language": "en", "value": "Benchmark Election"}]},
+        "start_date": "2020-03-01T08:00:00-05:00",
+        "end_date": "2020-03-03T19:00:00-05:00"
+    }
+
+
+def _style_choices(manifest: dict) -> Dict[str, Dict[str, List[str]]]:
+    # Ballot style -> contest -> candidates, for marking synthetic ballots
+    candidates = {
+        contest["object_id"]: [selection["candidate_id"] for selection in contest["ballot_selections"]]
+        for contest in manifest["contests"]
+    }
+    return {
+        style["object_id"]: {
+            contest["object_id"]: candidates[contest["object_id"]]
+            for contest in manifest["contests"]
+            if contest["electoral_district_id"] in style.get("geopolitical_unit_ids", [])
+        }
+        for style in manifest["ballot_styles"]
+    }
+
+
+def _rss(pid: int) -> int:
+    # Resident set size of a process and its descendants in bytes, 0 where /proc isn't available
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next((int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:")), 0)
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, ValueError):
+        return 0
+    return rss + sum(_rss(child) for child in children)
+
+
+class InProcessDriver():
+    """
+    Calls the ASGI app directly on the benchmark's event loop, no sockets or HTTP parsing involved.
+    """
+    def __init__(self):
+        from app import app
+        self.app = app
+
+    async def start(self) -> None:
+        await self.app.router.startup()
+
+    async def stop(self) -> None:
+        await self.app.router.shutdown()
+
+    def rss(self) -> int:
+        return _rss(os.getpid())
+
+    async def session(self) -> Callable[[str, str, Optional[Any]], Awaitable[Response]]:
+        return self._request
+
+    async def _request(self, method: str, path: str, body: Optional[Any] = None) -> Response:
+        payload = json.dumps(body).encode() if body is not None else b""
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [
+                (b"host", b"bench"),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode())
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80)
+        }
+        done = asyncio.Event()
+        request_sent = False
+        status = 500
+        chunks = []
+
+        async def receive() -> dict:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            done.set()
+        return status, b"".join(chunks)
+
+
+class SocketDriver():
+    """
+    Runs `run.py runserver` in a subprocess and sends HTTP/1.1 requests over keep-alive connections.
+    """
+    def __init__(self, port: int, workers: int):
+        self.port = port
+        self.workers = workers
+        self.process: Optional[subprocess.Popen] = None
+
+    async def start(self) -> None:
+        self.process = subprocess.Popen(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py"), "runserver",
+                 "-a", "127.0.0.1", "-p", str(self.port), "-l", "warning", "-w", str(self.workers)]
+            )
+        request = await self.session()
+        # First boot runs the key ceremony, wait for the server to answer
+        for _ in range(600):
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Ballot server exited with {self.process.returncode}")
+            try:
+                status, _ = await request("GET", "/")
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            await asyncio.sleep(0.5)
+        raise TimeoutError("Ballot server didn't start")
+
+    async def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            await asyncio.get_running_loop().run_in_executor(None, self.process.wait)
+
+    def rss(self) -> int:
+        return _rss(self.process.pid) if self.process is not None else 0
+
+    async def session(self) -> Callable[[str, str, Optional[Any]], Awaitable[Response]]:
+        connection: List[Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = [None]
+
+        async def request(method: str, path: str, body: Optional[Any] = None) -> Response:
+            if connection[0] is None:
+                connection[0] = await asyncio.open_connection("127.0.0.1", self.port)
+            reader, writer = connection[0]
+            payload = json.dumps(body).encode() if body is not None else b""
+            try:
+                writer.write(
+                    f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                return await self._read_response(reader)
+            except BaseException:
+                writer.close()
+                connection[0] = None
+                raise
+
+        return request
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> Response:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            return status, b"".join(chunks)
+        return status, await reader.readexactly(int(headers.get("content-length", 0)))
+
+
+def _percentile(latencies: List[float], percent: float) -> float:
+    # Nearest rank on sorted latencies
+    if not latencies:
+        return 0.0
+    rank = max(0, min(len(latencies) - 1, int(round(percent / 100 * len(latencies) + 0.5)) - 1))
+    return latencies[rank]
+
+
+async def _run_phase(driver, requests: List[Request], concurrency: int) -> Tuple[dict, List[Optional[Response]]]:
+    """
+    Send requests with at most concurrency in flight.
+
+    Returns:
+        latency, throughput and RSS statistics, and the responses in request order (None on exceptions)
+    """
+    responses: List[Optional[Response]] = [None] * len(requests)
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+    rss_start = driver.rss()
+
+    async def worker() -> None:
+        nonlocal next_index, errors
+        request = await driver.session()
+        while next_index < len(requests):
+            index = next_index
+            next_index += 1
+            method, path, body = requests[index]
+            start = perf_counter()
+            try:
+                responses[index] = await request(method, path, body)
+                if responses[index][0] >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(requests))))))
+    elapsed = perf_counter() - start
+    rss_end = driver.rss()
+
+    latencies.sort()
+    stats = {
+        "requests": len(requests),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(requests) / elapsed, 3) if elapsed > 0 else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "rss_start_mb": round(rss_start / 2**20, 2),
+        "rss_end_mb": round(rss_end / 2**20, 2),
+        "rss_growth_mb": round((rss_end - rss_start) / 2**20, 2)
+    }
+    return stats, responses
+
+
+def _json_bodies(responses: List[Optional[Response]]) -> List[Optional[Any]]:
+    return [json.loads(response[1]) if response is not None and response[0] < 400 else None for response in responses]
+
+
+async def _run_round(driver, config: BenchConfig, choices: Dict[str, Dict[str, List[str]]], rng: random.Random) -> dict:
+    endpoints = dict()
+    styles = [rng.choice(list(choices)) for _ in range(config.ballots)]
+
+    endpoints["/ballot/info"], _ = await _run_phase(
+            driver, [("POST", "/ballot/info", {"ballot_style": style}) for style in styles], config.concurrency
+        )
+
+    mark_requests = [
+        ("POST", "/ballot/mark", {
+            "ballot_style": style,
+            "selections": {contest: rng.choice(candidates) for contest, candidates in choices[style].items()}
+        })
+        for style in styles
+    ]
+    endpoints["/ballot/mark"], responses = await _run_phase(driver, mark_requests, config.concurrency)
+    marked = [ballot for ballot in _json_bodies(responses) if ballot is not None]
+
+    actions = ["SPOIL" if rng.random() < config.spoil_rate else "CAST" for _ in marked]
+    endpoints["/ballot/submit"], responses = await _run_phase(
+            driver,
+            [("POST", "/ballot/submit", {"ballot": ballot, "action": action}) for ballot, action in zip(marked, actions)],
+            config.concurrency
+        )
+    receipts = _json_bodies(responses)
+    spoiled = [
+        receipt["verification_code"] for receipt, action in zip(receipts, actions)
+        if action == "SPOIL" and receipt is not None and "verification_code" in receipt
+    ]
+
+    endpoints["/ballot/challenge"], _ = await _run_phase(
+            driver, [("POST", "/ballot/challenge", {"verification_code": code}) for code in spoiled], config.concurrency
+        )
+    endpoints["/election/result"], _ = await _run_phase(
+            driver, [("GET", "/election/result", None)] * config.results, config.concurrency
+        )
+    return {
+        "ballots_cast": actions.count("CAST"),
+        "ballots_spoiled": len(spoiled),
+        "endpoints": endpoints
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(config: BenchConfig) -> dict:
+    """
+    Run the benchmark and write its results to config.output.
+
+    Every round marks, submits and challenges config.ballots new ballots and then requests the result,
+    so later rounds show how the endpoints hold up as the ballot box grows.
+
+    Args:
+        config: workload, manifest and driver settings
+    Returns:
+        results as written to config.output
+    Raises:
+        ValueError if the driver is unknown or the manifest settings are invalid
+    """
+    if config.driver not in ("inprocess", "socket"):
+        raise ValueError(f"Unknown benchmark driver: {config.driver}")
+
+    storage_dir = config.storage_dir or tempfile.mkdtemp(prefix="ballotserver-bench-")
+    os.makedirs(storage_dir, exist_ok=True)
+    if config.manifest_path is not None:
+        manifest_path = config.manifest_path
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    else:
+        manifest = generate_manifest(config.styles, config.contests, config.candidates)
+        manifest_path = os.path.join(storage_dir, "bench_manifest.json")
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+
+    # Must be set before the app is imported, by this process or the server subprocess
+    os.environ["MANIFEST_PATH"] = os.path.abspath(manifest_path)
+    os.environ["STORAGE_DIR"] = os.path.abspath(storage_dir)
+
+    async def bench() -> dict:
+        driver = InProcessDriver() if config.driver == "inprocess" else SocketDriver(config.port, config.workers)
+        rng = random.Random(config.seed)
+        choices = _style_choices(manifest)
+        start = perf_counter()
+        await driver.start()
+        startup_seconds = perf_counter() - start
+        try:
+            rounds = []
+            for number in range(config.rounds):
+                rounds.append(await _run_round(driver, config, choices, rng))
+                rounds[-1]["round"] = number + 1
+                rounds[-1]["ballots_total"] = sum(r["ballots_cast"] + r["ballots_spoiled"] for r in rounds)
+        finally:
+            await driver.stop()
+        return {"startup_seconds": round(startup_seconds, 3), "rounds": rounds}
+
+    measurements = asyncio.run(bench())
+    results = {
+        "started": datetime.utcnow().isoformat() + "Z",
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": asdict(config),
+        "storage_dir": storage_dir,
+        **measurements
+    }
+    with open(config.output, "w") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+def format_results(results: dict) -> str:
+    """
+    Summarize benchmark results as a table, one line per endpoint and round.
+    """
+    lines = [f"{'round':>5} {'endpoint':<18} {'reqs':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'rss +MB':>8}"]
+    for round_results in results["rounds"]:
+        for endpoint, stats in round_results["endpoints"].items():
+            lines.append(
+                f"{round_results['round']:>5} {endpoint:<18} {stats['requests']:>5} {stats['errors']:>4} "
+                f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} "
+                f"{stats['throughput_rps'] or 0:>8.2f} {stats['rss_growth_mb']:>8.2f}"
+            )
+    return "\n".join(lines)
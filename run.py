@@ -1,18 +1,56 @@
-from logging import log
-from app import app
+from multiprocessing import get_context
 from uvicorn import run
+import logging
+import os
 
 
-def runserver(host_address: str="0.0.0.0", port: int=8000, log_level: str="info"):
+def _configure_logging(log_level: str):
+    # Send the app's own log messages (startup timings, store warnings) to the console
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(log_level.upper())
+    app_logger.addHandler(logging.StreamHandler())
+
+
+def _run_coordinator(socket_path: str, log_level: str):
+    from app.ballotserver import run_coordinator
+
+    _configure_logging(log_level)
+    run_coordinator(socket_path)
+
+
+def runserver(host_address: str="0.0.0.0", port: int=8000, log_level: str="info", workers: int=1):
     """
     Run the ballotserver API.
 
     Args:
         host_address: address to bind to
         port: port number to bind to
-        debug: toggle debug mode
+        log_level: logging level of the app and uvicorn
+        workers: number of HTTP worker processes, more than one starts an election coordinator process
     """
-    run(app, host=host_address, port=port, log_level=log_level, lifespan="on")
+    from app import app
+
+    _configure_logging(log_level)
+    if workers <= 1:
+        run(app, host=host_address, port=port, log_level=log_level, lifespan="on")
+        return
+
+    from app.config import COORDINATOR_SOCKET
+
+    # One coordinator owns the keys, ballot store and tally, the workers serve HTTP and encrypt.
+    # Spawned before the role is set so it runs the full election.
+    coordinator = get_context("spawn").Process(
+            target=_run_coordinator,
+            args=(COORDINATOR_SOCKET, log_level),
+            name="election-coordinator"
+        )
+    coordinator.start()
+    os.environ["BALLOTSERVER_ROLE"] = "worker"
+    try:
+        run("app:app", host=host_address, port=port, log_level=log_level, lifespan="on", workers=workers)
+    finally:
+        coordinator.terminate()
+        coordinator.join()
 
 
 if __name__ == "__main__":
@@ -25,8 +63,81 @@ if __name__ == "__main__":
     runserver_parser.add_argument("-l", "--log-level", type=str, default="info", help="Run app at specified logging level")
     runserver_parser.add_argument("-a", "--addr", type=str, default="0.0.0.0", help="Host to bind app to")
     runserver_parser.add_argument("-p", "--port", type=int, default=8000, help="Port to bind app to")
+    runserver_parser.add_argument("-w", "--workers", type=int, default=1, help="Number of HTTP worker processes")
+
+    bench_parser = subparsers.add_parser("bench", help="Load test the ballot endpoints")
+    bench_parser.add_argument("--styles", type=int, default=1, help="Ballot styles in the synthetic manifest")
+    bench_parser.add_argument("--contests", type=int, default=1, help="Contests in the synthetic manifest")
+    bench_parser.add_argument("--candidates", type=int, default=2, help="Candidates per contest in the synthetic manifest")
+    bench_parser.add_argument("--manifest", type=str, default=None, help="Use this manifest instead of a synthetic one")
+    bench_parser.add_argument("--ballots", type=int, default=20, help="Ballots marked and submitted per round")
+    bench_parser.add_argument("--spoil-rate", type=float, default=0.1, help="Fraction of ballots spoiled and challenged")
+    bench_parser.add_argument("--results", type=int, default=5, help="Result requests per round")
+    bench_parser.add_argument("--rounds", type=int, default=1, help="Number of rounds, the ballot box keeps growing")
+    bench_parser.add_argument("-c", "--concurrency", type=int, default=4, help="Requests in flight")
+    bench_parser.add_argument("--driver", choices=("inprocess", "socket"), default="inprocess", help="Call the app directly or over HTTP")
+    bench_parser.add_argument("-w", "--workers", type=int, default=1, help="HTTP worker processes for the socket driver")
+    bench_parser.add_argument("-p", "--port", type=int, default=8123, help="Port for the socket driver")
+    bench_parser.add_argument("--storage-dir", type=str, default=None, help="Election storage, a fresh temporary directory by default")
+    bench_parser.add_argument("--seed", type=int, default=0, help="Seed for ballot styles, selections and spoils")
+    bench_parser.add_argument("-o", "--output", type=str, default="bench.json", help="File to write the JSON results to")
+
+    verify_parser = subparsers.add_parser("verify", help="Verify the stored ballots, hash ledgers and tally")
+    verify_parser.add_argument("-e", "--election", type=str, default="default", help="Election to verify, a directory under ELECTIONS_DIR or the default election")
+    verify_parser.add_argument("-w", "--workers", type=int, default=None, help="Verification processes, one per core by default")
+    verify_parser.add_argument("--chunk-size", type=int, default=64, help="Ballots per chunk sent to a verification process")
+    verify_parser.add_argument("-o", "--output", type=str, default="verification.json", help="File to write the JSON report to")
 
     args = parser.parse_args()
 
     if args.action == "runserver":
-        runserver(host_address=args.addr, port=args.port, log_level=args.log_level)
+        runserver(host_address=args.addr, port=args.port, log_level=args.log_level, workers=args.workers)
+    elif args.action == "bench":
+        from bench import BenchConfig, format_results, run_benchmark
+
+        results = run_benchmark(BenchConfig(
+            styles=args.styles,
+            contests=args.contests,
+            candidates=args.candidates,
+            manifest_path=args.manifest,
+            ballots=args.ballots,
+            spoil_rate=args.spoil_rate,
+            results=args.results,
+            rounds=args.rounds,
+            concurrency=args.concurrency,
+            driver=args.driver,
+            workers=args.workers,
+            port=args.port,
+            storage_dir=args.storage_dir,
+            seed=args.seed,
+            output=args.output
+        ))
+        print(format_results(results))
+        print(f"Results written to {args.output}")
+    elif args.action == "verify":
+        from app.config import (
+            COUNTED_HASH_FILE,
+            ELECTION_KEYS_FILE,
+            NUM_GUARDIANS,
+            QUORUM,
+            RECEIVED_HASH_FILE
+        )
+        from app.registry import election_paths
+        from app.verifier import VerifyConfig, format_report, run_verification
+
+        manifest_path, storage_dir = election_paths(args.election)
+        report = run_verification(VerifyConfig(
+            storage_dir=storage_dir,
+            manifest_path=manifest_path,
+            number_of_guardians=NUM_GUARDIANS,
+            quorum=QUORUM,
+            keys_file=ELECTION_KEYS_FILE,
+            received_hash_file=RECEIVED_HASH_FILE,
+            counted_hash_file=COUNTED_HASH_FILE,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            output=args.output
+        ))
+        print(format_report(report))
+        print(f"Report written to {args.output}")
+        raise SystemExit(0 if report["valid"] else 1)
@@ -0,0 +1,13 @@
+import pytest
+
+from support import SampleElection, make_election
+
+
+@pytest.fixture(scope="session")
+def election() -> SampleElection:
+    return make_election()
+
+
+@pytest.fixture(scope="session")
+def multi_seat_election() -> SampleElection:
+    return make_election(contests=1, candidates=4, number_elected=2)
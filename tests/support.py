@@ -0,0 +1,53 @@
+"""
+Elections and ballots shared by the tests.
+"""
+from electionguard.ballot import PlaintextBallot, PlaintextBallotContest
+from electionguard.election import CiphertextElectionContext
+from electionguard.election_builder import ElectionBuilder
+from electionguard.elgamal import ElGamalKeyPair, elgamal_keypair_random
+from electionguard.encrypt import selection_from
+from electionguard.group import ONE_MOD_Q
+from electionguard.manifest import InternalManifest, Manifest
+from typing import Dict, List, NamedTuple
+
+from bench import generate_manifest
+
+
+class SampleElection(NamedTuple):
+    internal_manifest: InternalManifest
+    context: CiphertextElectionContext
+    keypair: ElGamalKeyPair
+
+
+def make_election(contests: int = 2, candidates: int = 3, number_elected: int = 1) -> SampleElection:
+    """
+    Build a single-style election with a random joint key whose secret the tests hold.
+    """
+    manifest = generate_manifest(1, contests, candidates)
+    if number_elected > 1:
+        for contest in manifest["contests"]:
+            contest.update(vote_variation="n_of_m", number_elected=number_elected, votes_allowed=number_elected)
+    keypair = elgamal_keypair_random()
+    builder = ElectionBuilder(1, 1, Manifest.from_json_object(manifest))
+    builder.set_public_key(keypair.public_key)
+    builder.set_commitment_hash(ONE_MOD_Q)
+    internal_manifest, context = builder.build()
+    return SampleElection(internal_manifest, context, keypair)
+
+
+def make_ballot(election: SampleElection, object_id: str, votes: Dict[str, List[int]]) -> PlaintextBallot:
+    """
+    Mark a ballot of the election's style.
+
+    Args:
+        votes: contest id -> indexes of the selections voted for, contests left out are undervoted
+    """
+    style = election.internal_manifest.ballot_styles[0]
+    contests = [
+        PlaintextBallotContest(description.object_id, [
+            selection_from(selection, is_affirmative=index in votes.get(description.object_id, []))
+            for index, selection in enumerate(description.ballot_selections)
+        ])
+        for description in election.internal_manifest.get_contests_for(style.object_id)
+    ]
+    return PlaintextBallot(object_id, style.object_id, contests)
@@ -0,0 +1,111 @@
+from typing import List
+import hashlib
+import pytest
+
+from app.merkle import MerkleTree, verify_consistency, verify_inclusion
+
+
+# Sizes 0..N cover every shape of tree up to two full levels past a power of two
+N = 33
+LEAVES = [f"{i:064X}".encode() for i in range(N)]
+
+
+# Reference implementation, RFC 6962 section 2.1 written out literally
+
+def _k(n: int) -> int:
+    # Largest power of two smaller than n
+    k = 1
+    while k * 2 < n:
+        k *= 2
+    return k
+
+
+def reference_root(leaves: List[bytes]) -> bytes:
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    if len(leaves) == 1:
+        return hashlib.sha256(b"\x00" + leaves[0]).digest()
+    k = _k(len(leaves))
+    return hashlib.sha256(b"\x01" + reference_root(leaves[:k]) + reference_root(leaves[k:])).digest()
+
+
+def reference_path(m: int, leaves: List[bytes]) -> List[bytes]:
+    if len(leaves) == 1:
+        return []
+    k = _k(len(leaves))
+    if m < k:
+        return reference_path(m, leaves[:k]) + [reference_root(leaves[k:])]
+    return reference_path(m - k, leaves[k:]) + [reference_root(leaves[:k])]
+
+
+def reference_consistency(m: int, leaves: List[bytes], complete: bool = True) -> List[bytes]:
+    n = len(leaves)
+    if m == n:
+        return [] if complete else [reference_root(leaves)]
+    k = _k(n)
+    if m <= k:
+        return reference_consistency(m, leaves[:k], complete) + [reference_root(leaves[k:])]
+    return reference_consistency(m - k, leaves[k:], False) + [reference_root(leaves[:k])]
+
+
+def _flip(proof: List[bytes], position: int) -> List[bytes]:
+    node = bytearray(proof[position])
+    node[0] ^= 1
+    return proof[:position] + [bytes(node)] + proof[position + 1:]
+
+
+@pytest.fixture(scope="module")
+def tree() -> MerkleTree:
+    tree = MerkleTree()
+    for leaf in LEAVES:
+        tree.append(leaf)
+    return tree
+
+
+@pytest.mark.parametrize("size", range(N + 1))
+def test_roots_match_reference(tree, size):
+    # Earlier sizes come from the full tree, as tree heads of a grown ledger do
+    assert tree.root(size) == reference_root(LEAVES[:size])
+
+
+@pytest.mark.parametrize("size", range(1, N + 1))
+def test_inclusion_proofs(tree, size):
+    root = tree.root(size)
+    for index in range(size):
+        path = tree.inclusion_proof(index, size)
+        assert path == reference_path(index, LEAVES[:size])
+        assert verify_inclusion(LEAVES[index], index, size, path, root)
+
+        assert not verify_inclusion(LEAVES[index] + b"0", index, size, path, root)
+        if size > 1:
+            assert not verify_inclusion(LEAVES[index], (index + 1) % size, size, path, root)
+            assert not verify_inclusion(LEAVES[index], index, size, path[:-1], root)
+            assert not verify_inclusion(LEAVES[index], index, size, path + [root], root)
+        for position in range(len(path)):
+            assert not verify_inclusion(LEAVES[index], index, size, _flip(path, position), root)
+
+
+@pytest.mark.parametrize("second", range(1, N + 1))
+def test_consistency_proofs(tree, second):
+    second_root = tree.root(second)
+    for first in range(1, second + 1):
+        first_root = tree.root(first)
+        proof = tree.consistency_proof(first, second)
+        assert proof == reference_consistency(first, LEAVES[:second])
+        assert verify_consistency(first, second, proof, first_root, second_root)
+
+        if first < second:
+            assert not verify_consistency(first, second, proof, second_root, second_root)
+            assert not verify_consistency(first, second, proof[:-1], first_root, second_root)
+            for position in range(len(proof)):
+                assert not verify_consistency(first, second, _flip(proof, position), first_root, second_root)
+
+
+def test_sizes_out_of_range(tree):
+    with pytest.raises(ValueError):
+        tree.root(N + 1)
+    with pytest.raises(ValueError):
+        tree.inclusion_proof(N, N)
+    with pytest.raises(ValueError):
+        tree.consistency_proof(0, N)
+    assert not verify_inclusion(LEAVES[0], 0, 0, [], tree.root(0))
@@ -0,0 +1,89 @@
+from dataclasses import replace
+from electionguard.ballot_validator import ballot_is_valid_for_election
+from electionguard.group import add_q, ONE_MOD_Q
+import pytest
+
+from app.precompute import PadPool, check_pad_encryption, compute_pads, encrypt_with_pads, pads_per_style
+from support import SampleElection, make_ballot
+
+
+def _encrypt(election: SampleElection, ballot):
+    count = pads_per_style(election.internal_manifest)[ballot.style_id]
+    return encrypt_with_pads(
+            ballot, election.internal_manifest, election.context, compute_pads(election.context.elgamal_public_key, count)
+        )
+
+
+def _decrypted_votes(election: SampleElection, encrypted) -> dict:
+    # Decrypted with the election secret, placeholders included, in encryption order
+    return {
+        contest.object_id: [
+            selection.ciphertext.decrypt(election.keypair.secret_key) for selection in contest.ballot_selections
+        ]
+        for contest in encrypted.contests
+    }
+
+
+@pytest.mark.parametrize("votes", [{}, {"contest-0": [0]}, {"contest-0": [2], "contest-1": [1]}])
+def test_single_seat_votes_verify_and_decrypt(election, votes):
+    encrypted = _encrypt(election, make_ballot(election, "ballot-1", votes))
+
+    assert encrypted is not None
+    assert ballot_is_valid_for_election(encrypted, election.internal_manifest, election.context)
+    for contest_id, decrypted in _decrypted_votes(election, encrypted).items():
+        expected = [1 if index in votes.get(contest_id, []) else 0 for index in range(3)]
+        # The single placeholder carries the undervote
+        assert decrypted == expected + [1 - sum(expected)]
+
+
+@pytest.mark.parametrize("votes, placeholders", [([], [1, 1]), ([3], [1, 0]), ([0, 2], [0, 0])])
+def test_placeholders_fill_the_undervote(multi_seat_election, votes, placeholders):
+    encrypted = _encrypt(multi_seat_election, make_ballot(multi_seat_election, "ballot-1", {"contest-0": votes}))
+
+    assert ballot_is_valid_for_election(encrypted, multi_seat_election.internal_manifest, multi_seat_election.context)
+    expected = [1 if index in votes else 0 for index in range(4)]
+    assert _decrypted_votes(multi_seat_election, encrypted)["contest-0"] == expected + placeholders
+
+
+def test_ballot_takes_exactly_its_styles_pads(election):
+    ballot = make_ballot(election, "ballot-1", {"contest-0": [1]})
+    count = pads_per_style(election.internal_manifest)[ballot.style_id]
+    pads = compute_pads(election.context.elgamal_public_key, count - 1)
+
+    with pytest.raises(StopIteration):
+        encrypt_with_pads(ballot, election.internal_manifest, election.context, pads)
+
+
+def test_overvote_is_not_encrypted(election):
+    ballot = make_ballot(election, "ballot-1", {"contest-0": [0, 1]})
+
+    assert _encrypt(election, ballot) is None
+
+
+def test_tampered_proof_is_rejected(election):
+    encrypted = _encrypt(election, make_ballot(election, "ballot-1", {"contest-0": [0]}))
+    contest = encrypted.contests[0]
+    selection = contest.ballot_selections[0]
+    proof = replace(selection.proof, proof_zero_response=add_q(selection.proof.proof_zero_response, ONE_MOD_Q))
+    tampered = replace(
+            encrypted,
+            contests=[replace(contest, ballot_selections=[replace(selection, proof=proof), *contest.ballot_selections[1:]])]
+                + encrypted.contests[1:]
+        )
+
+    assert not ballot_is_valid_for_election(tampered, election.internal_manifest, election.context)
+
+
+def test_check_pad_encryption_passes(election, multi_seat_election):
+    assert check_pad_encryption(election.internal_manifest, election.context) is None
+    assert check_pad_encryption(multi_seat_election.internal_manifest, multi_seat_election.context) is None
+
+
+def test_pad_pool_takes_all_or_none():
+    pool = PadPool(3)
+    pool.add([(ONE_MOD_Q, None, None)] * 5)
+
+    assert len(pool) == 3
+    assert pool.take(4) is None
+    assert len(pool.take(2)) == 2
+    assert (pool.hits, pool.misses, pool.missing) == (1, 1, 2)
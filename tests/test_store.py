@@ -0,0 +1,188 @@
+from electionguard.ballot import BallotBoxState, SubmittedBallot, from_ciphertext_ballot
+from typing import Dict, List
+import asyncio
+import pytest
+import time
+
+from app.precompute import compute_pads, encrypt_with_pads, pads_per_style
+from app.store import BallotStoreUnavailable, SqliteBallotStore, stored_device_hashes
+from app.tally import RunningTally
+from support import SampleElection, make_ballot
+
+
+# Selection voted for on the ballots, by ballot number, cycling through contest-0's candidates
+def _votes(number: int) -> Dict[str, List[int]]:
+    return {"contest-0": [number % 3]}
+
+
+@pytest.fixture(scope="module")
+def ballots(election) -> List[SubmittedBallot]:
+    # Every other ballot is spoiled
+    count = pads_per_style(election.internal_manifest)[election.internal_manifest.ballot_styles[0].object_id]
+    submitted = []
+    for number in range(6):
+        encrypted = encrypt_with_pads(
+                make_ballot(election, f"ballot-{number}", _votes(number)),
+                election.internal_manifest,
+                election.context,
+                compute_pads(election.context.elgamal_public_key, count)
+            )
+        state = BallotBoxState.CAST if number % 2 == 0 else BallotBoxState.SPOILED
+        submitted.append(from_ciphertext_ballot(encrypted, state))
+    return submitted
+
+
+@pytest.fixture
+def store_path(tmp_path) -> str:
+    return str(tmp_path / "ballots.db")
+
+
+def _open(store_path: str, election: SampleElection) -> SqliteBallotStore:
+    return SqliteBallotStore(store_path, election.context)
+
+
+def _submit(store: SqliteBallotStore, running_tally: RunningTally, ballots: List[SubmittedBallot]) -> None:
+    with store.transaction():
+        for ballot in ballots:
+            if ballot.state == BallotBoxState.CAST:
+                running_tally.append(ballot)
+            store.set(ballot.object_id, ballot)
+
+
+def _decrypted_totals(election: SampleElection, running_tally: RunningTally) -> Dict[str, int]:
+    return {
+        selection_id: selection.ciphertext.decrypt(election.keypair.secret_key)
+        for contest in running_tally.snapshot().contests.values()
+        for selection_id, selection in contest.selections.items()
+    }
+
+
+def _fail_writes(monkeypatch, failures: List[int]) -> None:
+    # The next failures[0] batches fail to commit
+    write_batch = SqliteBallotStore._write_batch
+
+    def failing_write_batch(connection, records):
+        if failures[0] > 0:
+            failures[0] -= 1
+            # Fail only after the caller's flush is waiting for this batch
+            time.sleep(0.05)
+            raise OSError("injected commit failure")
+        write_batch(connection, records)
+
+    monkeypatch.setattr(SqliteBallotStore, "_write_batch", staticmethod(failing_write_batch))
+    monkeypatch.setattr(SqliteBallotStore, "RETRY_SECONDS", 0.05)
+
+
+def test_reopen_keeps_ballots_in_order(election, ballots, store_path):
+    store = _open(store_path, election)
+    _submit(store, RunningTally("tally", election.internal_manifest, election.context), ballots)
+    asyncio.run(store.flush())
+    store.close()
+
+    store = _open(store_path, election)
+    try:
+        assert len(store) == len(ballots)
+        assert list(store.keys()) == [ballot.object_id for ballot in ballots]
+        for ballot in ballots:
+            stored = store.get(ballot.object_id)
+            assert (stored.crypto_hash, stored.code, stored.state) == (ballot.crypto_hash, ballot.code, ballot.state)
+        assert store.get("ballot-missing") is None
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("checkpoint_after", [None, 0, 3, 6])
+def test_recover_tally(election, ballots, store_path, checkpoint_after):
+    running_tally = RunningTally("tally", election.internal_manifest, election.context)
+    store = _open(store_path, election)
+    for number, ballot in enumerate(ballots):
+        _submit(store, running_tally, [ballot])
+        if checkpoint_after == number:
+            store.checkpoint_tally(running_tally)
+    if checkpoint_after == len(ballots):
+        store.checkpoint_tally(running_tally)
+    asyncio.run(store.flush())
+    store.close()
+
+    recovered = RunningTally("tally", election.internal_manifest, election.context)
+    store = _open(store_path, election)
+    try:
+        store.recover_tally(recovered)
+    finally:
+        store.close()
+    assert recovered.cast_count == running_tally.cast_count == 3
+    totals = _decrypted_totals(election, recovered)
+    assert totals == _decrypted_totals(election, running_tally)
+    # Cast ballots 0, 2 and 4 voted for candidates 0, 2 and 1
+    assert [totals[f"contest-0-candidate-{k}-selection"] for k in range(3)] == [1, 1, 1]
+
+
+def test_failed_commit_is_retried(election, ballots, store_path, monkeypatch):
+    failures = [1]
+    _fail_writes(monkeypatch, failures)
+    store = _open(store_path, election)
+    _submit(store, RunningTally("tally", election.internal_manifest, election.context), ballots[:3])
+    # The flush follows the failed batch to its retry instead of failing
+    asyncio.run(store.flush())
+    assert failures == [0]
+    store.check_writable()
+    _submit(store, RunningTally("tally", election.internal_manifest, election.context), ballots[3:])
+    asyncio.run(store.flush())
+    store.close()
+
+    store = _open(store_path, election)
+    try:
+        assert list(store.keys()) == [ballot.object_id for ballot in ballots]
+    finally:
+        store.close()
+
+
+def test_flush_gives_up_while_commits_keep_failing(election, ballots, store_path, monkeypatch):
+    failures = [1000]
+    _fail_writes(monkeypatch, failures)
+    monkeypatch.setattr(SqliteBallotStore, "FLUSH_TIMEOUT", 0.2)
+    store = _open(store_path, election)
+    try:
+        _submit(store, RunningTally("tally", election.internal_manifest, election.context), ballots[:2])
+        with pytest.raises(BallotStoreUnavailable):
+            asyncio.run(store.flush())
+        with pytest.raises(BallotStoreUnavailable):
+            store.check_writable()
+        # Queued ballots are still served while they wait for the retry
+        assert store.get(ballots[0].object_id) is not None
+        assert len(store) == 2
+
+        failures[0] = 0
+        asyncio.run(store.flush())
+        store.check_writable()
+    finally:
+        store.close()
+
+    store = _open(store_path, election)
+    try:
+        assert list(store.keys()) == [ballot.object_id for ballot in ballots[:2]]
+    finally:
+        store.close()
+
+
+def test_device_hashes_are_recorded(election, store_path, tmp_path):
+    store = _open(store_path, election)
+    store.record_device("AA")
+    store.record_device("BB")
+    asyncio.run(store.flush())
+    store.close()
+
+    assert stored_device_hashes(str(tmp_path), 0) == {"AA", "BB"}
+    assert stored_device_hashes(str(tmp_path), 1) == set()
+
+
+def test_ballots_cant_be_removed(election, ballots, store_path):
+    store = _open(store_path, election)
+    try:
+        store.set(ballots[0].object_id, ballots[0])
+        with pytest.raises(TypeError):
+            store.pop(ballots[0].object_id)
+        with pytest.raises(TypeError):
+            store.clear()
+    finally:
+        store.close()